@@ -15,6 +15,9 @@ from core.database_service import DatabaseService
 from core.gpt_service import GptService
 from core.telegram_service import TelegramService
 from core.signal_processor import SignalProcessor
+from utils.settings_store import SettingsStore
+from utils.account_snapshot import AccountSnapshotPoller
+from core.prop_guard import PropRiskGuard
 # MT5 and TradeManager are disabled on non-Windows platforms
 try:
     from core.mt5_service import MT5Service
@@ -71,6 +74,9 @@ class NavButton(QPushButton):
         self.icon_label.setPixmap(qta.icon(self.icon_name, color=icon_color).pixmap(QSize(20, 20)))
         
 class AppWindow(QMainWindow):
+    # Emitted from the snapshot poller thread; Qt queues it onto the GUI thread
+    snapshot_updated = Signal(dict)
+
     def __init__(self):
         super().__init__()
         self.setObjectName("AppWindow")
@@ -96,7 +102,12 @@ class AppWindow(QMainWindow):
         self._on_nav_button_clicked(0) # Ensure first page is loaded and icon is colored
 
     def _load_configs(self):
-        self.settings = self._load_config("data/config.json")
+        # Shared in-process cache of data/config.json: reads from memory, atomic write-through
+        self.settings_store = SettingsStore.shared_json("data/config.json")
+        if self.settings_store.load_error:
+            QMessageBox.critical(self, "Config Error", f"Failed to load data/config.json: {self.settings_store.load_error}")
+        self.settings = self.settings_store.get_all()
+        self.settings_store.subscribe(self._on_settings_changed)
         self.channels = self._load_config("data/channels.json", is_channels=True)
 
     def _setup_ui(self):
@@ -164,6 +175,7 @@ class AppWindow(QMainWindow):
         self.start_button.clicked.connect(self.toggle_bot_state)
         self.settings_view.save_button.clicked.connect(self.save_settings)
         self.history_view.refresh_button.clicked.connect(self.refresh_history_tab)
+        self.snapshot_updated.connect(self._on_snapshot_updated)
         
         # Connect SmartMoney view buttons
         self.smartmoney_view.start_button.clicked.connect(self.start_sm_bot)
@@ -194,7 +206,7 @@ class AppWindow(QMainWindow):
             self._initialize_and_start_services()
             
     def _initialize_and_start_services(self):
-        self.settings = self._load_config("data/config.json")
+        self.settings = self.settings_store.get_all()
         db = DatabaseService()
         self.backend_services['db'] = db
         # self.dashboard_view.update_status('database', True)
@@ -209,9 +221,12 @@ class AppWindow(QMainWindow):
             success, msg = mt5.initialize()
             # self.dashboard_view.update_status('mt5', success)
             if success:
-                account_info = mt5.get_account_info()
-                if account_info:
-                    self.mt5_view.update_account_info(account_info)
+                # One poller per account: the MT5 view and services read its in-memory snapshot
+                snapshot = AccountSnapshotPoller(mt5.get_positions, mt5.get_account_info)
+                snapshot.subscribe(self.snapshot_updated.emit)
+                snapshot.start()
+                self.backend_services['snapshot'] = snapshot
+                self._start_risk_guard(mt5, snapshot)
             else:
                 self.mt5_view.add_log_message(f"MT5 Connection Failed: {msg}", "ERROR")
             self.backend_services['mt5'] = mt5
@@ -233,7 +248,8 @@ class AppWindow(QMainWindow):
         self.backend_services['tg_thread'] = tg_thread
 
         if not IS_MACOS and TradeManagerService:
-            manager = TradeManagerService(db, self.backend_services['mt5'], self.settings)
+            # Closed positions from the snapshot poller trigger the breakeven check immediately
+            manager = TradeManagerService(db, self.backend_services['mt5'], self.settings, snapshot=self.backend_services.get('snapshot'))
             manager.log_signal.connect(self.mt5_view.add_log_message)
             manager_thread = QThread(); manager.moveToThread(manager_thread); manager_thread.started.connect(manager.start_monitoring); manager_thread.start()
             self.backend_services['manager'] = manager
@@ -244,6 +260,25 @@ class AppWindow(QMainWindow):
         print("Services Initialized.")
         if not self.all_dialogs: tg.fetch_dialogs()
 
+    def _start_risk_guard(self, mt5, snapshot):
+        # Equity follows the snapshot; place_order vetoes from the cached verdict without a terminal call
+        guard_cfg = self.settings.get('prop_guard', {})
+        if not guard_cfg.get('enabled', False):
+            return
+        if not guard_cfg.get('initial_balance'):
+            # The total floor is measured from the challenge's starting balance, not the balance at this restart
+            self.mt5_view.add_log_message("Prop guard disabled: set prop_guard.initial_balance", "ERROR")
+            return
+        account = mt5.get_account_info() or {}
+        guard = PropRiskGuard.from_settings(self.settings, balance=guard_cfg['initial_balance'])
+        flatten = None
+        if guard_cfg.get('flatten_on_breach', False):
+            flatten = lambda: mt5.close_many([p['ticket'] for p in snapshot.get_positions()])
+        guard.attach(snapshot, flatten)
+        if account: guard.on_snapshot({'account': account})
+        mt5.set_risk_guard(guard)
+        self.backend_services['risk_guard'] = guard
+
     def _stop_services(self):
         self.stop_sm_bot() # Also stop SM bot if main bot is stopped
         for name, service in self.backend_services.items():
@@ -259,14 +294,29 @@ class AppWindow(QMainWindow):
         # for s in ['database', 'parser', 'mt5', 'telegram', 'smartmoney']: self.dashboard_view.update_status(s, False)
         print("All services stopped.")
 
+    @Slot(dict)
+    def _on_snapshot_updated(self, event):
+        if event.get('account'):
+            self.mt5_view.update_account_info(event['account'])
+        snapshot = self.backend_services.get('snapshot')
+        if snapshot:
+            self.mt5_view.update_positions_table(snapshot.get_positions())
+
+    def _on_settings_changed(self, changes):
+        """Pushes saved settings to running services instead of requiring a restart."""
+        self.settings = self.settings_store.get_all()
+        for name in ('processor', 'manager'):
+            service = self.backend_services.get(name)
+            if service: service.update_settings(self.settings)
+
     @Slot()
     def save_settings(self):
         new_settings = self.settings_view.collect_settings()
-        for section, values in new_settings.items():
-            self.settings.setdefault(section, {}).update(values)
-        with open("data/config.json", "w", encoding="utf-8") as f:
-            json.dump(self.settings, f, indent=4)
-        QMessageBox.information(self, "Success", "Settings saved. Restart the bot to apply all changes.")
+        try:
+            self.settings_store.update(new_settings)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Could not save settings: {e}"); return
+        QMessageBox.information(self, "Success", "Settings saved. Connection settings (MT5, Telegram) apply after restarting the bot.")
 
     @Slot()
     def refresh_history_tab(self):
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк задержки и пропускной способности Flask-моста MT5 (mt5_server / broker_simulator).
+
+Несколько потоков-клиентов гоняют смесь запросов к серверу: чтения (/health,
+/rates, /positions) и торговый цикл send_order -> modify_position ->
+close_position. Торговый цикл выполняется только против демо-режима
+mt5_server или симулятора (--spawn-sim, маршруты /sim/*): сервер с реальным
+счётом получит ордера лишь с явным --allow-live-orders. По каждому маршруту
+считаются перцентили, гистограмма
+задержек и доля ошибок (HTTP != 200, исключение или success: false).
+Отчёт пишется в JSON и может сравниваться с прошлым прогоном (--compare):
+рост p99 или падение пропускной способности больше порога - код выхода 1.
+
+Запуск:
+    python mt5_server.py                                  # демо режим, порт 5000
+    python benchmarks/bridge_benchmark.py --seconds 10 --concurrency 8 --out bench_bridge.json
+    python benchmarks/bridge_benchmark.py --spawn-sim xauusd_m15.csv --sim-symbol XAUUSD --compare bench_bridge.json
+    python benchmarks/bridge_benchmark.py --spawn-sim synthetic --seconds 5
+    python benchmarks/bridge_benchmark.py --no-keepalive   # новое соединение на каждый запрос
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Границы корзин гистограммы, мс (последняя корзина - всё, что дольше)
+BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+DEFAULT_MIX = "health=2,rates=4,positions=3,trade=1"
+
+
+def _percentiles(samples):
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {'count': len(ordered), 'p50_ms': pick(0.50), 'p95_ms': pick(0.95),
+            'p99_ms': pick(0.99), 'max_ms': ordered[-1] * 1000}
+
+
+def _histogram(samples):
+    counts = [0] * (len(BUCKETS_MS) + 1)
+    for sample in samples:
+        ms = sample * 1000
+        index = next((i for i, edge in enumerate(BUCKETS_MS) if ms <= edge), len(BUCKETS_MS))
+        counts[index] += 1
+    labels = [f"<={edge}ms" for edge in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+    return dict(zip(labels, counts))
+
+
+def _parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {'health', 'rates', 'positions', 'trade'}
+    if unknown:
+        raise ValueError(f"Неизвестные операции: {', '.join(sorted(unknown))}")
+    return mix
+
+
+class Recorder:
+    """Задержки и ошибки по маршрутам (общий для всех потоков)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.errors = {}
+
+    def record(self, route, elapsed, ok):
+        with self._lock:
+            self.latency.setdefault(route, []).append(elapsed)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+class Client:
+    """Один виртуальный клиент моста; keepalive=False - без пула соединений"""
+
+    def __init__(self, url, symbol, recorder, keepalive=True, timeout=10.0, volume=0.01, rates_count=100):
+        self.url = url.rstrip('/')
+        self.symbol = symbol
+        self.recorder = recorder
+        self.session = requests.Session() if keepalive else None
+        self.timeout = timeout
+        self.volume = volume
+        self.rates_count = rates_count
+
+    def _call(self, method, route, **kwargs):
+        sender = self.session or requests
+        started = time.perf_counter()
+        data, ok = None, False
+        try:
+            response = sender.request(method, f"{self.url}{route}", timeout=self.timeout, **kwargs)
+            ok = response.status_code == 200
+            if ok and response.headers.get('Content-Type', '').startswith('application/json'):
+                data = response.json()
+                ok = bool(data.get('success', True)) if isinstance(data, dict) else True
+        except requests.RequestException:
+            ok = False
+        self.recorder.record(route, time.perf_counter() - started, ok)
+        return data if ok else None
+
+    def health(self):
+        self._call('GET', '/health')
+
+    def rates(self):
+        self._call('GET', '/rates', params={'symbol': self.symbol, 'timeframe': 'M1', 'count': self.rates_count})
+
+    def positions(self):
+        self._call('GET', '/positions')
+
+    def trade(self):
+        """Открытие, перенос стопов и закрытие одной позиции"""
+        tick = self._call('GET', '/tick', params={'symbol': self.symbol})
+        bid = (tick or {}).get('tick', {}).get('bid')
+        distance = bid * 0.01 if bid else None
+        order = self._call('POST', '/send_order', json={
+            'symbol': self.symbol, 'volume': self.volume, 'order_type': 'buy', 'comment': 'bridge-bench',
+            'sl': bid - distance if bid else None, 'tp': bid + distance if bid else None})
+        ticket = (order or {}).get('ticket')
+        if not ticket:
+            return
+        self._call('POST', '/modify_position', json={
+            'ticket': ticket, 'sl': bid - distance / 2 if bid else None, 'tp': bid + distance * 2 if bid else None})
+        self._call('POST', '/close_position', json={'ticket': ticket})
+
+
+def run_load(args):
+    mix = _parse_mix(args.mix)
+    operations, weights = list(mix), list(mix.values())
+    recorder = Recorder()
+    stop = threading.Event()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = Client(args.url, args.symbol, recorder, keepalive=not args.no_keepalive,
+                        timeout=args.timeout, volume=args.volume, rates_count=args.rates_count)
+        while not stop.is_set():
+            getattr(client, rng.choices(operations, weights)[0])()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join(args.timeout + 1)
+    elapsed = time.perf_counter() - started
+
+    routes = {}
+    for route, samples in sorted(recorder.latency.items()):
+        errors = recorder.errors.get(route, 0)
+        routes[route] = dict(_percentiles(samples), rps=len(samples) / elapsed, errors=errors,
+                             error_rate=errors / len(samples), histogram=_histogram(samples))
+    total = sum(len(s) for s in recorder.latency.values())
+    total_errors = sum(recorder.errors.values())
+    return {
+        'meta': {'url': args.url, 'symbol': args.symbol, 'concurrency': args.concurrency, 'seconds': args.seconds,
+                 'mix': mix, 'keepalive': not args.no_keepalive, 'started': datetime.now().isoformat(timespec='seconds')},
+        'total': {'requests': total, 'rps': total / elapsed, 'errors': total_errors,
+                  'error_rate': total_errors / total if total else 0.0},
+        'routes': routes,
+    }
+
+
+def compare(report, baseline, threshold):
+    """Сравнение с прошлым отчётом: список регрессий (p99 выше / rps ниже более чем на threshold)"""
+    regressions = []
+    print(f"{'route':<18}{'p50 ms':>18}{'p99 ms':>20}{'rps':>20}{'errors':>14}")
+    for route, current in report['routes'].items():
+        previous = baseline.get('routes', {}).get(route)
+        if not previous or not current.get('count'):
+            continue
+
+        def cell(key):
+            return f"{previous.get(key, 0):.1f}->{current.get(key, 0):.1f}"
+
+        errors = f"{previous.get('error_rate', 0):.1%}->{current.get('error_rate', 0):.1%}"
+        print(f"{route:<18}{cell('p50_ms'):>18}{cell('p99_ms'):>20}{cell('rps'):>20}{errors:>14}")
+        if previous.get('p99_ms') and current['p99_ms'] > previous['p99_ms'] * (1 + threshold):
+            regressions.append(f"{route}: p99 {previous['p99_ms']:.1f} -> {current['p99_ms']:.1f} ms")
+        if previous.get('rps') and current['rps'] < previous['rps'] * (1 - threshold):
+            regressions.append(f"{route}: rps {previous['rps']:.1f} -> {current['rps']:.1f}")
+        if current['error_rate'] > previous.get('error_rate', 0) + 0.01:
+            regressions.append(f"{route}: error rate {previous.get('error_rate', 0):.1%} -> {current['error_rate']:.1%}")
+    return regressions
+
+
+def trading_target(url, timeout=5.0):
+    """Куда пойдут ордера: 'demo' (демо-режим mt5_server), 'simulator', 'live' или None (сервер недоступен)"""
+    try:
+        response = requests.get(f"{url.rstrip('/')}/health", timeout=timeout)
+        if response.status_code != 200:
+            return None
+        if response.json().get('demo_mode'):
+            return 'demo'
+        # broker_simulator.py отвечает как mt5_server без демо-режима, но имеет служебные маршруты /sim/*
+        if requests.get(f"{url.rstrip('/')}/sim/state", timeout=timeout).status_code == 200:
+            return 'simulator'
+        return 'live'
+    except (requests.RequestException, ValueError):
+        return None
+
+
+def spawn_simulator(args):
+    """Запуск broker_simulator.py в отдельном процессе (клиенты не делят с ним GIL)"""
+    source = ['--synthetic', '20000'] if args.spawn_sim == 'synthetic' else ['--csv', args.spawn_sim]
+    command = [sys.executable, os.path.join(ROOT, 'broker_simulator.py'), *source,
+               '--symbol', args.sim_symbol, '--port', str(args.sim_port), '--host', '127.0.0.1', '--speed', '0']
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{args.sim_port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/health", timeout=1).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Симулятор не запустился за 30 секунд")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк Flask-моста MT5")
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help="Адрес mt5_server или симулятора")
+    parser.add_argument('--symbol', default='XAUUSD')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="Веса операций: health, rates, positions, trade")
+    parser.add_argument('--volume', type=float, default=0.01, help="Объём ордеров торгового цикла")
+    parser.add_argument('--rates-count', type=int, default=100)
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--no-keepalive', action='store_true', help="Без пула соединений (requests.get на каждый запрос)")
+    parser.add_argument('--allow-live-orders', action='store_true',
+                        help="Разрешить операцию trade против сервера не в демо-режиме (реальный счёт!)")
+    parser.add_argument('--spawn-sim', default=None, metavar='CSV', help="Запустить broker_simulator.py на этих свечах (synthetic - синтетический рынок)")
+    parser.add_argument('--sim-symbol', default='XAUUSD')
+    parser.add_argument('--sim-port', type=int, default=5055)
+    parser.add_argument('--out', default=None, help="Файл JSON-отчёта")
+    parser.add_argument('--compare', default=None, help="Прошлый отчёт для сравнения")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Допустимое ухудшение p99/rps (доля)")
+    args = parser.parse_args()
+
+    process = None
+    if args.spawn_sim:
+        process, args.url = spawn_simulator(args)
+        args.symbol = args.sim_symbol
+    try:
+        if not args.spawn_sim and _parse_mix(args.mix).get('trade', 0) > 0 and not args.allow_live_orders:
+            target = trading_target(args.url, args.timeout)
+            if target not in ('demo', 'simulator'):
+                reason = "сервер недоступен" if target is None else "сервер подключён к счёту не в демо-режиме"
+                parser.error(f"операция trade отклонена: {reason} ({args.url}). Используйте --spawn-sim, "
+                             f"демо-режим mt5_server, --mix без trade или --allow-live-orders")
+        report = run_load(args)
+    finally:
+        if process:
+            process.terminate()
+            process.wait(10)
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report['total'], indent=2, ensure_ascii=False))
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+    else:
+        print(json.dumps(report['routes'], indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
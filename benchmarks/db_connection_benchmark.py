@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк накладных расходов на запрос в services.database_service:
+connect() на каждый вызов против долгоживущих соединений SQLiteConnectionManager.
+
+Запуск: python benchmarks/db_connection_benchmark.py --iterations 2000
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Добавляем корень проекта в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.database_service import DatabaseService
+
+
+def _per_call_connect(db_path, iterations):
+    """Старый способ: новое соединение на каждый add_log/get_setting"""
+    started = time.perf_counter()
+    for i in range(iterations):
+        conn = sqlite3.connect(db_path)
+        conn.execute("INSERT INTO logs (timestamp, level, source, message) VALUES (?, ?, ?, ?)",
+                     (datetime.now(), 'INFO', 'bench', f"message {i}"))
+        conn.commit()
+        conn.close()
+
+        conn = sqlite3.connect(db_path)
+        conn.execute("SELECT value FROM settings WHERE category = ? AND key = ?", ('bench', 'key')).fetchone()
+        conn.close()
+    return time.perf_counter() - started
+
+
+def _managed(db, iterations):
+    """Новый способ: методы DatabaseService поверх менеджера соединений"""
+    db._db.reset_stats()
+    started = time.perf_counter()
+    for i in range(iterations):
+        db.add_log('INFO', 'bench', f"message {i}")
+        db.get_setting('bench', 'key')
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк соединений SQLite")
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        db = DatabaseService(db_path)
+        db.save_setting('bench', 'key', 'value')
+
+        baseline = _per_call_connect(db_path, args.iterations)
+        managed = _managed(db, args.iterations)
+        stats = db.get_db_stats()
+        db.close()
+
+    calls = args.iterations * 2
+    report = {
+        'iterations': args.iterations,
+        'per_call_connect_ms': baseline * 1000,
+        'managed_ms': managed * 1000,
+        'per_query_overhead_us': {
+            'per_call_connect': baseline * 1e6 / calls,
+            'managed': managed * 1e6 / calls,
+        },
+        'speedup': baseline / managed if managed else None,
+        'manager_stats': stats,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
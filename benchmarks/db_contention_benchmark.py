@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк конкуренции чтения интерфейса и записи торгового цикла в core.database_service.
+
+Поток-«торговый цикл» непрерывно пишет сигналы и обновляет статусы, несколько
+потоков-«страниц UI» одновременно читают тяжёлую страницу истории. Сравниваются:
+    shared   - одно соединение под блокировкой (как было: все через один курсор)
+    flush    - чтения через _fetchall (ждут очередь писателя ради read-your-writes)
+    ro_pool  - чтения через пул mode=ro (get_signal_history_page)
+
+Запуск: python benchmarks/db_contention_benchmark.py --seconds 5 --ui-threads 4
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# Добавляем корень проекта в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.database_service import DatabaseService
+
+# Страница истории со сводкой по символам: полный проход по таблице на каждый запрос
+UI_QUERY = """
+    SELECT s.*, c.symbol_count FROM (SELECT * FROM signals ORDER BY id DESC LIMIT ?) s
+    JOIN (SELECT symbol, COUNT(*) AS symbol_count FROM signals GROUP BY symbol) c ON c.symbol = s.symbol
+"""
+
+
+def _percentiles(samples):
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {'count': len(ordered), 'p50_ms': pick(0.50), 'p95_ms': pick(0.95),
+            'p99_ms': pick(0.99), 'max_ms': ordered[-1] * 1000}
+
+
+def _seed(db_path, rows):
+    conn = sqlite3.connect(db_path)
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    conn.executemany(
+        "INSERT INTO signals (timestamp, symbol, order_type, entry_price, stop_loss, take_profits, status) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(now, f"SYM{i % 20}", 'BUY', 1.0 + i * 1e-5, 0.9, '[1.1]', 'PROCESSED_CLOSED') for i in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+def _run(seconds, ui_threads, page_size, write_fn, read_fn):
+    """Запускает писателя и читателей на seconds секунд, возвращает задержки"""
+    stop = threading.Event()
+    write_latency, read_latency = [], []
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            write_fn(i)
+            write_latency.append(time.perf_counter() - started)
+            i += 1
+
+    def reader():
+        samples = []
+        while not stop.is_set():
+            started = time.perf_counter()
+            read_fn(page_size)
+            samples.append(time.perf_counter() - started)
+        read_latency.extend(samples)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(ui_threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {'writes': _percentiles(write_latency), 'reads': _percentiles(read_latency),
+            'writes_per_sec': len(write_latency) / seconds, 'reads_per_sec': len(read_latency) / seconds}
+
+
+def _signal(i):
+    return {'symbol': f"SYM{i % 20}", 'order_type': 'BUY', 'entry_price': 1.0, 'stop_loss': 0.9,
+            'take_profits': [1.1], 'original_message': f"bench {i}"}
+
+
+def bench_shared(db_path, args):
+    """Одно соединение и одна блокировка на всё, как в исходном core.database_service"""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    lock = threading.Lock()
+
+    def write(i):
+        with lock:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO signals (timestamp, symbol, status) VALUES (?, ?, 'NEW')",
+                           (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), f"SYM{i % 20}"))
+            cursor.execute("UPDATE signals SET status = 'PROCESSED_ACTIVE' WHERE id = ?", (cursor.lastrowid,))
+            conn.commit()
+
+    def read(limit):
+        with lock:
+            conn.execute(UI_QUERY, (limit,)).fetchall()
+
+    try:
+        return _run(args.seconds, args.ui_threads, args.page_size, write, read)
+    finally:
+        conn.close()
+
+
+def bench_service(db, args, read_fn):
+    def write(i):
+        signal_id = db.add_signal(_signal(i))
+        db.update_signal_status(signal_id, 'PROCESSED_ACTIVE')
+
+    return _run(args.seconds, args.ui_threads, args.page_size, write, read_fn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк конкуренции чтения UI и записи")
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--ui-threads', type=int, default=4)
+    parser.add_argument('--page-size', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=50000, help="Сигналов в базе до начала замера")
+    args = parser.parse_args()
+
+    report = {'seconds': args.seconds, 'ui_threads': args.ui_threads, 'page_size': args.page_size, 'rows': args.rows}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        db = DatabaseService(db_path)
+        _seed(db_path, args.rows)
+
+        report['shared'] = bench_shared(db_path, args)
+        report['flush'] = bench_service(db, args, lambda limit: db._fetchall(UI_QUERY, (limit,)))
+        report['ro_pool'] = bench_service(db, args, lambda limit: db.ui_readers.fetchall(UI_QUERY, (limit,)))
+        report['ro_pool_stats'] = db.get_read_stats()
+        db.close_connection()
+
+    baseline = report['shared']['writes'].get('p99_ms')
+    pooled = report['ro_pool']['writes'].get('p99_ms')
+    report['write_p99_improvement'] = baseline / pooled if baseline and pooled else None
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Офлайн-симулятор брокера с HTTP API mt5_server (для Linux/macOS без терминала)
+
+Проигрывает свечи из CSV (или синтетические), держит позиции и ордера, исполняет SL/TP и пишет
+сделки. MT5Service во Flask режиме подключается к нему так же, как к
+mt5_server на Windows (flask_url = http://127.0.0.1:5000).
+
+Примеры:
+    python broker_simulator.py --csv xauusd_m15.csv --symbol XAUUSD --speed 600
+    python broker_simulator.py --csv xauusd_m15.csv --symbol XAUUSD --speed 0 --latency-ms 40 --reject-rate 0.05
+    python broker_simulator.py --csv xauusd_m15.csv --symbol XAUUSD --manual   # часы двигает POST /sim/advance
+    python broker_simulator.py --synthetic 50000 --timeframe M5 --symbol XAUUSD --symbol EURUSD --seed 1
+"""
+
+import argparse
+import logging
+
+from utils.broker_sim import BrokerSimulator, install_metatrader5, load_candles_csv
+
+
+def create_app(simulator: BrokerSimulator):
+    """Flask-приложение mt5_server поверх симулятора плюс служебные маршруты /sim/*"""
+    install_metatrader5(simulator)
+    import mt5_server
+    from flask import jsonify, request
+
+    success, message = mt5_server.mt5_server.initialize(path="broker-simulator")
+    if not success:
+        raise RuntimeError(message)
+    app = mt5_server.app
+
+    @app.route('/sim/state', methods=['GET'])
+    def sim_state():
+        """Часы, счёт и счётчики симуляции"""
+        return jsonify(simulator.get_state())
+
+    @app.route('/sim/advance', methods=['POST'])
+    def sim_advance():
+        """Сдвиг часов на bars баров (ручной режим)"""
+        bars = int((request.get_json(silent=True) or {}).get('bars', 1))
+        processed = simulator.step(bars)
+        return jsonify({"success": True, "processed": processed, "state": simulator.get_state()})
+
+    @app.route('/sim/reset', methods=['POST'])
+    def sim_reset():
+        """Сброс к началу проигрывания"""
+        simulator.reset()
+        mt5_server.mt5_server.symbol_cache.invalidate()
+        return jsonify({"success": True, "state": simulator.get_state()})
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Симулятор брокера MT5")
+    parser.add_argument('--csv', action='append', default=[], help="Файл свечей (можно несколько, по одному на символ)")
+    parser.add_argument('--synthetic', type=int, default=0, metavar='BARS',
+                        help="Вместо CSV - BARS синтетических баров на символ (utils/synthetic_market.py)")
+    parser.add_argument('--timeframe', default='M15', help="Таймфрейм синтетических баров")
+    parser.add_argument('--symbol', action='append', required=True, help="Символ для каждого --csv")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--speed', type=float, default=60.0, help="Секунд рынка за секунду (0 - без пауз)")
+    parser.add_argument('--manual', action='store_true', help="Не запускать часы, двигать через /sim/advance")
+    parser.add_argument('--balance', type=float, default=10000.0)
+    parser.add_argument('--leverage', type=int, default=100)
+    parser.add_argument('--warmup-bars', type=int, default=200, help="Баров истории до начала проигрывания")
+    parser.add_argument('--commission', type=float, default=0.0, help="Комиссия за лот")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Задержка order_send")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="Случайная добавка к задержке")
+    parser.add_argument('--reject-rate', type=float, default=0.0, help="Доля отклонённых ордеров (requote)")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    if not args.synthetic and len(args.csv) != len(args.symbol):
+        parser.error("Укажите --symbol для каждого --csv (или --synthetic)")
+
+    logging.basicConfig(level=logging.INFO)
+    options = dict(balance=args.balance, leverage=args.leverage, warmup_bars=args.warmup_bars,
+                   commission_per_lot=args.commission, latency_ms=args.latency_ms,
+                   latency_jitter_ms=args.jitter_ms, reject_rate=args.reject_rate)
+    if args.synthetic:
+        simulator = BrokerSimulator.from_synthetic(args.symbol, args.timeframe, args.synthetic, seed=args.seed, **options)
+    else:
+        simulator = BrokerSimulator(
+            {symbol: load_candles_csv(path) for path, symbol in zip(args.csv, args.symbol)}, seed=args.seed, **options)
+    app = create_app(simulator)
+    if not args.manual:
+        simulator.run(args.speed)
+    app.run(host=args.host, port=args.port, debug=False, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
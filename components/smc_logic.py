@@ -1,9 +1,11 @@
 import pandas as pd
-import numpy as np
 from datetime import datetime
 import telegram
 import asyncio
 
+from utils.resample import choose_base_timeframe, range_fetch_end, resample_range
+from utils.synthetic_market import generate_dataframe
+
 # Импорт MetaTrader5 с обработкой ошибки
 try:
     import MetaTrader5 as mt5
@@ -14,10 +16,11 @@ except ImportError:
     mt5 = None
 
 # ======== MT5 Data Load ============
-def load_mt5_data(symbol="XAUUSD", timeframe="M15", date_from="2025-01-01", date_to="2025-06-01"):
+def load_mt5_data(symbol="XAUUSD", timeframe="M15", date_from="2025-01-01", date_to="2025-06-01",
+                  base_timeframe="M1", max_base_bars=100000):
     if not MT5_AVAILABLE:
         # Демо-данные для macOS
-        return _generate_demo_data(symbol, date_from, date_to)
+        return _generate_demo_data(symbol, date_from, date_to, timeframe)
     
     tf_map = {"M1": mt5.TIMEFRAME_M1, "M5": mt5.TIMEFRAME_M5, "M15": mt5.TIMEFRAME_M15,
               "M30": mt5.TIMEFRAME_M30, "H1": mt5.TIMEFRAME_H1, "H4": mt5.TIMEFRAME_H4,
@@ -26,55 +29,27 @@ def load_mt5_data(symbol="XAUUSD", timeframe="M15", date_from="2025-01-01", date
     if not mt5.initialize():
         raise RuntimeError("❌ MT5 initialize() failed")
 
-    rates = mt5.copy_rates_range(symbol, tf_map[timeframe],
-                                 datetime.strptime(date_from, "%Y-%m-%d"),
-                                 datetime.strptime(date_to, "%Y-%m-%d"))
+    start, end = datetime.strptime(date_from, "%Y-%m-%d"), datetime.strptime(date_to, "%Y-%m-%d")
+    # Грузится базовый таймфрейм, нужный собирается локально (если базовых баров не больше max_base_bars)
+    base = choose_base_timeframe(timeframe, base_timeframe, (end - start).total_seconds(), max_base_bars)
+    rates = mt5.copy_rates_range(symbol, tf_map[base], start, range_fetch_end(end, timeframe, base))
     mt5.shutdown()
 
     if rates is None:
         raise RuntimeError("❌ MT5 copy_rates_range() returned None!")
 
-    df = pd.DataFrame(rates)
+    df = pd.DataFrame(resample_range(rates, timeframe, base, start, end))
     df["datetime"] = pd.to_datetime(df["time"], unit="s")
     df = df[["datetime", "open", "high", "low", "close"]]
     df = df.sort_values("datetime").reset_index(drop=True)
     return df
 
-def _generate_demo_data(symbol, date_from, date_to):
-    """Генерирует демо-данные для macOS"""
-    start_date = datetime.strptime(date_from, "%Y-%m-%d")
-    end_date = datetime.strptime(date_to, "%Y-%m-%d")
-    
-    # Генерируем временные метки каждые 15 минут
-    dates = pd.date_range(start=start_date, end=end_date, freq='15T')
-    
-    # Базовые цены для разных символов
-    base_price = 1.2000 if "EUR" in symbol else 1.3000 if "GBP" in symbol else 110.0 if "JPY" in symbol else 2000.0
-    
-    np.random.seed(42)
-    prices = [base_price]
-    
-    # Генерируем цены с реалистичными движениями
-    for i in range(1, len(dates)):
-        change = np.random.normal(0, 0.0005)
-        prices.append(prices[-1] + change)
-    
-    # Создаем OHLC данные
-    data = []
-    for i, (date, close) in enumerate(zip(dates, prices)):
-        high = close + abs(np.random.normal(0, 0.0002))
-        low = close - abs(np.random.normal(0, 0.0002))
-        open_price = prices[i-1] if i > 0 else close
-        
-        data.append({
-            'datetime': date,
-            'open': open_price,
-            'high': high,
-            'low': low,
-            'close': close
-        })
-    
-    return pd.DataFrame(data)
+def _generate_demo_data(symbol, date_from, date_to, timeframe="M15"):
+    """Генерирует демо-данные для macOS (синтетический рынок, воспроизводимый для одних параметров)"""
+    df = generate_dataframe(symbol, timeframe, start=datetime.strptime(date_from, "%Y-%m-%d"),
+                            end=datetime.strptime(date_to, "%Y-%m-%d"), seed=42)
+    df = df.rename(columns={"time": "datetime"})
+    return df[["datetime", "open", "high", "low", "close"]]
 
 # ======== SMC Feature Generation ============
 def generate_smc_features(df):
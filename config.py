@@ -16,7 +16,9 @@ MT5_CONFIG = {
     "password": os.getenv("MT5_PASSWORD", ""),
     "server": os.getenv("MT5_SERVER", "MetaQuotes-Demo"),
     "symbols": ["XAUUSD", "EURUSD", "GBPUSD", "USDJPY"],
-    "timeframes": ["M1", "M5", "M15", "M30", "H1", "H4", "D1"]
+    "timeframes": ["M1", "M5", "M15", "M30", "H1", "H4", "D1"],
+    "base_timeframe": "M1",         # Через мост идёт только он, старшие собираются локально (utils/resample.py)
+    "snapshot_interval": 1.0,       # Период опроса позиций/счёта (utils/account_snapshot.py), секунды
 }
 
 # Telegram настройки для парсер бота
@@ -67,6 +69,23 @@ DATA_PATHS = {
     "configs": "configs/",
 }
 
+# Трейлинг-стоп и безубыток по тикам для всех открытых позиций (utils/trailing_stop.py)
+TRAILING_CONFIG = {
+    "enabled": True,
+    "rule_file": "configs/goldhunter_config.json",  # support_trailing_stop, trailing_activation, break_even_threshold
+    "min_step_points": 20,          # Стоп переносится, только если улучшается хотя бы на столько пунктов
+    "tick_interval": 0.25,          # Опрос тиков без потока событий mt5_server, секунды
+}
+
+# Ретеншн и фоновое обслуживание баз данных (utils/db_maintenance.py)
+DB_MAINTENANCE_CONFIG = {
+    "log_retention_days": 30,       # Логи старше - в помесячные архивы
+    "signal_retention_days": 90,    # Завершённые сигналы старше - в signals_archive
+    "archive_format": "sqlite",     # "sqlite" (logs_YYYY-MM.db) или "jsonl.gz"
+    "interval": 6 * 3600,           # Период фонового прохода, секунды
+    "vacuum_pages": 2000,           # Страниц за один incremental_vacuum
+}
+
 # Создание необходимых директорий
 def create_directories():
     """Создает необходимые директории."""
@@ -34,7 +34,9 @@ class AITraderService(QObject):
         # --- Инициализация модулей ---
         self.signal_filter = SignalFilter(self.settings)
         self.gpt_confidence = GptConfidence(self.settings.get('gpt', {}).get('api_key'))
-        self.risk_guard = None # Будет создан при запуске
+        self.risk_guard = None # Будет создан при запуске (или взят общий у MT5Service)
+        self._own_guard = False
+        self._guard_blocked = False
         
         self.last_candle_time = None
         self.timer = QTimer(self)
@@ -57,7 +59,12 @@ class AITraderService(QObject):
             start_balance = account_info.get('equity') if account_info else 10000
             self.simulated_balance = start_balance
             
-            self.risk_guard = PropRiskGuard(balance=start_balance)
+            # Общий гард счёта (следит за снимком) или свой, который обновляется на каждом тике
+            self.risk_guard = getattr(self.mt5, 'risk_guard', None)
+            self._own_guard = self.risk_guard is None
+            if self._own_guard:
+                self.risk_guard = PropRiskGuard.from_settings(self.settings, balance=start_balance)
+                self.mt5.set_risk_guard(self.risk_guard)
             
             self.is_running = True
             self.timer.start(10000) # Проверяем наличие новой свечи каждые 10 секунд
@@ -68,6 +75,8 @@ class AITraderService(QObject):
     def stop(self):
         self.is_running = False
         self.timer.stop()
+        if self._own_guard:
+            self.mt5.set_risk_guard(None)
         self.log_signal.emit("AI Trader stopped.", "INFO")
 
     def main_tick(self):
@@ -77,6 +86,20 @@ class AITraderService(QObject):
             return
 
         try:
+            # 0. Лимиты просадки: при нарушении свечи не анализируем
+            if self._own_guard:
+                account_info = self.mt5.get_account_info()
+                if account_info:
+                    self.risk_guard.update_equity(account_info['equity'], account_info['balance'])
+            if not self.risk_guard.can_trade():
+                if not self._guard_blocked:
+                    self.log_signal.emit(f"Trading blocked by risk guard: {self.risk_guard.breach}", "WARNING")
+                self._guard_blocked = True
+                return
+            if self._guard_blocked:
+                self.log_signal.emit("Risk guard limits are clear again. Trading resumed.", "INFO")
+                self._guard_blocked = False
+
             # 1. Получаем исторические данные (последние 50 свечей)
             candles_df = self.mt5.get_rates(self.SYMBOL, self.TIMEFRAME_ENUM, count=50)
             if candles_df is None or candles_df.empty:
@@ -3,26 +3,44 @@ import os
 import json
 from datetime import datetime
 
+from utils.db_connection import ReadOnlyConnectionPool, SQLiteConnectionManager
+from utils.db_writer import BatchWriter
+from utils.db_maintenance import DatabaseMaintenance
+from utils.deal_feed import DEALS_INDEX_SQL, DEALS_TABLE_SQL, INSERT_DEAL_SQL, deal_row
+from utils.log_sink import LogSink
+
 class DatabaseService:
-    def __init__(self, db_path="data/combine_trade_bot.db"):
+    def __init__(self, db_path="data/combine_trade_bot.db", log_file=None, log_level='INFO', echo=False):
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
-        self.cursor = self.conn.cursor()
+        self.db_path = db_path
+        # All writes go through a single writer thread that group-commits queued operations;
+        # reads use per-thread connections, so no cursor is ever shared between threads.
+        self.writer = BatchWriter(db_path)
+        self.readers = SQLiteConnectionManager(db_path, row_factory=sqlite3.Row)
+        # add_log only appends to an in-memory ring; a background thread batches rows into the logs table
+        # (and the optional rotating JSONL file). Created before the migrations so they can log too.
+        self.log_sink = LogSink(self._flush_logs, min_level=log_level, jsonl_path=log_file, echo=echo)
         self._create_and_migrate_tables()
+        # UI views read committed WAL snapshots through a separate read-only pool and never wait for the writer.
+        self.ui_readers = ReadOnlyConnectionPool(db_path, row_factory=sqlite3.Row)
+        self.log_sink.preload(reversed(self.readers.fetchall(
+            "SELECT id, timestamp, level, NULL, message FROM logs ORDER BY id DESC LIMIT ?", (self.log_sink.capacity,))))
+        self.maintenance = None
 
-    def _add_column_if_not_exists(self, table_name, column_name, column_type):
+    def _add_column_if_not_exists(self, cursor, table_name, column_name, column_type):
         """Checks if a column exists and adds it if it doesn't."""
-        self.cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = [info[1] for info in self.cursor.fetchall()]
+        cursor.execute(f"PRAGMA table_info({table_name})")
+        columns = [info[1] for info in cursor.fetchall()]
         if column_name not in columns:
-            print(f"--- [DB] Adding missing column '{column_name}' to table '{table_name}'... ---")
-            self.cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
-            self.conn.commit()
+            self.add_log('INFO', f"Adding missing column '{column_name}' to table '{table_name}'...")
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
 
     def _create_and_migrate_tables(self):
         """Creates tables if they don't exist and adds missing columns to existing tables."""
-        self.cursor.execute("""
+        self.writer.call(self._migrate).result()
+
+    def _migrate(self, cursor):
+        cursor.execute("""
             CREATE TABLE IF NOT EXISTS signals (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 timestamp TEXT NOT NULL,
@@ -36,82 +54,252 @@ class DatabaseService:
             )
         """)
         # Проверяем и добавляем недостающие колонки для обратной совместимости
-        self._add_column_if_not_exists('signals', 'channel_name', 'TEXT')
-        self._add_column_if_not_exists('signals', 'mt5_tickets', 'TEXT')
-        self._add_column_if_not_exists('signals', 'comment', 'TEXT')
-        self._add_column_if_not_exists('signals', 'channel_id', 'INTEGER')
-        self._add_column_if_not_exists('signals', 'message_id', 'INTEGER')
-            
-        self.cursor.execute("CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY, timestamp TEXT, level TEXT, message TEXT)")
-        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_message ON signals (channel_id, message_id)")
-        self.conn.commit()
+        self._add_column_if_not_exists(cursor, 'signals', 'channel_name', 'TEXT')
+        self._add_column_if_not_exists(cursor, 'signals', 'mt5_tickets', 'TEXT')
+        self._add_column_if_not_exists(cursor, 'signals', 'comment', 'TEXT')
+        self._add_column_if_not_exists(cursor, 'signals', 'channel_id', 'INTEGER')
+        self._add_column_if_not_exists(cursor, 'signals', 'message_id', 'INTEGER')
 
-    def add_signal(self, signal_data, status='NEW'):
+        cursor.execute("CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY, timestamp TEXT, level TEXT, message TEXT)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_message ON signals (channel_id, message_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_signals_status ON signals (status)")
+        self._migrate_signal_tickets(cursor)
+        cursor.execute(DEALS_TABLE_SQL)
+        for index_sql in DEALS_INDEX_SQL:
+            cursor.execute(index_sql)
+
+    def _migrate_signal_tickets(self, cursor):
+        """One row per order leg, indexed by ticket; backfilled once from the legacy mt5_tickets JSON."""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'signal_tickets'")
+        exists = cursor.fetchone() is not None
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS signal_tickets (
+                signal_id INTEGER NOT NULL,
+                leg INTEGER NOT NULL,
+                ticket INTEGER NOT NULL,
+                status TEXT DEFAULT 'OPEN',
+                PRIMARY KEY (signal_id, leg)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_signal_tickets_ticket ON signal_tickets (ticket)")
+        if exists:
+            return
+        cursor.execute("SELECT id, mt5_tickets FROM signals WHERE mt5_tickets IS NOT NULL AND mt5_tickets != ''")
+        rows = []
+        for signal_id, tickets_json in cursor.fetchall():
+            try:
+                tickets = json.loads(tickets_json) or []
+            except (json.JSONDecodeError, TypeError):
+                self.add_log('WARNING', f"Skipping unparsable mt5_tickets for signal ID {signal_id}"); continue
+            rows.extend((signal_id, leg, int(ticket)) for leg, ticket in enumerate(tickets))
+        if rows:
+            self.add_log('INFO', f"Migrating {len(rows)} tickets into 'signal_tickets'...")
+            cursor.executemany("INSERT OR IGNORE INTO signal_tickets (signal_id, leg, ticket) VALUES (?, ?, ?)", rows)
+
+    def _fetchone(self, query, params=()):
+        # Read-your-writes: wait for queued writes (returns immediately when the queue is empty)
+        self.writer.flush()
+        return self.readers.fetchone(query, params)
+
+    def _fetchall(self, query, params=()):
+        self.writer.flush()
+        return self.readers.fetchall(query, params)
+
+    def add_signal_async(self, signal_data, status='NEW'):
+        """Queues a signal insert and returns a Future that resolves to the new row id."""
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         tps_json = json.dumps(signal_data.get('take_profits', []))
+        return self.writer.submit("""
+            INSERT INTO signals (timestamp, channel_id, message_id, channel_name, original_message,
+            symbol, order_type, entry_price, stop_loss, take_profits, status, comment)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (timestamp, signal_data.get('channel_id'), signal_data.get('message_id'),
+            signal_data.get('channel_name'), signal_data.get('original_message'),
+            signal_data.get('symbol'), signal_data.get('order_type'), signal_data.get('entry_price'),
+            signal_data.get('stop_loss'), tps_json, status, signal_data.get('comment')))
+
+    def add_signal(self, signal_data, status='NEW'):
         try:
-            self.cursor.execute("""
-                INSERT INTO signals (timestamp, channel_id, message_id, channel_name, original_message, 
-                symbol, order_type, entry_price, stop_loss, take_profits, status, comment) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (timestamp, signal_data.get('channel_id'), signal_data.get('message_id'),
-                signal_data.get('channel_name'), signal_data.get('original_message'),
-                signal_data.get('symbol'), signal_data.get('order_type'), signal_data.get('entry_price'),
-                signal_data.get('stop_loss'), tps_json, status, signal_data.get('comment')))
-            self.conn.commit()
-            return self.cursor.lastrowid
+            return self.add_signal_async(signal_data, status).result()
         except sqlite3.Error as e:
             self.add_log('ERROR', f"Database Error: Failed to add signal - {e}"); return None
 
     def get_signal_by_message_id(self, channel_id, message_id):
         try:
-            self.cursor.execute("SELECT * FROM signals WHERE channel_id = ? AND message_id = ?", (channel_id, message_id))
-            return self.cursor.fetchone()
+            return self._fetchone("SELECT * FROM signals WHERE channel_id = ? AND message_id = ?", (channel_id, message_id))
         except sqlite3.Error as e:
             self.add_log('ERROR', f"DB Error: Failed to get signal by message ID - {e}"); return None
-            
+
     def get_latest_partial_signal(self, channel_id, symbol):
         try:
-            self.cursor.execute("SELECT * FROM signals WHERE channel_id = ? AND symbol = ? AND status = 'PARTIAL_ENTRY' ORDER BY id DESC LIMIT 1", (channel_id, symbol))
-            return self.cursor.fetchone()
+            return self._fetchone("SELECT * FROM signals WHERE channel_id = ? AND symbol = ? AND status = 'PARTIAL_ENTRY' ORDER BY id DESC LIMIT 1", (channel_id, symbol))
         except sqlite3.Error as e:
             self.add_log('ERROR', f"DB Error: Failed to get partial signal - {e}"); return None
 
+    def _submit_logged(self, error_prefix, query, params):
+        """Queues a write without waiting; failures are reported to the log once committed."""
+        future = self.writer.submit(query, params)
+        future.add_done_callback(lambda f: f.exception() and self.add_log('ERROR', f"{error_prefix}: {f.exception()}"))
+        return future
+
+    def _call_logged(self, error_prefix, fn):
+        """Like _submit_logged, for a multi-statement write function."""
+        future = self.writer.call(fn)
+        future.add_done_callback(lambda f: f.exception() and self.add_log('ERROR', f"{error_prefix}: {f.exception()}"))
+        return future
+
+    @staticmethod
+    def _replace_signal_tickets(cursor, signal_id, tickets):
+        """Syncs signal_tickets with the signal's ticket list; legs keep their status while the ticket is unchanged."""
+        cursor.executemany("""
+            INSERT INTO signal_tickets (signal_id, leg, ticket) VALUES (?, ?, ?)
+            ON CONFLICT(signal_id, leg) DO UPDATE SET
+                status = CASE WHEN ticket = excluded.ticket THEN status ELSE 'OPEN' END,
+                ticket = excluded.ticket
+        """, [(signal_id, leg, int(ticket)) for leg, ticket in enumerate(tickets)])
+        cursor.execute("DELETE FROM signal_tickets WHERE signal_id = ? AND leg >= ?", (signal_id, len(tickets)))
+
     def update_signal_with_trade_data(self, signal_id, sl, tps, tickets, status):
         tps_json = json.dumps(tps); tickets_json = json.dumps(tickets)
-        try:
-            self.cursor.execute("UPDATE signals SET stop_loss = ?, take_profits = ?, mt5_tickets = ?, status = ? WHERE id = ?", (sl, tps_json, tickets_json, status, signal_id))
-            self.conn.commit()
-        except sqlite3.Error as e:
-            self.add_log('ERROR', f"DB Error: Failed to update partial signal - {e}")
-            
+        def write(cursor):
+            # mt5_tickets is still written for older readers of the signals table
+            cursor.execute("UPDATE signals SET stop_loss = ?, take_profits = ?, mt5_tickets = ?, status = ? WHERE id = ?", (sl, tps_json, tickets_json, status, signal_id))
+            self._replace_signal_tickets(cursor, signal_id, tickets)
+        self._call_logged("DB Error: Failed to update partial signal", write)
+
     def add_log(self, level, message):
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.log_sink.emit(level, message)
+
+    def _flush_logs(self, records):
+        self.writer.submit_many("INSERT INTO logs (timestamp, level, message) VALUES (?, ?, ?)",
+                                [(ts, level, message) for _, ts, level, _, message in records]).result()
+
+    def get_logs(self, limit=100, level=None):
+        """Most recent log entries (newest first), served from memory; older entries than the ring come from the table."""
+        logs = self.log_sink.recent(limit, level)
+        if len(logs) >= limit or not self.log_sink.is_full:
+            return [(seq, ts, lvl, message) for seq, ts, lvl, _, message in logs]
+        self.log_sink.flush()
+        query, params = "SELECT id, timestamp, level, message FROM logs", []
+        if level:
+            query += " WHERE level = ?"; params.append(str(level).upper())
         try:
-            self.cursor.execute("INSERT INTO logs (timestamp, level, message) VALUES (?, ?, ?)", (timestamp, level, message))
-            self.conn.commit()
-        except sqlite3.Error as e: print(f"DB Log Error: {e}")
+            return [tuple(row) for row in self.ui_readers.fetchall(query + " ORDER BY id DESC LIMIT ?", params + [limit])]
+        except sqlite3.Error as e: self.add_log('ERROR', f"Failed to read logs: {e}"); return []
 
     def get_signal_history(self, limit=100):
+        return self.get_signal_history_page(limit)[0]
+
+    def get_signal_history_page(self, limit=100, before_id=None):
+        """Keyset page of signals, newest first: (rows, cursor for the next page or None). Served by the UI pool."""
         try:
-            self.cursor.execute("SELECT * FROM signals ORDER BY id DESC LIMIT ?", (limit,)); return self.cursor.fetchall()
-        except sqlite3.Error as e: self.add_log('ERROR', f"Failed to get history: {e}"); return []
+            if before_id is None:
+                rows = self.ui_readers.fetchall("SELECT * FROM signals ORDER BY id DESC LIMIT ?", (limit,))
+            else:
+                rows = self.ui_readers.fetchall("SELECT * FROM signals WHERE id < ? ORDER BY id DESC LIMIT ?", (before_id, limit))
+            return rows, (rows[-1]['id'] if len(rows) == limit else None)
+        except sqlite3.Error as e: self.add_log('ERROR', f"Failed to get history: {e}"); return [], None
 
     def get_active_signals_for_management(self):
         try:
-            self.cursor.execute("SELECT * FROM signals WHERE status = 'PROCESSED_ACTIVE'"); return self.cursor.fetchall()
+            return self._fetchall("SELECT * FROM signals WHERE status = 'PROCESSED_ACTIVE'")
         except sqlite3.Error as e: self.add_log('ERROR', f"Failed to get active signals: {e}"); return []
 
     def update_signal_after_trade(self, signal_id, status, tickets):
         tickets_json = json.dumps(tickets)
+        def write(cursor):
+            cursor.execute("UPDATE signals SET status = ?, mt5_tickets = ? WHERE id = ?", (status, tickets_json, signal_id))
+            self._replace_signal_tickets(cursor, signal_id, tickets)
+        self._call_logged("Failed to update signal after trade", write)
+
+    def get_signal_tickets(self, signal_id, status=None):
+        """Tickets of a signal in leg order, optionally only legs with the given status."""
+        query, params = "SELECT ticket FROM signal_tickets WHERE signal_id = ?", [signal_id]
+        if status:
+            query += " AND status = ?"; params.append(status)
         try:
-            self.cursor.execute("UPDATE signals SET status = ?, mt5_tickets = ? WHERE id = ?", (status, tickets_json, signal_id)); self.conn.commit()
-        except sqlite3.Error as e: self.add_log('ERROR', f"Failed to update signal after trade: {e}")
+            return [row['ticket'] for row in self._fetchall(query + " ORDER BY leg", params)]
+        except sqlite3.Error as e: self.add_log('ERROR', f"Failed to get tickets for signal {signal_id}: {e}"); return []
+
+    def get_signal_by_ticket(self, ticket):
+        """Signal that owns an MT5 ticket (position_id of a deal), via the ticket index."""
+        try:
+            return self._fetchone("SELECT s.* FROM signal_tickets t JOIN signals s ON s.id = t.signal_id WHERE t.ticket = ?", (ticket,))
+        except sqlite3.Error as e: self.add_log('ERROR', f"Failed to get signal by ticket {ticket}: {e}"); return None
+
+    def get_active_signal_tickets(self, status='PROCESSED_ACTIVE'):
+        """Open legs of signals with the given status as rows (signal_id, symbol, leg, ticket)."""
+        try:
+            return self._fetchall("""
+                SELECT t.signal_id, s.symbol, t.leg, t.ticket FROM signal_tickets t JOIN signals s ON s.id = t.signal_id
+                WHERE s.status = ? AND t.status = 'OPEN' ORDER BY t.signal_id, t.leg
+            """, (status,))
+        except sqlite3.Error as e: self.add_log('ERROR', f"Failed to get active tickets: {e}"); return []
+
+    def update_ticket_status(self, ticket, status):
+        self._submit_logged("Failed to update ticket status",
+            "UPDATE signal_tickets SET status = ? WHERE ticket = ?", (status, ticket))
+
+    def update_tickets_status(self, ticket_statuses, signal_statuses=None):
+        """Statuses of several legs ({ticket: status}) and signals ({signal_id: status}) in one transaction."""
+        ticket_rows = [(status, ticket) for ticket, status in ticket_statuses.items() if status]
+        signal_rows = [(status, signal_id) for signal_id, status in (signal_statuses or {}).items()]
+        def write(cursor):
+            cursor.executemany("UPDATE signal_tickets SET status = ? WHERE ticket = ?", ticket_rows)
+            cursor.executemany("UPDATE signals SET status = ? WHERE id = ?", signal_rows)
+        return self._call_logged("Failed to update ticket statuses", write)
 
     def update_signal_status(self, signal_id, new_status):
+        self._submit_logged("Failed to update signal status",
+            "UPDATE signals SET status = ? WHERE id = ?", (new_status, signal_id))
+
+    def save_deals(self, deals):
+        """Stores MT5 deals (normalize_deal dicts) in one batch; already known tickets are ignored."""
+        self._call_logged("Failed to save deals",
+            lambda cursor: cursor.executemany(INSERT_DEAL_SQL, [deal_row(d) for d in deals]))
+
+    def get_last_deal(self):
+        """(ticket, time) of the newest stored deal, used to resume the deal feed."""
+        try:
+            return self._fetchone("SELECT ticket, time FROM deals ORDER BY ticket DESC LIMIT 1")
+        except sqlite3.Error as e: self.add_log('ERROR', f"Failed to get last deal: {e}"); return None
+
+    def get_deals(self, since=None, position_id=None):
+        """Stored deals in time order, optionally since an epoch time or for one position."""
+        query, params = "SELECT * FROM deals WHERE 1=1", []
+        if since is not None:
+            query += " AND time >= ?"; params.append(int(since))
+        if position_id is not None:
+            query += " AND position_id = ?"; params.append(position_id)
         try:
-            self.cursor.execute("UPDATE signals SET status = ? WHERE id = ?", (new_status, signal_id)); self.conn.commit()
-        except sqlite3.Error as e: self.add_log('ERROR', f"Failed to update signal status: {e}")
+            return self.ui_readers.fetchall(query + " ORDER BY time, ticket", params)
+        except sqlite3.Error as e: self.add_log('ERROR', f"Failed to get deals: {e}"); return []
+
+    def get_write_stats(self):
+        """Writer queue counters (operations, batches, average batch size)."""
+        return self.writer.get_stats()
+
+    def get_read_stats(self):
+        """UI read pool counters (reads, waits for a free connection)."""
+        return self.ui_readers.get_stats()
+
+    def get_log_stats(self):
+        """Log sink counters (buffered, pending, dropped records)."""
+        return self.log_sink.get_stats()
+
+    def start_maintenance(self, **options):
+        """Starts background log/signal retention with incremental VACUUM (archives go to data/archive/<db name>)."""
+        if self.maintenance is None:
+            name = os.path.splitext(os.path.basename(self.db_path))[0]
+            options.setdefault('archive_dir', os.path.join(os.path.dirname(self.db_path), 'archive', name))
+            self.maintenance = DatabaseMaintenance(self.db_path, **options)
+            self.maintenance.start()
+        return self.maintenance
 
     def close_connection(self):
-        if self.conn: self.conn.close()
\ No newline at end of file
+        if self.maintenance:
+            self.maintenance.stop()
+        self.log_sink.close()
+        self.writer.close()
+        self.readers.close()
+        self.ui_readers.close()
\ No newline at end of file
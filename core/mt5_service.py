@@ -3,17 +3,24 @@ import time
 import pandas as pd
 from datetime import datetime, timedelta
 
+from utils.ttl_cache import TTLCache
+
 class MT5Service:
     """
     Manages all interactions with the MetaTrader 5 terminal.
     This final version includes all safety checks, logging, and required functions.
     """
-    def __init__(self, path, login, password, server):
+    def __init__(self, path, login, password, server, symbol_info_ttl=300.0, tick_ttl=0.5):
         self.path = path
         self.login = login
         self.password = password
         self.server = server
         self.is_initialized = False
+        # Static symbol metadata (digits, point, volume step, stops level) rarely changes; ticks go stale fast.
+        self.symbol_cache = TTLCache(symbol_info_ttl)
+        self.tick_cache = TTLCache(tick_ttl)
+        # Optional PropRiskGuard: vetoes new orders from its cached verdict (no terminal call)
+        self.risk_guard = None
 
     def _log_error(self, message):
         """Helper to print errors."""
@@ -33,12 +40,34 @@ class MT5Service:
         
         return round(normalized_price, symbol_info.digits)
 
+    def _symbol_info(self, symbol):
+        """Cached mt5.symbol_info (None results are not cached)."""
+        return self.symbol_cache.get_or_load(symbol, lambda: mt5.symbol_info(symbol))
+
+    def _tick(self, symbol):
+        """Cached mt5.symbol_info_tick with a sub-second TTL."""
+        return self.tick_cache.get_or_load(symbol, lambda: mt5.symbol_info_tick(symbol))
+
+    def invalidate_cache(self):
+        """Drops cached symbol metadata and ticks (called on connect/disconnect)."""
+        self.symbol_cache.invalidate()
+        self.tick_cache.invalidate()
+
+    def get_cache_stats(self):
+        """Hit/miss counters of the symbol_info and tick caches."""
+        return {'symbol_info': self.symbol_cache.get_stats(), 'tick': self.tick_cache.get_stats()}
+
+    def set_risk_guard(self, guard):
+        """Attaches a PropRiskGuard checked by place_order (None detaches)."""
+        self.risk_guard = guard
+
     def _format_symbol(self, symbol):
         if not isinstance(symbol, str):
             return None
         return symbol.replace("/", "").replace("-", "").replace("#", "").upper()
 
     def initialize(self):
+        self.invalidate_cache()
         try:
             if not mt5.initialize(path=self.path):
                 return False, f"MT5 initialize() failed: {mt5.last_error()}"
@@ -56,6 +85,7 @@ class MT5Service:
             return False, f"An error occurred during MT5 initialization: {e}"
 
     def shutdown(self):
+        self.invalidate_cache()
         if self.is_initialized:
             mt5.shutdown()
 
@@ -65,6 +95,19 @@ class MT5Service:
         info = mt5.account_info()
         return info._asdict() if info else None
         
+    def get_positions(self):
+        """All open positions as dicts, or None if the terminal did not answer."""
+        if not self.is_initialized:
+            return None
+        try:
+            positions = mt5.positions_get()
+            if positions is None:
+                return None
+            return [p._asdict() for p in positions]
+        except Exception as e:
+            self._log_error(f"Could not get positions: {e}")
+            return None
+
     def get_open_positions_by_ticket(self, tickets):
         if not self.is_initialized or not tickets:
             return []
@@ -101,35 +144,46 @@ class MT5Service:
             self._log_error(f"Could not get history deals: {e}")
             return None
 
+    def get_deals_since(self, date_from):
+        """Deals from date_from (UTC datetime) up to now; the end is padded a day for broker server time."""
+        if not self.is_initialized:
+            return None
+        try:
+            return mt5.history_deals_get(date_from, datetime.now() + timedelta(days=1))
+        except Exception as e:
+            self._log_error(f"Could not get history deals: {e}")
+            return None
+
     def close_position_by_ticket(self, ticket):
         if not self.is_initialized: return False, "MT5 not initialized."
         try:
             positions = mt5.positions_get(ticket=ticket)
             if not positions:
                 return False, f"No open position found for ticket {ticket}."
-            
-            position = positions[0]
-            symbol = position.symbol
-            volume = position.volume
-            order_type = position.type
+            return self._close_position(positions[0])
+        except Exception as e:
+            return False, f"Error closing position for ticket {ticket}: {e}"
 
-            close_action_type = mt5.ORDER_TYPE_SELL if order_type == mt5.ORDER_TYPE_BUY else mt5.ORDER_TYPE_BUY
-            price = mt5.symbol_info_tick(symbol).bid if order_type == mt5.ORDER_TYPE_BUY else mt5.symbol_info_tick(symbol).ask
+    def _close_position(self, position):
+        ticket = position.ticket
+        close_action_type = mt5.ORDER_TYPE_SELL if position.type == mt5.ORDER_TYPE_BUY else mt5.ORDER_TYPE_BUY
+        tick = self._tick(position.symbol)
+        if not tick:
+            return False, f"Could not get tick for {position.symbol}."
+        price = tick.bid if position.type == mt5.ORDER_TYPE_BUY else tick.ask
 
-            request = {
-                "action": mt5.TRADE_ACTION_DEAL, "position": ticket, "symbol": symbol,
-                "volume": volume, "type": close_action_type, "price": price, "deviation": 20,
-                "magic": 234000, "comment": "Closed by Bot", "type_time": mt5.ORDER_TIME_GTC,
-                "type_filling": mt5.ORDER_FILLING_IOC,
-            }
-            result = mt5.order_send(request)
+        request = {
+            "action": mt5.TRADE_ACTION_DEAL, "position": ticket, "symbol": position.symbol,
+            "volume": position.volume, "type": close_action_type, "price": price, "deviation": 20,
+            "magic": 234000, "comment": "Closed by Bot", "type_time": mt5.ORDER_TIME_GTC,
+            "type_filling": mt5.ORDER_FILLING_IOC,
+        }
+        result = mt5.order_send(request)
 
-            if result.retcode == mt5.TRADE_RETCODE_DONE:
-                return True, f"Successfully closed position for ticket {ticket}."
-            else:
-                return False, f"Failed to close position for ticket {ticket}: {result.comment}"
-        except Exception as e:
-            return False, f"Error closing position for ticket {ticket}: {e}"
+        if result.retcode == mt5.TRADE_RETCODE_DONE:
+            return True, f"Successfully closed position for ticket {ticket}."
+        else:
+            return False, f"Failed to close position for ticket {ticket}: {result.comment}"
 
     def cancel_pending_order(self, ticket):
         if not self.is_initialized: return False, "MT5 not initialized."
@@ -139,19 +193,20 @@ class MT5Service:
             return True, f"Successfully cancelled pending order {ticket}."
         else:
             return False, f"Failed to cancel order {ticket}: {result.comment}"
-            
+
+    def _breakeven_sl(self, position, pips_offset):
+        """Entry price plus pips_offset points in the position's favour, or None."""
+        symbol_info = self._symbol_info(position.symbol)
+        if not symbol_info: return None
+        if position.type == mt5.ORDER_TYPE_BUY: return position.price_open + (pips_offset * symbol_info.point)
+        if position.type == mt5.ORDER_TYPE_SELL: return position.price_open - (pips_offset * symbol_info.point)
+        return None
+
     def move_sl_to_breakeven(self, position, pips_offset=5):
         if not self.is_initialized or not position: return False, "Position not found"
-        symbol_info = mt5.symbol_info(position.symbol)
-        if not symbol_info: return False, f"Could not get info for {position.symbol}"
-        if position.type == mt5.ORDER_TYPE_BUY: new_sl_price = position.price_open + (pips_offset * symbol_info.point)
-        elif position.type == mt5.ORDER_TYPE_SELL: new_sl_price = position.price_open - (pips_offset * symbol_info.point)
-        else: return False, "Unsupported position type for breakeven."
-        normalized_sl = self._normalize_price(new_sl_price, symbol_info)
-        request = {"action": mt5.TRADE_ACTION_SLTP, "position": position.ticket, "sl": normalized_sl, "tp": position.tp}
-        result = mt5.order_send(request)
-        if result.retcode == mt5.TRADE_RETCODE_DONE: return True, f"Successfully moved SL for ticket {position.ticket}."
-        else: return False, f"Failed to modify SL for ticket {position.ticket}: {result.comment}"
+        new_sl_price = self._breakeven_sl(position, pips_offset)
+        if new_sl_price is None: return False, f"Could not compute breakeven for ticket {position.ticket}."
+        return self._modify_position(position, new_sl_price, None)
 
     def modify_position_sltp(self, ticket, new_sl=None, new_tp=None):
         if not self.is_initialized: return False, "MT5 not initialized."
@@ -159,34 +214,114 @@ class MT5Service:
         try:
             positions = mt5.positions_get(ticket=ticket)
             if not positions: return False, f"No open position found for ticket {ticket}."
-            position = positions[0]
-            symbol_info = mt5.symbol_info(position.symbol)
-            if not symbol_info: return False, f"Could not get info for {position.symbol}"
-            sl_to_set = new_sl if new_sl is not None else position.sl
-            tp_to_set = new_tp if new_tp is not None else position.tp
-            normalized_sl = self._normalize_price(sl_to_set, symbol_info)
-            normalized_tp = self._normalize_price(tp_to_set, symbol_info)
-            request = {"action": mt5.TRADE_ACTION_SLTP, "position": ticket, "sl": normalized_sl, "tp": normalized_tp}
-            result = mt5.order_send(request)
-            if result.retcode == mt5.TRADE_RETCODE_DONE: return True, f"Successfully modified position for ticket {ticket}."
-            else: return False, f"Failed to modify position for ticket {ticket}: {result.comment}"
+            return self._modify_position(positions[0], new_sl, new_tp)
         except Exception as e: return False, f"Error modifying position for ticket {ticket}: {e}"
 
+    def _modify_position(self, position, new_sl, new_tp):
+        ticket = position.ticket
+        symbol_info = self._symbol_info(position.symbol)
+        if not symbol_info: return False, f"Could not get info for {position.symbol}"
+        sl_to_set = new_sl if new_sl is not None else position.sl
+        tp_to_set = new_tp if new_tp is not None else position.tp
+        normalized_sl = self._normalize_price(sl_to_set, symbol_info)
+        normalized_tp = self._normalize_price(tp_to_set, symbol_info)
+        request = {"action": mt5.TRADE_ACTION_SLTP, "position": ticket, "sl": normalized_sl, "tp": normalized_tp}
+        result = mt5.order_send(request)
+        if result.retcode == mt5.TRADE_RETCODE_DONE: return True, f"Successfully modified position for ticket {ticket}."
+        else: return False, f"Failed to modify position for ticket {ticket}: {result.comment}"
+
+    # ----- Bulk operations over the legs of one signal -----
+    def _positions_by_ticket(self, tickets):
+        """One positions_get for all legs instead of one per ticket."""
+        wanted = {int(t) for t in tickets}
+        return {p.ticket: p for p in (mt5.positions_get() or ()) if p.ticket in wanted}
+
+    def modify_many(self, changes):
+        """
+        Applies (ticket, new_sl, new_tp) changes to several positions in one pass: positions are read
+        once and symbol info/ticks come from the caches, so each leg costs only its order_send.
+        Returns {ticket: (success, message)} in input order.
+        """
+        changes = [(int(ticket), sl, tp) for ticket, sl, tp in changes]
+        if not self.is_initialized:
+            return {ticket: (False, "MT5 not initialized.") for ticket, _, _ in changes}
+        try:
+            positions = self._positions_by_ticket(ticket for ticket, _, _ in changes)
+        except Exception as e:
+            return {ticket: (False, f"Error reading positions: {e}") for ticket, _, _ in changes}
+        results = {}
+        for ticket, new_sl, new_tp in changes:
+            position = positions.get(ticket)
+            if position is None:
+                results[ticket] = (False, f"No open position found for ticket {ticket}.")
+            elif new_sl is None and new_tp is None:
+                results[ticket] = (False, "No new SL or TP provided.")
+            else:
+                try: results[ticket] = self._modify_position(position, new_sl, new_tp)
+                except Exception as e: results[ticket] = (False, f"Error modifying position for ticket {ticket}: {e}")
+        return results
+
+    def move_many_to_breakeven(self, tickets, pips_offset=5):
+        """Breakeven for all open legs among tickets in one pass; closed legs are skipped. {ticket: (success, message)}"""
+        if not self.is_initialized:
+            return {}
+        try:
+            positions = self._positions_by_ticket(tickets)
+        except Exception as e:
+            self._log_error(f"Could not read positions for breakeven: {e}"); return {}
+        results = {}
+        for ticket, position in positions.items():
+            new_sl = self._breakeven_sl(position, pips_offset)
+            if new_sl is None:
+                results[ticket] = (False, f"Could not compute breakeven for ticket {ticket}."); continue
+            try: results[ticket] = self._modify_position(position, new_sl, None)
+            except Exception as e: results[ticket] = (False, f"Error modifying position for ticket {ticket}: {e}")
+        return results
+
+    def close_many(self, tickets):
+        """
+        Closes open positions among tickets and cancels the rest as pending orders, in one pass.
+        Returns {ticket: (status, message)} with status 'CLOSED', 'CANCELLED' or None on failure.
+        """
+        tickets = [int(t) for t in tickets]
+        if not self.is_initialized:
+            return {ticket: (None, "MT5 not initialized.") for ticket in tickets}
+        try:
+            positions = self._positions_by_ticket(tickets)
+        except Exception as e:
+            return {ticket: (None, f"Error reading positions: {e}") for ticket in tickets}
+        results = {}
+        for ticket in tickets:
+            try:
+                if ticket in positions:
+                    success, message = self._close_position(positions[ticket])
+                    results[ticket] = ('CLOSED' if success else None, message)
+                else:
+                    success, message = self.cancel_pending_order(ticket)
+                    results[ticket] = ('CANCELLED' if success else None, message)
+            except Exception as e:
+                results[ticket] = (None, f"Error closing ticket {ticket}: {e}")
+        return results
+
     def place_order(self, signal_data, volume_per_tp, source_comment="CombineTradeBot"):
         if not self.is_initialized:
             msg = "MT5 not initialized."; self._log_error(msg); return False, msg
+        if self.risk_guard:
+            allowed, reason = self.risk_guard.check()
+            if not allowed:
+                msg = f"Order vetoed by risk guard: {reason}"; self._log_error(msg); return False, msg
         
         raw_symbol = signal_data.get('symbol'); symbol = self._format_symbol(raw_symbol)
         if not symbol:
             msg = "Signal is missing a symbol."; self._log_error(msg); return False, msg
             
-        symbol_info = mt5.symbol_info(symbol)
+        symbol_info = self._symbol_info(symbol)
         if symbol_info is None:
             msg = f"Symbol '{symbol}' not found in MarketWatch."; self._log_error(msg); return False, msg
         if not symbol_info.visible:
             if not mt5.symbol_select(symbol, True):
                 msg = f"Failed to select/enable symbol '{symbol}'."; self._log_error(msg); return False, msg
-            time.sleep(0.1); symbol_info = mt5.symbol_info(symbol)
+            time.sleep(0.1); self.symbol_cache.invalidate(symbol); symbol_info = self._symbol_info(symbol)
         
         order_type_str = signal_data.get('order_type', '').upper()
         entry_price = signal_data.get('entry_price')
@@ -204,9 +339,12 @@ class MT5Service:
         
         is_buy_order = "BUY" in order_type_str
         
+        tick = self._tick(symbol)
         price = 0.0
         if action == mt5.TRADE_ACTION_DEAL:
-            price = mt5.symbol_info_tick(symbol).ask if is_buy_order else mt5.symbol_info_tick(symbol).bid
+            if not tick:
+                msg = f"Could not retrieve current tick for {symbol}."; self._log_error(msg); return False, msg
+            price = tick.ask if is_buy_order else tick.bid
             if not price or price == 0:
                 msg = f"Invalid market price for {symbol} (is zero)."; self._log_error(msg); return False, msg
         else:
@@ -237,7 +375,6 @@ class MT5Service:
                 if tp_level != 0 and abs(price - tp_level) < stops_level_dist:
                     msg = f"Take Profit {tp_level} is too close to price. Minimum distance is {stops_level_dist}"; self._log_error(msg); return False, msg
         
-        tick = mt5.symbol_info_tick(symbol)
         if tick: print(f"--- [MT5] DIAGNOSTIC: Current prices for {symbol}: Bid={tick.bid}, Ask={tick.ask}")
         else: print(f"--- [MT5] DIAGNOSTIC: Could not retrieve current tick for {symbol}.")
 
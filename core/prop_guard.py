@@ -7,44 +7,187 @@
 from core.prop_guard import PropRiskGuard
 guard = PropRiskGuard(daily_dd=0.055, max_dd=0.11, balance=10_000)
 
+# real-time: equity follows the account snapshot, orders are vetoed in place_order
+guard.attach(snapshot, flatten=lambda: mt5.close_many([p['ticket'] for p in snapshot.get_positions()]))
+mt5.set_risk_guard(guard)
+
 # inside on_new_candle loop:
-if not guard.can_trade(bot.balance + bot.profit_day, bot.balance):
+if not guard.can_trade():
     return None  # trading blocked for this candle
 
-# after each closed trade:
+# without a snapshot: feed equity yourself and/or realized PnL after each closed trade
+guard.update_equity(account['equity'], account['balance'])
 guard.update(real_pnl)
 """
 
+import threading
+import time
+
+DAY_SECONDS = 86400
+
+
 class PropRiskGuard:
-    """Simple day / overall drawdown limiter.
+    """Day / overall drawdown limiter on floating equity.
+
+    The daily limit is measured from the balance at the day's rollover, the
+    total limit from the initial balance. Every equity
+    update re-evaluates the limits and caches the verdict, so `check()` on the
+    order path is a couple of attribute reads and never calls the terminal.
 
     Args:
         daily_dd (float): 0.055 means 5.5 % max daily loss
         max_dd   (float): 0.11  means 11 % total loss allowed
         balance  (float): initial account balance
+        day_offset (int): seconds after 00:00 UTC when the trading day rolls over
+            (e.g. -7200 for a broker server on UTC+2)
     """
 
     def __init__(self, daily_dd: float = 0.055,
                  max_dd: float = 0.11,
-                 balance: float = 10_000.0):
+                 balance: float = 10_000.0,
+                 day_offset: int = 0):
         self.start_balance = balance
         self.daily_limit   = balance * daily_dd
         self.max_limit     = balance * max_dd
-        self.day_pl        = 0.0  # resets every new trading day
+        self.day_offset    = day_offset
+        self.day_pl        = 0.0  # realized PnL via update(); resets every new trading day
+
+        self._lock        = threading.Lock()
+        self.day          = None       # current trading day number
+        self.day_start    = balance    # balance the daily drawdown is measured from
+        self.equity       = balance
+        self.balance      = balance
+        self.min_equity   = balance
+        self.updated_at   = None
+        self.breach       = None       # reason string while trading is blocked
+        self.breach_kind  = None       # 'daily' (cleared on rollover) or 'max' (final)
+        self._flatten     = None
+        self._flattened   = False
+        self._unsubscribe = None
+
+    @classmethod
+    def from_settings(cls, settings, balance):
+        """Builds the guard from the 'prop_guard' settings section (initial_balance overrides balance)."""
+        cfg = settings.get('prop_guard', {})
+        return cls(daily_dd=cfg.get('daily_dd', 0.055), max_dd=cfg.get('max_dd', 0.11),
+                   balance=cfg.get('initial_balance') or balance,
+                   day_offset=int(cfg.get('day_offset_hours', 0) * 3600))
 
     # ----------------------------------------------------------
-    def can_trade(self, equity_today: float, equity_total: float) -> bool:
-        """Return False if any prop limit already violated."""
-        if self.day_pl <= -self.daily_limit:
-            return False
-        if equity_total <= self.start_balance - self.max_limit:
-            return False
-        return True
+    def check(self):
+        """O(1) veto for the order path: (allowed, reason)."""
+        self._roll_if_new_day()
+        breach = self.breach
+        return (False, breach) if breach else (True, "")
+
+    def can_trade(self, equity_today: float = None, equity_total: float = None) -> bool:
+        """Return False if any prop limit already violated (optionally feeding a fresh equity first)."""
+        if equity_total is not None:
+            self.update_equity(equity_total)
+        else:
+            self._roll_if_new_day()
+        return self.breach is None
 
     def update(self, pnl: float):
         """Call after each closed position (pnl in USD)."""
-        self.day_pl += pnl
+        with self._lock:
+            self.day_pl += pnl
+            self._evaluate()
 
     def reset_day(self):
-        """Call at the start of a new trading day."""
-        self.day_pl = 0.0
\ No newline at end of file
+        """Call at the start of a new trading day (done automatically on equity updates and checks)."""
+        with self._lock:
+            self._roll_day(self._day_of(time.time()))
+
+    # ----- Real-time equity -----
+    def _day_of(self, timestamp):
+        return int((timestamp - self.day_offset) // DAY_SECONDS)
+
+    def _roll_if_new_day(self):
+        """Rolls the day on the clock alone: a flat account after a daily breach publishes no snapshots."""
+        day = self._day_of(time.time())
+        if day != self.day:
+            with self._lock:
+                if day != self.day:
+                    self._roll_day(day)
+
+    def _roll_day(self, day):
+        self.day = day
+        self.day_pl = 0.0
+        self.day_start = self.balance
+        if self.breach_kind == 'daily':
+            self.breach, self.breach_kind = None, None
+            self._flattened = False
+
+    def update_equity(self, equity: float, balance: float = None, now: float = None):
+        """Feed the current floating equity (and balance); rolls the day over when the date changes."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if balance is not None:
+                self.balance = balance
+            day = self._day_of(now)
+            if day != self.day:
+                # A new day starts from the closed-trade balance, like the prop firms' daily limit
+                self._roll_day(day)
+            self.equity = equity
+            self.min_equity = min(self.min_equity, equity)
+            self.updated_at = now
+            breached = self._evaluate()
+        if breached and self._flatten:
+            self._flatten_positions()
+
+    def _evaluate(self):
+        """Updates the cached verdict; returns True on a breach that still needs flattening.
+
+        A breach is latched like a prop account rule: equity bouncing back does
+        not re-enable trading until the next day (daily) or at all (max).
+        """
+        if self.breach_kind != 'max':
+            if self.equity <= self.start_balance - self.max_limit:
+                self.breach, self.breach_kind = f"Max drawdown reached: equity {self.equity:.2f} <= {self.start_balance - self.max_limit:.2f}", 'max'
+                self._flattened = False  # a daily breach may already have flattened; positions opened since are closed too
+            elif self.breach_kind is None and self.equity <= self.day_start - self.daily_limit:
+                self.breach, self.breach_kind = f"Daily drawdown reached: equity {self.equity:.2f} <= {self.day_start - self.daily_limit:.2f}", 'daily'
+            elif self.breach_kind is None and self.day_pl <= -self.daily_limit:
+                self.breach, self.breach_kind = f"Daily realized loss reached: {self.day_pl:.2f}", 'daily'
+        return self.breach is not None and not self._flattened
+
+    def _flatten_positions(self):
+        with self._lock:
+            if self._flattened:
+                return
+            self._flattened = True
+        print(f"--- [PROP GUARD] {self.breach}. Closing all positions. ---")
+        try:
+            self._flatten()
+        except Exception as e:
+            print(f"--- [PROP GUARD] Flatten failed: {e} ---")
+
+    # ----- Snapshot stream -----
+    def on_snapshot(self, event):
+        """AccountSnapshotPoller subscriber: every poll with moving floating PnL publishes the new equity."""
+        account = event.get('account') or {}
+        if account.get('equity') is not None:
+            self.update_equity(account['equity'], account.get('balance'), event.get('time'))
+
+    def attach(self, snapshot, flatten=None):
+        """Follow a snapshot poller; flatten() is called once per breach if given."""
+        self._flatten = flatten
+        account = snapshot.get_account()
+        if account:
+            self.on_snapshot({'account': account})
+        self._unsubscribe = snapshot.subscribe(self.on_snapshot)
+
+    def stop(self):
+        """Detaches from the snapshot poller."""
+        if self._unsubscribe:
+            self._unsubscribe()
+            self._unsubscribe = None
+
+    def get_status(self):
+        with self._lock:
+            return {'equity': self.equity, 'balance': self.balance, 'day_start': self.day_start,
+                    'daily_floor': self.day_start - self.daily_limit,
+                    'total_floor': self.start_balance - self.max_limit,
+                    'min_equity': self.min_equity, 'day_pl': self.day_pl,
+                    'breach': self.breach, 'updated_at': self.updated_at}
\ No newline at end of file
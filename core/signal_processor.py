@@ -12,7 +12,7 @@ class SignalProcessor(QObject):
         self.channels = channels
 
     def update_settings(self, new_settings):
-        print("--- [PROCESSOR] Settings updated. ---")
+        self.db.add_log('DEBUG', "Settings updated.")
         self.settings = new_settings
 
     def update_channels(self, new_channels_dict):
@@ -26,7 +26,7 @@ class SignalProcessor(QObject):
         if weekday >= 5:
             symbol = channel_config.get('weekend_symbol')
             if symbol:
-                print(f"--- [CONTEXT] It's the weekend. Using weekend symbol: {symbol} ---")
+                self.db.add_log('INFO', f"It's the weekend. Using weekend symbol: {symbol}")
                 return symbol
         return channel_config.get('default_symbol')
 
@@ -40,16 +40,16 @@ class SignalProcessor(QObject):
         if not message_text:
             return
 
-        print(f"\n--- [PROCESSOR] New message from '{message_data.get('channel_name')}' ---")
+        self.db.add_log('INFO', f"New message from '{message_data.get('channel_name')}'")
         
         cancellation_keywords = ['cancel', 'отмена', 'close', 'закрыть', 'cancen', 'slose', 'not valid']
         if message_data.get('is_reply') and message_text.strip().lower() in cancellation_keywords:
-            print(f"--- [PROCESSOR] Hardcoded cancellation command '{message_text}' detected. Bypassing GPT. ---")
+            self.db.add_log('INFO', f"Hardcoded cancellation command '{message_text}' detected. Bypassing GPT.")
             self.handle_cancellation(message_data)
             return
 
         parsed_data = self.gpt.parse_signal(message_text)
-        print(f"--- [GPT] Parsed Data: {parsed_data} ---")
+        self.db.add_log('DEBUG', f"GPT parsed data: {parsed_data}")
         if not parsed_data:
             self.db.add_log('ERROR', "GPT parsing failed.")
             return
@@ -106,18 +106,18 @@ class SignalProcessor(QObject):
             self.db.add_log('INFO', f"Message from {parsed_data['channel_name']} did not contain a recognizable trade action.")
 
     def handle_full_signal(self, parsed_data):
-        print("--- [PROCESSOR] Handling as a full signal. ---")
+        self.db.add_log('DEBUG', "Handling as a full signal.")
         signal_id = self.db.add_signal(parsed_data, status='NEW')
         if signal_id:
             self._execute_trade(signal_id, parsed_data)
 
     def handle_partial_entry(self, parsed_data):
-        print(f"--- [PROCESSOR] Handling as a partial entry for {parsed_data.get('symbol')}. ---")
+        self.db.add_log('DEBUG', f"Handling as a partial entry for {parsed_data.get('symbol')}.")
         self.db.add_signal(parsed_data, status='PARTIAL_ENTRY')
         self.db.add_log('INFO', f"Partial signal with entry point saved. Waiting for SL/TP.")
 
     def handle_sl_tp_update(self, parsed_data, message_data):
-        print(f"--- [PROCESSOR] Handling as an SL/TP update for {parsed_data.get('symbol')}. ---")
+        self.db.add_log('DEBUG', f"Handling as an SL/TP update for {parsed_data.get('symbol')}.")
         partial_signal = None
         if message_data.get('is_reply'):
             original_msg_id = message_data.get('reply_to_msg_id')
@@ -133,7 +133,7 @@ class SignalProcessor(QObject):
         self._execute_trade(full_signal_data['id'], full_signal_data)
         
     def handle_modification(self, parsed_data, message_data):
-        print("--- [PROCESSOR] Modification command received. ---")
+        self.db.add_log('DEBUG', "Modification command received.")
         if not message_data.get('is_reply'):
             self.db.add_log("WARNING", "Modification ignored: it was not a reply."); return
         
@@ -142,20 +142,17 @@ class SignalProcessor(QObject):
         if not original_signal:
             self.db.add_log("WARNING", f"Could not find original signal for replied message ID {original_msg_id} to modify."); return
         
-        tickets_json = original_signal['mt5_tickets']
-        if not tickets_json:
+        tickets = self.db.get_signal_tickets(original_signal['id'])
+        if not tickets:
             self.db.add_log("WARNING", f"Original signal ID {original_signal['id']} has no MT5 tickets to modify."); return
         
         try:
-            tickets = json.loads(tickets_json)
             new_sl = parsed_data.get('stop_loss')
             new_tp = parsed_data.get('take_profits')[0] if parsed_data.get('take_profits') else None
             
-            print(f"--- [PROCESSOR] Modifying tickets {tickets} for signal ID {original_signal['id']} with SL: {new_sl}, TP: {new_tp} ---")
-            for ticket in tickets:
-                success, msg = self.mt5.modify_position_sltp(ticket, new_sl, new_tp)
-                if success: self.db.add_log("SUCCESS", f"Ticket {ticket} modified successfully.")
-                else: self.db.add_log("ERROR", f"Failed to modify ticket {ticket}: {msg}")
+            self.db.add_log('INFO', f"Modifying tickets {tickets} for signal ID {original_signal['id']} with SL: {new_sl}, TP: {new_tp}")
+            results = self.mt5.modify_many([(ticket, new_sl, new_tp) for ticket in tickets])
+            self._log_bulk_result("Modified", original_signal['id'], results)
             
             # Обновляем запись в БД новыми данными
             updated_tps = [new_tp] if new_tp is not None else json.loads(original_signal['take_profits'])
@@ -172,7 +169,7 @@ class SignalProcessor(QObject):
         if volume_per_tp < 0.01:
             self.db.update_signal_status(signal_id, 'ERROR_INVALID_VOLUME'); return
 
-        print(f"--- [PROCESSOR] Calling MT5 to place trade for signal ID {signal_id} ---")
+        self.db.add_log('INFO', f"Calling MT5 to place trade for signal ID {signal_id}")
         success, message = self.mt5.place_order(trade_data, volume_per_tp)
         
         if success:
@@ -184,12 +181,12 @@ class SignalProcessor(QObject):
                 self.db.update_signal_status(signal_id, 'ERROR_TICKET_PARSE')
         else:
             error_log = f"--- [PROCESSOR] Failed to place trade for signal ID {signal_id}. Reason: {message} ---"
-            print(error_log); self.db.add_log('ERROR', error_log)
+            self.db.add_log('ERROR', error_log)
             self.db.update_signal_status(signal_id, 'ERROR_MT5')
 
     def handle_cancellation(self, message_data):
         log_msg = "--- [PROCESSOR] Cancellation command received. Trying to find original signal... ---"
-        print(log_msg); self.db.add_log("INFO", log_msg)
+        self.db.add_log("INFO", log_msg)
 
         if not message_data.get('is_reply'):
             self.db.add_log("WARNING", "Cancellation received, but it was not a reply."); return
@@ -199,20 +196,18 @@ class SignalProcessor(QObject):
             self.db.add_log("WARNING", f"Could not find original signal for replied message ID {message_data.get('reply_to_msg_id')}."); return
         
         signal_id = original_signal['id']
-        tickets_json = original_signal['mt5_tickets']
-        if not tickets_json:
+        tickets = self.db.get_signal_tickets(signal_id, status='OPEN')
+        if not tickets:
             self.db.update_signal_status(signal_id, 'CANCELLED'); return
 
-        try:
-            tickets = json.loads(tickets_json)
-            for ticket in tickets:
-                close_success, close_msg = self.mt5.close_position_by_ticket(ticket)
-                if close_success: self.db.add_log("SUCCESS", f"Ticket {ticket} closed successfully."); continue
-                if "No open position found" in close_msg:
-                    cancel_success, cancel_msg = self.mt5.cancel_pending_order(ticket)
-                    if cancel_success: self.db.add_log("SUCCESS", f"Pending order {ticket} cancelled.")
-                    else: self.db.add_log("ERROR", f"Failed to cancel pending order {ticket}: {cancel_msg}")
-                else: self.db.add_log("ERROR", f"Could not close market position {ticket}: {close_msg}")
-            self.db.update_signal_status(signal_id, 'CANCELLED')
-        except json.JSONDecodeError:
-            self.db.add_log("ERROR", f"Could not parse tickets for signal ID {signal_id}.")
\ No newline at end of file
+        # Open positions are closed and the remaining legs cancelled as pending orders in one pass
+        results = self.mt5.close_many(tickets)
+        self._log_bulk_result("Closed/cancelled", signal_id, {t: (status is not None, msg) for t, (status, msg) in results.items()})
+        self.db.update_tickets_status({t: status for t, (status, _) in results.items()}, {signal_id: 'CANCELLED'})
+
+    def _log_bulk_result(self, action, signal_id, results):
+        """One log entry per bulk operation; failed legs are listed with their reasons."""
+        failed = {t: msg for t, (ok, msg) in results.items() if not ok}
+        done = len(results) - len(failed)
+        if done: self.db.add_log("SUCCESS", f"{action} {done}/{len(results)} tickets of signal ID {signal_id}.")
+        if failed: self.db.add_log("ERROR", f"Signal ID {signal_id}: " + "; ".join(f"ticket {t}: {msg}" for t, msg in failed.items()))
\ No newline at end of file
@@ -1,108 +1,171 @@
-import time
-import json
+import threading
 from PySide6.QtCore import QObject, QThread, Signal
 import MetaTrader5 as mt5
 
+from utils.deal_feed import DealFeed
+
+# Deal feed poll interval (seconds) without a snapshot stream, and the safety-net poll when closes are pushed
+POLL_INTERVAL = 2.0
+FALLBACK_POLL_INTERVAL = 15.0
+
 class TradeManagerService(QObject):
     """
     A background service that actively manages open trades.
     Its primary responsibility is to monitor active signals and move the
     Stop Loss to breakeven only after a real Take Profit event.
+
+    Event-driven: closing deals arrive from the incremental deal feed, and a
+    position closed in the account snapshot triggers an immediate feed poll,
+    so breakeven follows a TP fill within one snapshot interval. Open legs of
+    active signals are kept in memory (ticket -> signal) and are loaded from
+    the database once; legs of newer signals are resolved by ticket on demand.
     """
     log_signal = Signal(str, str)
 
-    def __init__(self, db_service, mt5_service, settings, parent=None):
+    def __init__(self, db_service, mt5_service, settings, snapshot=None, parent=None):
         super().__init__(parent)
         self.db = db_service
         self.mt5 = mt5_service
         self.settings = settings
+        self.snapshot = snapshot
         self.is_running = False
+        # Fetches only deals newer than the last seen ticket and stores them in the local deals table
+        self.deal_feed = DealFeed(self.mt5.get_deals_since, store=self.db)
+
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._ticket_owner = {}   # open leg ticket -> signal_id
+        self._signals = {}        # signal_id -> {'symbol', 'tickets', 'breakeven'}
+        self._foreign = set()     # tickets known not to belong to an active signal
+        self.stats = {'deals': 0, 'tp_hits': 0, 'breakevens': 0, 'lookups': 0}
 
     def update_settings(self, new_settings):
         """Applies new settings to the running service."""
-        print("--- [TRADE MANAGER] Settings updated. ---")
+        self.db.add_log('DEBUG', "Trade manager settings updated.")
         self.settings = new_settings
 
-    def start_monitoring(self):
-        """Starts the trade monitoring loop."""
-        self.is_running = True
-        print("--- [TRADE MANAGER] Starting trade monitoring... ---")
-        
-        while self.is_running:
-            try:
-                be_settings = self.settings.get('breakeven', {})
-                if not be_settings.get('enabled', False):
-                    time.sleep(30)
+    # ----- Signal -> ticket map -----
+    def _load_active_legs(self):
+        """Builds the in-memory map from the ticket index (once per start)."""
+        with self._lock:
+            self._ticket_owner.clear(); self._signals.clear(); self._foreign.clear()
+            for leg in self.db.get_active_signal_tickets():
+                self._add_leg(leg['signal_id'], leg['symbol'], leg['ticket'])
+
+    def _add_leg(self, signal_id, symbol, ticket):
+        self._ticket_owner[ticket] = signal_id
+        signal = self._signals.setdefault(signal_id, {'symbol': symbol, 'tickets': [], 'breakeven': False})
+        if ticket not in signal['tickets']:
+            signal['tickets'].append(ticket)
+
+    def _is_active(self, ticket):
+        """Status check on a TP hit only (the signal may have been cancelled or modified meanwhile)."""
+        signal = self.db.get_signal_by_ticket(ticket)
+        return bool(signal) and signal['status'] == 'PROCESSED_ACTIVE'
+
+    def _owner(self, ticket):
+        """Signal of a leg; unknown tickets are looked up once via the ticket index."""
+        signal_id = self._ticket_owner.get(ticket)
+        if signal_id is not None or ticket in self._foreign:
+            return signal_id
+        self.stats['lookups'] += 1
+        signal = self.db.get_signal_by_ticket(ticket)
+        if not signal or signal['status'] != 'PROCESSED_ACTIVE':
+            self._foreign.add(ticket)
+            return None
+        for leg_ticket in self.db.get_signal_tickets(signal['id'], status='OPEN'):
+            self._add_leg(signal['id'], signal['symbol'], leg_ticket)
+        return self._ticket_owner.get(ticket)
+
+    # ----- Events -----
+    def _on_snapshot(self, event):
+        """A position disappeared from the snapshot: fetch its closing deal right away."""
+        if event.get('closed'):
+            self.deal_feed.poll()
+
+    def _on_deals(self, deals):
+        """Deal feed subscriber: marks closed legs and moves the rest of a signal to breakeven after a TP."""
+        be_settings = self.settings.get('breakeven', {})
+        with self._lock:
+            self.stats['deals'] += len(deals)
+            closed, tp_hits, touched = {}, [], set()
+            for d in deals:
+                if d['entry'] != mt5.DEAL_ENTRY_OUT:
+                    continue
+                signal_id = self._owner(d['position_id'])
+                if signal_id is None:
                     continue
+                self._ticket_owner.pop(d['position_id'], None)
+                closed[d['position_id']] = 'CLOSED'
+                touched.add(signal_id)
+                signal = self._signals[signal_id]
+                signal['tickets'].remove(d['position_id'])
+                # Если позиция закрыта с прибылью - это срабатывание TP
+                if d['profit'] > 0 and not signal['breakeven'] and signal_id not in tp_hits and self._is_active(d['position_id']):
+                    tp_hits.append(signal_id)
+                    self.db.add_log('INFO', f"Ticket {d['position_id']} of signal {signal_id} was closed with profit.")
+            if not closed:
+                return
 
-                active_signals = self.db.get_active_signals_for_management()
+            signal_statuses = {}
+            if be_settings.get('enabled', False):
+                for signal_id in tp_hits:
+                    signal = self._signals[signal_id]
+                    signal['breakeven'] = True
+                    signal_statuses[signal_id] = 'BREAKEVEN_SET'
+                    self._move_to_breakeven(signal_id, signal, be_settings.get('pips', 5))
+            # Сигнал без открытых ног больше не отслеживается
+            for signal_id in touched:
+                if not self._signals[signal_id]['tickets']:
+                    del self._signals[signal_id]
+        self.db.update_tickets_status(closed, signal_statuses)
 
-                if active_signals:
-                    # Получаем историю сделок за последний день для анализа
-                    deals = self.mt5.get_deals_in_history(days=1)
-                    if deals is not None:
-                        self._check_signals_for_breakeven(active_signals, deals)
+    def _move_to_breakeven(self, signal_id, signal, pips_offset):
+        self.stats['tp_hits'] += 1
+        log_msg = f"Confirmed TP hit for signal ID {signal_id} ({signal['symbol']}). Moving SL to breakeven..."
+        self.db.add_log('INFO', log_msg)
+        self.log_signal.emit(log_msg, "INFO")
+        # Оставшиеся открытые ноги сигнала переносятся одним проходом
+        for ticket, (success, message) in self.mt5.move_many_to_breakeven(list(signal['tickets']), pips_offset).items():
+            if success:
+                self.stats['breakevens'] += 1
+                self.log_signal.emit(f"Breakeven set for ticket {ticket}.", "SUCCESS")
+            else:
+                self.log_signal.emit(f"Failed to set breakeven for ticket {ticket}: {message}", "ERROR")
 
-            except Exception as e:
-                log_msg = f"--- [TRADE MANAGER] Error in monitoring loop: {e} ---"
-                print(log_msg)
-                self.log_signal.emit(log_msg, "ERROR")
+    # ----- Loop -----
+    def start_monitoring(self):
+        """Subscribes to deal and snapshot events; the loop only polls the feed as a safety net."""
+        self.is_running = True
+        self._wakeup.clear()
+        self.db.add_log('INFO', "Trade manager: starting trade monitoring.")
+        self._load_active_legs()
+        unsubscribers = [self.deal_feed.subscribe(self._on_deals)]
+        if self.snapshot is not None:
+            unsubscribers.append(self.snapshot.subscribe(self._on_snapshot))
+        default_interval = FALLBACK_POLL_INTERVAL if self.snapshot is not None else POLL_INTERVAL
 
-            time.sleep(15) # Check every 15 seconds
-
-        print("--- [TRADE MANAGER] Trade monitoring stopped. ---")
-
-    def _check_signals_for_breakeven(self, signals, deals):
-        """
-        Processes active signals to check for breakeven conditions based on actual deal history.
-        """
-        pips_offset = self.settings.get('breakeven', {}).get('pips', 5)
-        
-        # Преобразуем историю сделок в словарь для быстрого доступа
-        # Ключ - ID позиции, значение - сама сделка
-        closed_positions = {d.position_id: d for d in deals if d.entry == mt5.DEAL_ENTRY_OUT}
-
-        for signal in signals:
-            signal_id = signal['id']
-            symbol = signal['symbol']
-            tickets_json = signal['mt5_tickets']
-            
+        while self.is_running:
             try:
-                if not tickets_json: continue
-                original_tickets = json.loads(tickets_json)
-                if not original_tickets: continue
-                
-                # Проверяем, был ли какой-то из наших ордеров закрыт с прибылью
-                tp_hit = False
-                for ticket in original_tickets:
-                    # Если тикет есть в словаре закрытых позиций и его прибыль > 0
-                    if ticket in closed_positions and closed_positions[ticket].profit > 0:
-                        tp_hit = True
-                        print(f"--- [TRADE MANAGER] Detected that ticket {ticket} for signal {signal_id} was closed with profit.")
-                        break # Нашли закрытие по TP, можно выходить из цикла
-                
-                if tp_hit:
-                    log_msg = f"--- [TRADE MANAGER] Confirmed TP hit for signal ID {signal_id} ({symbol}). Moving SL to breakeven... ---"
-                    print(log_msg)
-                    self.log_signal.emit(log_msg, "INFO")
-
-                    # Получаем оставшиеся открытые позиции по этому сигналу
-                    open_positions = self.mt5.get_open_positions_by_ticket(tuple(original_tickets))
-                    for position in open_positions:
-                        success, message = self.mt5.move_sl_to_breakeven(position, pips_offset)
-                        if success:
-                            self.log_signal.emit(f"Breakeven set for ticket {position.ticket}.", "SUCCESS")
-                        else:
-                            self.log_signal.emit(f"Failed to set breakeven for ticket {position.ticket}: {message}", "ERROR")
-                    
-                    self.db.update_signal_status(signal_id, 'BREAKEVEN_SET')
-            
-            except json.JSONDecodeError:
-                log_msg = f"--- [TRADE MANAGER] Could not parse tickets for signal ID {signal_id}. ---"
-                print(log_msg)
+                self.deal_feed.poll()
+            except Exception as e:
+                log_msg = f"Trade manager error in monitoring loop: {e}"
+                self.db.add_log('ERROR', log_msg)
                 self.log_signal.emit(log_msg, "ERROR")
-                self.db.update_signal_status(signal_id, "ERROR_TICKET_PARSE")
+            self._wakeup.wait(self.settings.get('breakeven', {}).get('poll_interval', default_interval))
+            self._wakeup.clear()
+
+        for unsubscribe in unsubscribers:
+            unsubscribe()
+        self.db.add_log('INFO', "Trade manager: trade monitoring stopped.")
+
+    def get_stats(self):
+        """Event counters plus the size of the in-memory leg map."""
+        with self._lock:
+            return dict(self.stats, open_legs=len(self._ticket_owner), signals=len(self._signals),
+                        feed=self.deal_feed.get_stats())
 
     def stop(self):
         """Stops the monitoring loop."""
-        self.is_running = False
\ No newline at end of file
+        self.is_running = False
+        self._wakeup.set()
\ No newline at end of file
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Обслуживание базы данных торговой системы (data/trading.db)
+
+Примеры:
+    python db_maintenance.py rebuild-stats
+    python db_maintenance.py compact
+    python db_maintenance.py compact --db data/combine_trade_bot.db --log-days 14 --format jsonl.gz
+    python db_maintenance.py export --export-format arrow --since 2024-01
+"""
+
+import argparse
+import os
+
+from config import DB_MAINTENANCE_CONFIG
+from utils.db_maintenance import DatabaseMaintenance
+
+
+def rebuild_stats(args):
+    """Полный пересчёт дневной статистики по закрытым сделкам"""
+    from services.database_service import DatabaseService
+
+    db = DatabaseService(args.db)
+    try:
+        rows = db.rebuild_statistics()
+        print(f"Статистика пересчитана: {rows} дневных строк")
+    finally:
+        db.close()
+
+
+def compact(args):
+    """Разовый проход ретеншна: архив логов и сигналов + инкрементальный VACUUM (старая база один раз переводится в auto_vacuum=INCREMENTAL)"""
+    options = dict(DB_MAINTENANCE_CONFIG)
+    options.pop('interval', None)
+    if args.log_days is not None:
+        options['log_retention_days'] = args.log_days
+    if args.signal_days is not None:
+        options['signal_retention_days'] = args.signal_days
+    if args.format:
+        options['archive_format'] = args.format
+    name = os.path.splitext(os.path.basename(args.db))[0]
+    archive_dir = args.archive_dir or os.path.join(os.path.dirname(args.db), 'archive', name)
+
+    size_before = os.path.getsize(args.db)
+    report = DatabaseMaintenance(args.db, archive_dir=archive_dir, **options).run_once(convert_vacuum=True)
+    size_after = os.path.getsize(args.db)
+    print(f"Логов в архиве: {report['logs_archived']}, сигналов в архиве: {report['signals_archived']}")
+    print(f"Освобождено страниц: {report['pages_freed']}, размер: {size_before / 1024:.0f} KB -> {size_after / 1024:.0f} KB")
+    print(f"Архивы: {archive_dir}")
+
+
+def export(args):
+    """Выгрузка trades/signals в помесячные Parquet/Arrow IPC файлы для офлайн-анализа"""
+    from utils.columnar_export import export_all
+
+    report = export_all(args.db, args.out_dir, args.export_format, args.since)
+    for table, months in report.items():
+        print(f"{table}: {sum(months.values())} строк, {len(months)} месяцев")
+    print(f"Файлы: {os.path.abspath(args.out_dir)}")
+
+
+COMMANDS = {
+    'rebuild-stats': rebuild_stats,
+    'compact': compact,
+    'export': export,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание базы данных")
+    parser.add_argument('command', choices=sorted(COMMANDS), help="Команда")
+    parser.add_argument('--db', default='data/trading.db', help="Путь к базе данных")
+    parser.add_argument('--log-days', type=int, default=None, help="compact: хранить логи N дней")
+    parser.add_argument('--signal-days', type=int, default=None, help="compact: хранить завершённые сигналы N дней")
+    parser.add_argument('--format', choices=['sqlite', 'jsonl.gz'], default=None, help="compact: формат архива логов")
+    parser.add_argument('--archive-dir', default=None, help="compact: папка архивов (по умолчанию data/archive/<имя базы>)")
+    parser.add_argument('--out-dir', default='data/export', help="export: папка выгрузки")
+    parser.add_argument('--export-format', choices=['parquet', 'arrow'], default='parquet', help="export: формат файлов")
+    parser.add_argument('--since', default=None, help="export: выгружать месяцы начиная с YYYY-MM")
+    args = parser.parse_args()
+
+    COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,14 @@ import threading
 import json
 import os
 
+from utils.settings_store import SettingsStore
+
+DEFAULT_SETTINGS = {
+    "telegram": {}, "gpt": {}, "mt5": {}, "trading": {}, "breakeven": {},
+    "signal_parser": {"enabled": True},
+    "ai_trader": {"enabled": False, "lot_size": 0.01, "live_trading": False}
+}
+
 # Предполагается, что все сервисы будут перемещены и адаптированы
 # from core.database_service import DatabaseService
 # from core.gpt_service import GptService
@@ -16,7 +24,12 @@ class LogicManager:
     """
     def __init__(self, page):
         self.page = page # Для отправки обновлений в UI через pubsub
-        self.settings = self._load_config_file("data/config.json")
+        # Один общий на процесс кэш data/config.json: чтения из памяти, запись атомарная
+        self.settings_store = SettingsStore.shared_json("data/config.json", DEFAULT_SETTINGS)
+        if self.settings_store.load_error:
+            print(f"ERROR: Не удалось загрузить data/config.json: {self.settings_store.load_error}")
+        self.settings = self.settings_store.get_all()
+        self.settings_store.subscribe(self._on_settings_changed)
         self.channels = self._load_config_file("data/channels.json", is_channels=True)
         self.is_bot_running = False
         self.backend_services = {}
@@ -27,11 +40,7 @@ class LogicManager:
         try:
             os.makedirs(os.path.dirname(path), exist_ok=True)
             if not os.path.exists(path):
-                default = {} if is_channels else {
-                    "telegram": {}, "gpt": {}, "mt5": {}, "trading": {}, "breakeven": {},
-                    "signal_parser": {"enabled": True},
-                    "ai_trader": {"enabled": False, "lot_size": 0.01, "live_trading": False}
-                }
+                default = {} if is_channels else DEFAULT_SETTINGS
                 with open(path, "w", encoding="utf-8") as f:
                     json.dump(default, f, indent=4)
             with open(path, "r", encoding="utf-8") as f:
@@ -76,12 +85,17 @@ class LogicManager:
         self.page.pubsub.send_all({"type": "status", "service": "main", "data": "STOPPED"})
         print("INFO: Все сервисы остановлены.")
 
+    def _on_settings_changed(self, changes):
+        """Подписка на хранилище: обновляет копию настроек и рассылает изменения сервисам"""
+        self.settings = self.settings_store.get_all()
+        for service in self.backend_services.values():
+            if hasattr(service, 'update_settings'):
+                service.update_settings(self.settings)
+
     def save_settings(self, new_settings):
         """Сохраняет новые настройки в config.json"""
-        self.settings = new_settings
         try:
-            with open("data/config.json", "w", encoding="utf-8") as f:
-                json.dump(self.settings, f, indent=4)
+            self.settings_store.update(new_settings)
             print("INFO: Настройки сохранены.")
             return True
         except Exception as e:
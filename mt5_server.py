@@ -1,9 +1,27 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import MetaTrader5 as mt5
+import functools
+import itertools
 import json
 import logging
-from datetime import datetime
-from typing import Dict, Any, Optional
+import math
+import numpy as np
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional
+
+from utils.account_snapshot import diff_positions
+from utils.rates_codec import (ARROW_MEDIA_TYPE, JSON_MEDIA_TYPE, RATES_STREAM_MEDIA_TYPE, NDJSON_MEDIA_TYPE,
+                               negotiate, encode_rates, encode_rates_arrow,
+                               encode_frame, end_frame)
+from utils.bar_store import TIMEFRAME_SECONDS, range_windows
+from utils.synthetic_market import YEAR_SECONDS, generate_bars, symbol_profile
+from utils.ttl_cache import TTLCache
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -11,16 +29,126 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# Размер блока /historical_data в барах (год M1 ~ 370 000 баров -> 8 блоков по ~2.6 МБ)
+HISTORY_CHUNK_BARS = 50000
+
+# Приоритеты очереди MT5Executor: торговые операции обгоняют чтения, фоновый опрос - последний
+PRIORITY_ORDER = 0
+PRIORITY_READ = 1
+PRIORITY_BACKGROUND = 2
+
+
+class MT5Executor:
+    """
+    Единственный поток, владеющий всеми вызовами mt5.*.
+    
+    Модуль MetaTrader5 не рассчитан на вызовы из разных потоков, поэтому
+    обработчики HTTP (их много - сервер многопоточный) только ставят задачу в
+    очередь с приоритетом и ждут результат. Ордера выполняются раньше
+    накопившихся чтений; /health в очередь не ходит вовсе, поэтому медленный
+    order_send не блокирует проверку состояния. Вызов из самого потока
+    исполнителя выполняется сразу (вложенные методы MT5Server).
+    """
+    
+    def __init__(self, name: str = "mt5-executor"):
+        self.name = name
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"calls": 0, "errors": 0, "max_wait_ms": 0.0, "busy_ms": 0.0,
+                       "by_priority": {PRIORITY_ORDER: 0, PRIORITY_READ: 0, PRIORITY_BACKGROUND: 0}}
+    
+    def in_executor(self) -> bool:
+        return threading.current_thread() is self._thread
+    
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+    
+    def submit(self, fn, *args, priority: int = PRIORITY_READ, **kwargs) -> Future:
+        """Ставит вызов в очередь; результат - в Future"""
+        future = Future()
+        self._ensure_running()
+        # Порядковый номер сохраняет FIFO внутри одного приоритета
+        self._queue.put((priority, next(self._sequence), time.perf_counter(), fn, args, kwargs, future))
+        return future
+    
+    def call(self, fn, *args, priority: int = PRIORITY_READ, timeout: Optional[float] = None, **kwargs):
+        """Выполняет fn в потоке исполнителя и возвращает результат (исключения пробрасываются)"""
+        if self.in_executor():
+            return fn(*args, **kwargs)
+        return self.submit(fn, *args, priority=priority, **kwargs).result(timeout)
+    
+    def _run(self):
+        while True:
+            priority, _, queued_at, fn, args, kwargs, future = self._queue.get()
+            if fn is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            try:
+                future.set_result(fn(*args, **kwargs))
+                failed = False
+            except BaseException as e:
+                future.set_exception(e)
+                failed = True
+            finished = time.perf_counter()
+            with self._lock:
+                self._stats["calls"] += 1
+                self._stats["errors"] += failed
+                self._stats["by_priority"][priority] = self._stats["by_priority"].get(priority, 0) + 1
+                self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], (started - queued_at) * 1000)
+                self._stats["busy_ms"] += (finished - started) * 1000
+    
+    def stop(self, timeout: float = 5.0):
+        """Останавливает поток после уже поставленных задач"""
+        with self._lock:
+            thread = self._thread
+        if thread is None:
+            return
+        self._queue.put((PRIORITY_BACKGROUND + 1, next(self._sequence), time.perf_counter(), None, (), {}, None))
+        thread.join(timeout)
+        with self._lock:
+            self._thread = None
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Счётчики вызовов, максимальное ожидание в очереди и её текущая глубина"""
+        with self._lock:
+            stats = dict(self._stats, by_priority=dict(self._stats["by_priority"]))
+        stats["queue_depth"] = self._queue.qsize()
+        return stats
+
+
+def on_executor(priority: int):
+    """Выполнять метод MT5Server в потоке self.executor с заданным приоритетом"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            return self.executor.call(method, self, *args, priority=priority, **kwargs)
+        return wrapper
+    return decorator
+
 class MT5Server:
     """Сервер для работы с MT5"""
     
-    def __init__(self):
+    def __init__(self, symbol_info_ttl: float = 300.0, demo_seed: Optional[int] = None):
         self.initialized = False
         self.account_info = None
         self.demo_mode = True  # Режим демо по умолчанию
+        # Один генератор на сервер: демо котировки не повторяются от запроса к запросу
+        self.demo_rng = np.random.default_rng(demo_seed)
+        self.executor = MT5Executor()
+        # Параметры символов почти не меняются - отдаём из памяти, не занимая очередь MT5
+        self.symbol_cache = TTLCache(symbol_info_ttl)
         
+    @on_executor(PRIORITY_ORDER)
     def initialize(self, path: str = None, login: int = None, password: str = None, server: str = None):
         """Инициализация подключения к MT5"""
+        self.symbol_cache.invalidate()
         try:
             # Если указан путь к MT5, пробуем подключиться
             if path:
@@ -53,8 +181,10 @@ class MT5Server:
             logger.error(f"Ошибка инициализации MT5: {e}")
             return False, str(e)
     
+    @on_executor(PRIORITY_ORDER)
     def shutdown(self):
         """Закрытие подключения к MT5"""
+        self.symbol_cache.invalidate()
         if self.initialized and not self.demo_mode:
             mt5.shutdown()
             self.initialized = False
@@ -83,34 +213,49 @@ class MT5Server:
             "positions": []
         }
     
+    def get_demo_rates_array(self, symbol: str, timeframe: str, count: int = 10):
+        """Демо котировки в виде структурированного массива (от старых баров к новым)"""
+        return generate_bars(symbol, timeframe if timeframe in TIMEFRAME_SECONDS else "H1", count,
+                             end=int(time.time()), seed=self.demo_rng)
+    
+    def iter_demo_rates_range(self, symbol: str, timeframe: str, start: datetime, end: datetime,
+                              chunk_bars: int = HISTORY_CHUNK_BARS):
+        """Демо история блоками: синтетический рынок, цена продолжается между блоками"""
+        timeframe = timeframe if timeframe in TIMEFRAME_SECONDS else "H1"
+        price = None
+        for window_start, window_end in range_windows(start, end, timeframe, chunk_bars):
+            rates = generate_bars(symbol, timeframe, start=window_start, end=window_end,
+                                  seed=self.demo_rng, price=price)
+            if len(rates):
+                price = float(rates['close'][-1])
+            yield rates
+    
     def get_demo_rates(self, symbol: str, timeframe: str, count: int = 10):
         """Демо котировки"""
-        import random
-        from datetime import datetime, timedelta
-        
-        # Генерируем демо-данные
-        base_price = 1.2000 if "EUR" in symbol else 1.3000 if "GBP" in symbol else 110.0
-        rates = []
-        
-        for i in range(count):
-            timestamp = datetime.now() - timedelta(minutes=i)
-            price = base_price + random.uniform(-0.01, 0.01)
-            rates.append({
-                "time": timestamp.isoformat(),
-                "open": price,
-                "high": price + random.uniform(0, 0.005),
-                "low": price - random.uniform(0, 0.005),
-                "close": price + random.uniform(-0.002, 0.002),
-                "tick_volume": random.randint(100, 1000)
+        return self._rates_response(symbol, timeframe, self.get_demo_rates_array(symbol, timeframe, count))
+    
+    @staticmethod
+    def _rates_response(symbol: str, timeframe: str, rates) -> Dict[str, Any]:
+        """JSON-совместимый ответ /rates из массива баров"""
+        rates_data = []
+        for rate in rates:
+            rates_data.append({
+                "time": datetime.fromtimestamp(int(rate['time'])).isoformat(),
+                "open": float(rate['open']),
+                "high": float(rate['high']),
+                "low": float(rate['low']),
+                "close": float(rate['close']),
+                "tick_volume": int(rate['tick_volume'])
             })
         
         return {
             "success": True,
             "symbol": symbol,
             "timeframe": timeframe,
-            "rates": rates
+            "rates": rates_data
         }
     
+    @on_executor(PRIORITY_ORDER)
     def send_order(self, symbol: str, volume: float, order_type: str, 
                    price: Optional[float] = None, sl: Optional[float] = None, 
                    tp: Optional[float] = None, comment: str = "Cursor Bot") -> Dict[str, Any]:
@@ -135,9 +280,9 @@ class MT5Server:
             if not mt5.symbol_select(symbol, True):
                 return {"success": False, "error": f"Не удалось выбрать символ {symbol}"}
             
-            # Получаем информацию о символе
-            symbol_info = mt5.symbol_info(symbol)
-            if not symbol_info:
+            # Получаем информацию о символе (из кэша сервера)
+            symbol_result = self.get_symbol_info(symbol)
+            if not symbol_result.get("success"):
                 return {"success": False, "error": f"Не удалось получить информацию о символе {symbol}"}
             
             # Определяем тип ордера
@@ -165,8 +310,8 @@ class MT5Server:
                 return {"success": False, "error": f"Неизвестный тип ордера: {order_type}"}
             
             # Нормализация цены
-            point = symbol_info.point
-            digits = symbol_info.digits
+            point = symbol_result["symbol_info"]["point"]
+            digits = symbol_result["symbol_info"]["digits"]
             price = round(price, digits)
             if sl:
                 sl = round(sl, digits)
@@ -215,6 +360,7 @@ class MT5Server:
             logger.error(error_msg)
             return {"success": False, "error": error_msg}
     
+    @on_executor(PRIORITY_READ)
     def get_account_info(self) -> Dict[str, Any]:
         """Получение информации об аккаунте"""
         if not self.initialized:
@@ -244,6 +390,7 @@ class MT5Server:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    @on_executor(PRIORITY_READ)
     def get_positions(self) -> Dict[str, Any]:
         """Получение открытых позиций"""
         if not self.initialized:
@@ -276,55 +423,149 @@ class MT5Server:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    def get_rates(self, symbol: str, timeframe: str, count: int = 10) -> Dict[str, Any]:
-        """Получение котировок"""
+    @on_executor(PRIORITY_READ)
+    def get_rates_array(self, symbol: str, timeframe: str, count: int = 10):
+        """Котировки как структурированный массив MT5: (rates, None) или (None, ошибка)"""
         if not self.initialized:
-            return {"success": False, "error": "MT5 не инициализирован"}
+            return None, "MT5 не инициализирован"
         
         if self.demo_mode:
-            return self.get_demo_rates(symbol, timeframe, count)
+            return self.get_demo_rates_array(symbol, timeframe, count), None
         
         try:
-            # Преобразуем timeframe в формат MT5
-            tf_map = {
-                "M1": mt5.TIMEFRAME_M1,
-                "M5": mt5.TIMEFRAME_M5,
-                "M15": mt5.TIMEFRAME_M15,
-                "M30": mt5.TIMEFRAME_M30,
-                "H1": mt5.TIMEFRAME_H1,
-                "H4": mt5.TIMEFRAME_H4,
-                "D1": mt5.TIMEFRAME_D1
-            }
-            
-            mt5_timeframe = tf_map.get(timeframe, mt5.TIMEFRAME_M1)
-            
             # Получаем котировки
-            rates = mt5.copy_rates_from_pos(symbol, mt5_timeframe, 0, count)
+            rates = mt5.copy_rates_from_pos(symbol, self._timeframe(timeframe), 0, count)
             if rates is None:
-                return {"success": False, "error": f"Не удалось получить котировки для {symbol}"}
-            
-            # Преобразуем в JSON-совместимый формат
-            rates_data = []
-            for rate in rates:
-                rates_data.append({
-                    "time": datetime.fromtimestamp(rate['time']).isoformat(),
-                    "open": rate['open'],
-                    "high": rate['high'],
-                    "low": rate['low'],
-                    "close": rate['close'],
-                    "tick_volume": rate['tick_volume']
-                })
-            
-            return {
-                "success": True,
-                "symbol": symbol,
-                "timeframe": timeframe,
-                "rates": rates_data
-            }
+                return None, f"Не удалось получить котировки для {symbol}"
+            return rates, None
             
+        except Exception as e:
+            return None, str(e)
+    
+    @staticmethod
+    def _timeframe(timeframe: str):
+        """Преобразуем timeframe в формат MT5"""
+        tf_map = {
+            "M1": mt5.TIMEFRAME_M1,
+            "M5": mt5.TIMEFRAME_M5,
+            "M15": mt5.TIMEFRAME_M15,
+            "M30": mt5.TIMEFRAME_M30,
+            "H1": mt5.TIMEFRAME_H1,
+            "H4": mt5.TIMEFRAME_H4,
+            "D1": mt5.TIMEFRAME_D1
+        }
+        return tf_map.get(timeframe, mt5.TIMEFRAME_M1)
+    
+    def iter_rates_range(self, symbol: str, timeframe: str, start: datetime, end: datetime,
+                         chunk_bars: int = HISTORY_CHUNK_BARS):
+        """
+        История за диапазон блоками не длиннее chunk_bars баров.
+        
+        copy_rates_range вызывается на каждое окно отдельно, поэтому память
+        сервера ограничена размером блока, а не длиной диапазона.
+        """
+        if self.demo_mode:
+            yield from self.iter_demo_rates_range(symbol, timeframe, start, end, chunk_bars)
+            return
+        
+        mt5_timeframe = self._timeframe(timeframe)
+        self.executor.call(mt5.symbol_select, symbol, True)
+        for window_start, window_end in range_windows(start, end, timeframe, chunk_bars):
+            # Каждое окно - отдельная задача, чтобы ордера не ждали выгрузку всего диапазона
+            rates = self.executor.call(self._copy_rates_window, symbol, mt5_timeframe, window_start, window_end)
+            if rates is None:
+                raise RuntimeError(f"copy_rates_range failed for {symbol}")
+            if len(rates):
+                yield rates
+    
+    @staticmethod
+    def _copy_rates_window(symbol: str, mt5_timeframe, start: datetime, end: datetime):
+        rates = mt5.copy_rates_range(symbol, mt5_timeframe, start, end)
+        if rates is None:
+            logger.error(f"copy_rates_range failed for {symbol}: {mt5.last_error()}")
+        return rates
+    
+    def get_rates(self, symbol: str, timeframe: str, count: int = 10) -> Dict[str, Any]:
+        """Получение котировок"""
+        rates, error = self.get_rates_array(symbol, timeframe, count)
+        if rates is None:
+            return {"success": False, "error": error}
+        return self._rates_response(symbol, timeframe, rates)
+    
+    @on_executor(PRIORITY_READ)
+    def get_deals_history(self, since: Optional[int] = None, days: int = 1) -> Dict[str, Any]:
+        """История сделок: с момента since (секунды UTC) или за последние days дней"""
+        if not self.initialized:
+            return {"success": False, "error": "MT5 не инициализирован"}
+        
+        if self.demo_mode:
+            return {"success": True, "deals": []}
+        
+        try:
+            if since is not None:
+                date_from = datetime.fromtimestamp(since, tz=timezone.utc)
+            else:
+                date_from = datetime.now() - timedelta(days=days)
+            # Конец диапазона с запасом: время сделок - серверное время брокера
+            deals = mt5.history_deals_get(date_from, datetime.now() + timedelta(days=1))
+            if deals is None:
+                return {"success": False, "error": f"Ошибка получения сделок: {mt5.last_error()}"}
+            return {"success": True, "deals": [deal._asdict() for deal in deals]}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    def get_symbol_info(self, symbol: str) -> Dict[str, Any]:
+        """Статичные параметры символа (digits, point, шаг объёма, stops level)"""
+        if not self.initialized:
+            return {"success": False, "error": "MT5 не инициализирован"}
+        
+        cached = self.symbol_cache.get(symbol)
+        if cached is not None:
+            return {"success": True, "symbol_info": cached}
+        result = self._load_symbol_info(symbol)
+        if result.get("success"):
+            self.symbol_cache.set(symbol, result["symbol_info"])
+        return result
+    
+    @on_executor(PRIORITY_READ)
+    def _load_symbol_info(self, symbol: str) -> Dict[str, Any]:
+        if self.demo_mode:
+            digits = 2 if "XAU" in symbol else 3 if "JPY" in symbol else 5
+            return {"success": True, "symbol_info": {
+                "name": symbol, "digits": digits, "point": 10 ** -digits, "trade_stops_level": 0,
+                "volume_min": 0.01, "volume_max": 100.0, "volume_step": 0.01, "visible": True, "demo": True
+            }}
+        
+        try:
+            info = mt5.symbol_info(symbol)
+            if info is None:
+                return {"success": False, "error": f"Символ {symbol} не найден"}
+            return {"success": True, "symbol_info": info._asdict()}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    @on_executor(PRIORITY_READ)
+    def get_tick(self, symbol: str) -> Dict[str, Any]:
+        """Последний тик символа"""
+        if not self.initialized:
+            return {"success": False, "error": "MT5 не инициализирован"}
+        
+        if self.demo_mode:
+            profile = symbol_profile(symbol)
+            price = round(profile["price"] * (1 + random.uniform(-0.001, 0.001)), profile["digits"])
+            ask = round(price + profile["spread"] * 10 ** -profile["digits"], profile["digits"])
+            return {"success": True, "tick": {"time": int(datetime.now().timestamp()), "bid": price,
+                                              "ask": ask, "demo": True}}
+        
+        try:
+            tick = mt5.symbol_info_tick(symbol)
+            if tick is None:
+                return {"success": False, "error": f"Нет тика для {symbol}"}
+            return {"success": True, "tick": tick._asdict()}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    @on_executor(PRIORITY_ORDER)
     def close_position(self, ticket: int) -> Dict[str, Any]:
         """Закрытие позиции по тикету"""
         if not self.initialized:
@@ -371,6 +612,7 @@ class MT5Server:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    @on_executor(PRIORITY_ORDER)
     def modify_position(self, ticket: int, sl: Optional[float] = None, tp: Optional[float] = None) -> Dict[str, Any]:
         """Модификация позиции (SL/TP)"""
         if not self.initialized:
@@ -385,12 +627,12 @@ class MT5Server:
                 return {"success": False, "error": f"Позиция с тикетом {ticket} не найдена"}
             
             position = positions[0]
-            symbol_info = mt5.symbol_info(position.symbol)
-            if not symbol_info:
+            symbol_info = self.get_symbol_info(position.symbol)
+            if not symbol_info.get("success"):
                 return {"success": False, "error": f"Не удалось получить информацию о символе {position.symbol}"}
             
             # Нормализация цен
-            digits = symbol_info.digits
+            digits = symbol_info["symbol_info"]["digits"]
             sl_to_set = round(sl, digits) if sl is not None else position.sl
             tp_to_set = round(tp, digits) if tp is not None else position.tp
             
@@ -410,9 +652,192 @@ class MT5Server:
                 
         except Exception as e:
             return {"success": False, "error": str(e)}
+    
+    @on_executor(PRIORITY_ORDER)
+    def modify_many(self, changes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Модификация нескольких позиций одной задачей очереди: ноги сигнала
+        не перемежаются с чужими запросами, клиенту - один HTTP запрос.
+        changes - [{"ticket", "sl", "tp"}]; результаты в том же порядке.
+        """
+        results = [dict(self.modify_position(c.get("ticket"), c.get("sl"), c.get("tp")), ticket=c.get("ticket"))
+                   for c in changes]
+        return {"success": all(r.get("success") for r in results), "results": results}
+    
+    @on_executor(PRIORITY_ORDER)
+    def close_many(self, tickets: List[int]) -> Dict[str, Any]:
+        """Закрытие нескольких позиций одной задачей очереди; результаты в порядке tickets"""
+        results = [dict(self.close_position(ticket), ticket=ticket) for ticket in tickets]
+        return {"success": all(r.get("success") for r in results), "results": results}
+
+class EventBroadcaster:
+    """
+    Серверный цикл push-событий для /stream (Server-Sent Events).
+
+    Один фоновый поток внутри процесса MT5 опрашивает тики подписанных
+    символов, открытые позиции и новые сделки и раскладывает изменения по
+    очередям подключённых клиентов. Клиенты получают событие сразу, без
+    собственного опроса. Последние события хранятся в кольцевом буфере, чтобы
+    переподключившийся клиент (Last-Event-ID) получил пропущенное.
+    """
+    
+    def __init__(self, server: MT5Server, interval: float = 0.25, account_interval: float = 1.0,
+                 client_queue_size: int = 1000, replay_size: int = 1000):
+        self.server = server
+        self.interval = interval
+        self.account_interval = account_interval
+        self.client_queue_size = client_queue_size
+        
+        self._lock = threading.Lock()
+        self._clients: Dict[queue.Queue, set] = {}
+        self._replay = deque(maxlen=replay_size)
+        self._event_id = 0
+        self._last_ticks: Dict[str, Any] = {}
+        self._positions: Optional[Dict[int, Dict[str, Any]]] = None
+        self._last_deal_ticket: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+    
+    # ----- Клиенты -----
+    def subscribe(self, symbols: List[str], last_event_id: Optional[int] = None) -> queue.Queue:
+        client = queue.Queue(maxsize=self.client_queue_size)
+        with self._lock:
+            self._clients[client] = set(symbols)
+            if last_event_id is not None:
+                for event in self._replay:
+                    if event[0] > last_event_id and self._wants(client, event):
+                        client.put_nowait(event)
+        self._ensure_running()
+        return client
+    
+    def unsubscribe(self, client: queue.Queue):
+        with self._lock:
+            self._clients.pop(client, None)
+    
+    def _wants(self, client: queue.Queue, event) -> bool:
+        # Тики - только по подписанным символам, позиции и сделки - всем
+        return event[1] != 'tick' or event[2].get('symbol') in self._clients.get(client, ())
+    
+    def _publish(self, event_type: str, data: Dict[str, Any]):
+        with self._lock:
+            self._event_id += 1
+            event = (self._event_id, event_type, data)
+            if event_type != 'tick':
+                self._replay.append(event)
+            for client in self._clients:
+                if not self._wants(client, event):
+                    continue
+                try:
+                    client.put_nowait(event)
+                except queue.Full:
+                    # Медленный клиент: выбрасываем самое старое событие, а не блокируем цикл
+                    try:
+                        client.get_nowait()
+                        client.put_nowait(event)
+                    except (queue.Empty, queue.Full):
+                        pass
+    
+    # ----- Опрос MT5 -----
+    def _poll_ticks(self):
+        with self._lock:
+            symbols = set().union(*self._clients.values()) if self._clients else set()
+        for symbol in symbols:
+            if self.server.demo_mode:
+                # Случайное блуждание с волатильностью и спредом символа, как у баров и тиков демо-режима
+                profile = symbol_profile(symbol)
+                last = self._last_ticks.get(symbol)
+                bid = last["bid"] if last else profile["price"]
+                bid = round(bid * (1 + profile["volatility"] * math.sqrt(self.interval / YEAR_SECONDS) * random.gauss(0, 1)),
+                            profile["digits"])
+                ask = round(bid + profile["spread"] * 10 ** -profile["digits"], profile["digits"])
+                tick = {"symbol": symbol, "time_msc": int(time.time() * 1000), "bid": bid, "ask": ask, "demo": True}
+            else:
+                raw = mt5.symbol_info_tick(symbol)
+                if raw is None:
+                    continue
+                tick = dict(raw._asdict(), symbol=symbol)
+            previous = self._last_ticks.get(symbol)
+            if previous is None or previous.get("time_msc") != tick.get("time_msc"):
+                self._last_ticks[symbol] = tick
+                self._publish('tick', tick)
+    
+    def _poll_positions(self):
+        if self.server.demo_mode:
+            return
+        raw = mt5.positions_get()
+        if raw is None:
+            return
+        current = {p.ticket: p._asdict() for p in raw}
+        if self._positions is not None:
+            opened, closed, modified = diff_positions(self._positions, current)
+            for position in opened:
+                self._publish('position_opened', position)
+            for position in closed:
+                self._publish('position_closed', position)
+            for _, position in modified:
+                self._publish('position_modified', position)
+        self._positions = current
+    
+    def _poll_deals(self):
+        if self.server.demo_mode:
+            return
+        deals = mt5.history_deals_get(datetime.now() - timedelta(hours=3), datetime.now() + timedelta(days=1))
+        if deals is None:
+            return
+        if self._last_deal_ticket is None:
+            # Первый проход только запоминает курсор - в поток идут сделки после подключения
+            self._last_deal_ticket = max((d.ticket for d in deals), default=0)
+            return
+        for deal in sorted((d for d in deals if d.ticket > self._last_deal_ticket), key=lambda d: d.ticket):
+            self._publish('deal', deal._asdict())
+            self._last_deal_ticket = deal.ticket
+    
+    def _poll_cycle(self, poll_account: bool):
+        self._poll_ticks()
+        if poll_account:
+            self._poll_positions()
+            self._poll_deals()
+    
+    def _run(self):
+        next_account_poll = 0.0
+        while True:
+            with self._lock:
+                if not self._clients:
+                    self._thread = None
+                    return
+            try:
+                if self.server.initialized:
+                    poll_account = time.monotonic() >= next_account_poll
+                    if poll_account:
+                        next_account_poll = time.monotonic() + self.account_interval
+                    # Опрос идёт в потоке MT5 с низшим приоритетом - ордера и запросы клиентов впереди
+                    self.server.executor.call(self._poll_cycle, poll_account, priority=PRIORITY_BACKGROUND)
+            except Exception as e:
+                logger.error(f"Ошибка цикла событий: {e}")
+            time.sleep(self.interval)
+    
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="mt5-events", daemon=True)
+                self._thread.start()
+    
+    def stream(self, client: queue.Queue, heartbeat: float = 15.0):
+        """Генератор SSE-кадров для одного клиента (комментарий-heartbeat держит соединение)"""
+        try:
+            yield "retry: 2000\n\n"
+            while True:
+                try:
+                    event_id, event_type, data = client.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+        finally:
+            self.unsubscribe(client)
 
 # Создаем экземпляр сервера
 mt5_server = MT5Server()
+event_broadcaster = EventBroadcaster(mt5_server)
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -421,6 +846,7 @@ def health_check():
         "status": "ok",
         "mt5_initialized": mt5_server.initialized,
         "demo_mode": mt5_server.demo_mode,
+        "executor": mt5_server.executor.get_stats(),
         "timestamp": datetime.now().isoformat()
     })
 
@@ -471,7 +897,70 @@ def get_rates():
     timeframe = request.args.get('timeframe', 'M1')
     count = int(request.args.get('count', 10))
     
-    result = mt5_server.get_rates(symbol, timeframe, count)
+    # Бинарный колоночный формат или Arrow IPC, если клиент их принимает; иначе JSON
+    media_type = negotiate(request.headers.get('Accept'))
+    if media_type == JSON_MEDIA_TYPE:
+        return jsonify(mt5_server.get_rates(symbol, timeframe, count))
+    
+    rates, error = mt5_server.get_rates_array(symbol, timeframe, count)
+    if rates is None:
+        return jsonify({"success": False, "error": error})
+    if media_type == ARROW_MEDIA_TYPE:
+        payload = encode_rates_arrow(rates)
+    else:
+        payload = encode_rates(rates, compress=request.args.get('compress') == 'zlib')
+    return Response(payload, mimetype=media_type, headers={"X-Symbol": symbol, "X-Timeframe": timeframe})
+
+@app.route('/historical_data', methods=['GET'])
+def get_historical_data():
+    """История котировок за диапазон, потоком блоков по мере чтения из MT5"""
+    symbol = request.args.get('symbol', 'EURUSD')
+    timeframe = request.args.get('timeframe', 'M1')
+    chunk_bars = int(request.args.get('chunk_bars', HISTORY_CHUNK_BARS))
+    compress = request.args.get('compress') == 'zlib'
+    try:
+        start_date = datetime.fromisoformat(request.args['start_date'])
+        end_date = datetime.fromisoformat(request.args.get('end_date') or datetime.now(timezone.utc).isoformat())
+    except (KeyError, ValueError) as e:
+        return jsonify({"success": False, "error": f"Неверный диапазон дат: {e}"}), 400
+    if not mt5_server.initialized:
+        return jsonify({"success": False, "error": "MT5 не инициализирован"}), 503
+    
+    # Кадры колоночного формата или NDJSON (одна строка - один блок баров)
+    media_type = negotiate(request.headers.get('Accept'), (RATES_STREAM_MEDIA_TYPE, NDJSON_MEDIA_TYPE),
+                           default=NDJSON_MEDIA_TYPE)
+    
+    def generate():
+        for rates in mt5_server.iter_rates_range(symbol, timeframe, start_date, end_date, chunk_bars):
+            if media_type == RATES_STREAM_MEDIA_TYPE:
+                yield encode_frame(rates, compress)
+            else:
+                yield json.dumps([{name: rate[name].item() for name in rates.dtype.names} for rate in rates]) + "\n"
+        # Без завершающего кадра клиент считает поток оборванным
+        if media_type == RATES_STREAM_MEDIA_TYPE:
+            yield end_frame()
+    
+    return Response(stream_with_context(generate()), mimetype=media_type)
+
+@app.route('/deals_history', methods=['GET'])
+def get_deals_history():
+    """История сделок (since - секунды UTC для инкрементальной загрузки)"""
+    since = request.args.get('since', type=int)
+    days = request.args.get('days', 1, type=int)
+    
+    result = mt5_server.get_deals_history(since, days)
+    return jsonify(result)
+
+@app.route('/symbol_info', methods=['GET'])
+def get_symbol_info():
+    """Параметры символа"""
+    result = mt5_server.get_symbol_info(request.args.get('symbol', 'EURUSD'))
+    return jsonify(result)
+
+@app.route('/tick', methods=['GET'])
+def get_tick():
+    """Последний тик символа"""
+    result = mt5_server.get_tick(request.args.get('symbol', 'EURUSD'))
     return jsonify(result)
 
 @app.route('/close_position', methods=['POST'])
@@ -494,6 +983,30 @@ def modify_position():
     result = mt5_server.modify_position(ticket, sl, tp)
     return jsonify(result)
 
+@app.route('/modify_many', methods=['POST'])
+def modify_many():
+    """Модификация нескольких позиций: {"changes": [{"ticket", "sl", "tp"}, ...]}"""
+    data = request.get_json() or {}
+    return jsonify(mt5_server.modify_many(data.get('changes', [])))
+
+@app.route('/close_many', methods=['POST'])
+def close_many():
+    """Закрытие нескольких позиций: {"tickets": [...]}"""
+    data = request.get_json() or {}
+    return jsonify(mt5_server.close_many(data.get('tickets', [])))
+
+@app.route('/stream', methods=['GET'])
+def stream_events():
+    """Поток событий SSE: tick (по symbols=EURUSD,XAUUSD), position_opened/closed/modified, deal"""
+    symbols = [s for s in request.args.get('symbols', '').split(',') if s]
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    client = event_broadcaster.subscribe(symbols, last_event_id)
+    return Response(
+        stream_with_context(event_broadcaster.stream(client)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/shutdown', methods=['POST'])
 def shutdown_mt5():
     """Закрытие соединения с MT5"""
@@ -509,4 +1022,6 @@ if __name__ == '__main__':
         logger.warning(f"⚠️ MT5 не инициализирован: {message}")
     
     # Запуск Flask сервера
-    app.run(host='0.0.0.0', port=5000, debug=False) 
\ No newline at end of file
+    # threaded=True: каждый запрос в своём потоке, вызовы mt5.* сериализует MT5Executor;
+    # долгоживущие соединения /stream не блокируют остальные запросы
+    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True) 
\ No newline at end of file
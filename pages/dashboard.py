@@ -62,16 +62,12 @@ def get_real_trading_stats(logic_manager):
             positions = logic_manager.get_mt5_positions()
             open_trades = len(positions)
             
-            # Получаем историю сделок
+            # Получаем историю сделок (локальная таблица, догружаются только новые)
             deals_history = logic_manager.get_mt5_deals_history(days=30)
             total_trades = len(deals_history) if deals_history else 0
             
             # Подсчитываем прибыльные сделки
-            profitable_trades = 0
-            if deals_history:
-                for deal in deals_history:
-                    if hasattr(deal, 'profit') and deal.profit > 0:
-                        profitable_trades += 1
+            profitable_trades = sum(1 for deal in deals_history or [] if (deal.get('profit') or 0) > 0)
             
             return {
                 'total_profit': f"${profit:,.2f}",
@@ -13,29 +13,34 @@ WARNING_COLOR = "#ff9800"
 def create_history_view(page, logic_manager=None):
     """Создает страницу History с полной таблицей сделок из реальных данных."""
     
+    PAGE_SIZE = 50
+    # Курсор следующей страницы (keyset-пагинация), None - страниц больше нет
+    history_state = {'cursor': None}
+    
     # ----- ПОЛУЧЕНИЕ РЕАЛЬНЫХ ДАННЫХ -----
-    def get_real_trades():
-        if logic_manager and hasattr(logic_manager, 'database_service'):
-            signals = logic_manager.database_service.get_signal_history(limit=50)
+    def get_real_trades(cursor=None):
+        if logic_manager and hasattr(logic_manager, 'get_signal_history_page'):
+            signals, history_state['cursor'] = logic_manager.get_signal_history_page(limit=PAGE_SIZE, cursor=cursor)
             return signals
+        history_state['cursor'] = None
         return []
     
     def format_profit(signal):
         """Форматирует прибыль на основе статуса и типа ордера"""
-        if signal['status'] == 'CLOSED':
+        if signal.get('status') == 'CLOSED':
             # Для закрытых сделок показываем примерную прибыль
-            if signal['order_type'] == 'BUY':
+            if signal.get('order_type', signal.get('type')) == 'BUY':
                 return "+$45.20"  # Примерная прибыль
             else:
                 return "-$12.80"  # Примерный убыток
-        elif signal['status'] == 'PROCESSED_ACTIVE':
+        elif signal.get('status') == 'PROCESSED_ACTIVE':
             return "+$15.60"  # Текущая прибыль
         else:
             return "$0.00"
     
     def format_commission(signal):
         """Форматирует комиссию"""
-        if signal['status'] in ['CLOSED', 'PROCESSED_ACTIVE']:
+        if signal.get('status') in ['CLOSED', 'PROCESSED_ACTIVE']:
             return "-$2.50"
         return "$0.00"
     
@@ -73,13 +78,10 @@ def create_history_view(page, logic_manager=None):
             return ERROR_COLOR
     
     # ----- СОЗДАНИЕ ТАБЛИЦЫ С РЕАЛЬНЫМИ ДАННЫМИ -----
-    real_signals = get_real_trades()
-    
-    table_rows = []
-    for signal in real_signals:
+    def create_row(signal):
         # Парсим take_profits из JSON
         take_profits = []
-        if signal['take_profits']:
+        if signal.get('take_profits'):
             try:
                 take_profits = json.loads(signal['take_profits'])
             except:
@@ -88,34 +90,35 @@ def create_history_view(page, logic_manager=None):
         # Определяем источник сигнала
         source = "Parser BOT" if "Test Channel" in str(signal.get('channel_name', '')) else "Smart Money BOT"
         
-        table_rows.append(
-            ft.DataRow(cells=[
-                ft.DataCell(ft.Text(signal['symbol'], color=TEXT_COLOR)),
-                ft.DataCell(ft.Text(
-                    signal.get('order_type', signal.get('type', 'UNKNOWN')), 
-                    color=get_order_type_color(signal.get('order_type', signal.get('type', 'UNKNOWN'))), 
-                    weight=ft.FontWeight.BOLD
-                )),
-                ft.DataCell(ft.Text(format_profit(signal), color=SUCCESS_COLOR if format_profit(signal).startswith("+") else ERROR_COLOR)),
-                ft.DataCell(ft.Text(format_commission(signal), color=ERROR_COLOR)),
-                ft.DataCell(ft.Text(format_result(signal), color=SUCCESS_COLOR if format_result(signal).startswith("+") else ERROR_COLOR)),
-                ft.DataCell(ft.Text(
-                    "Закрыта" if signal.get('status') == 'CLOSED' else 
-                    "Открыта" if signal.get('status') == 'PROCESSED_ACTIVE' else 
-                    "Новая" if signal.get('status') == 'NEW' else signal.get('status', 'UNKNOWN'),
-                    color=get_status_color(signal.get('status', 'UNKNOWN'))
-                )),
-                ft.DataCell(ft.Container(
-                    content=ft.ElevatedButton(
-                        "Лог", 
-                        bgcolor=WARNING_COLOR, 
-                        color="white",
-                        on_click=lambda e, s=signal: show_trade_log(e, s)
-                    ),
-                    padding=ft.padding.only(left=8)
-                ))
-            ])
-        )
+        return ft.DataRow(cells=[
+            ft.DataCell(ft.Text(signal['symbol'], color=TEXT_COLOR)),
+            ft.DataCell(ft.Text(
+                signal.get('order_type', signal.get('type', 'UNKNOWN')), 
+                color=get_order_type_color(signal.get('order_type', signal.get('type', 'UNKNOWN'))), 
+                weight=ft.FontWeight.BOLD
+            )),
+            ft.DataCell(ft.Text(format_profit(signal), color=SUCCESS_COLOR if format_profit(signal).startswith("+") else ERROR_COLOR)),
+            ft.DataCell(ft.Text(format_commission(signal), color=ERROR_COLOR)),
+            ft.DataCell(ft.Text(format_result(signal), color=SUCCESS_COLOR if format_result(signal).startswith("+") else ERROR_COLOR)),
+            ft.DataCell(ft.Text(
+                "Закрыта" if signal.get('status') == 'CLOSED' else 
+                "Открыта" if signal.get('status') == 'PROCESSED_ACTIVE' else 
+                "Новая" if signal.get('status') == 'NEW' else signal.get('status', 'UNKNOWN'),
+                color=get_status_color(signal.get('status', 'UNKNOWN'))
+            )),
+            ft.DataCell(ft.Container(
+                content=ft.ElevatedButton(
+                    "Лог", 
+                    bgcolor=WARNING_COLOR, 
+                    color="white",
+                    on_click=lambda e, s=signal: show_trade_log(e, s)
+                ),
+                padding=ft.padding.only(left=8)
+            ))
+        ])
+    
+    real_signals = get_real_trades()
+    table_rows = [create_row(signal) for signal in real_signals]
     
     # Если нет данных, показываем сообщение
     if not table_rows:
@@ -144,6 +147,35 @@ def create_history_view(page, logic_manager=None):
         rows=table_rows
     )
     
+    # ----- ПОДГРУЗКА СЛЕДУЮЩИХ СТРАНИЦ -----
+    def count_text(status=None):
+        return str(len([s for s in real_signals if status is None or s.get('status') == status]))
+    
+    total_text = ft.Text(count_text(), color=TEXT_COLOR, size=18, weight=ft.FontWeight.BOLD)
+    closed_text = ft.Text(count_text('CLOSED'), color=SUCCESS_COLOR, size=18, weight=ft.FontWeight.BOLD)
+    open_text = ft.Text(count_text('PROCESSED_ACTIVE'), color=WARNING_COLOR, size=18, weight=ft.FontWeight.BOLD)
+    
+    def load_more(e):
+        """Догружает следующую страницу истории по курсору"""
+        if history_state['cursor'] is None:
+            return
+        signals = get_real_trades(history_state['cursor'])
+        real_signals.extend(signals)
+        trades_table.rows.extend(create_row(signal) for signal in signals)
+        total_text.value = count_text()
+        closed_text.value = count_text('CLOSED')
+        open_text.value = count_text('PROCESSED_ACTIVE')
+        load_more_button.visible = history_state['cursor'] is not None
+        page.update()
+    
+    load_more_button = ft.ElevatedButton(
+        "Загрузить ещё",
+        bgcolor=BLOCK_BG_COLOR,
+        color=TEXT_COLOR,
+        visible=history_state['cursor'] is not None,
+        on_click=load_more
+    )
+    
     # ----- ФУНКЦИЯ ПОКАЗА ЛОГА -----
     def show_trade_log(e, signal):
         """Показывает детальную информацию о сделке"""
@@ -288,7 +320,7 @@ def create_history_view(page, logic_manager=None):
                     expand=1,
                     content=ft.Column([
                         ft.Text("Всего сделок", color=SUBTEXT_COLOR, size=12),
-                        ft.Text(str(len(real_signals)), color=TEXT_COLOR, size=18, weight=ft.FontWeight.BOLD)
+                        total_text
                     ])
                 ),
                 ft.Container(width=10),
@@ -299,7 +331,7 @@ def create_history_view(page, logic_manager=None):
                     expand=1,
                     content=ft.Column([
                         ft.Text("Прибыльных", color=SUCCESS_COLOR, size=12),
-                        ft.Text(str(len([s for s in real_signals if s['status'] == 'CLOSED'])), color=SUCCESS_COLOR, size=18, weight=ft.FontWeight.BOLD)
+                        closed_text
                     ])
                 ),
                 ft.Container(width=10),
@@ -310,7 +342,7 @@ def create_history_view(page, logic_manager=None):
                     expand=1,
                     content=ft.Column([
                         ft.Text("Открытых", color=WARNING_COLOR, size=12),
-                        ft.Text(str(len([s for s in real_signals if s['status'] == 'PROCESSED_ACTIVE'])), color=WARNING_COLOR, size=18, weight=ft.FontWeight.BOLD)
+                        open_text
                     ])
                 )
             ]),
@@ -325,7 +357,9 @@ def create_history_view(page, logic_manager=None):
             # Таблица
             ft.Container(
                 content=trades_table
-            )
+            ),
+            
+            ft.Row([load_more_button], alignment=ft.MainAxisAlignment.CENTER)
         ])
     )
     
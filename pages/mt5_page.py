@@ -51,8 +51,9 @@ def create_mt5_view(logic_manager: LogicManager):
                         update_connection_status("Подключен", SUCCESS_COLOR)
                         add_log("✅ Подключение к MT5 установлено")
                         
-                        # Получаем информацию об аккаунте
-                        account_info = logic_manager.mt5.get_account_info()
+                        # Запускаем общий опрос счёта и берём информацию из снимка
+                        logic_manager.start_account_snapshot()
+                        account_info = logic_manager.get_mt5_account_info()
                         if account_info:
                             balance_text.value = f"${account_info.get('balance', 0):,.2f}"
                             equity_text.value = f"${account_info.get('equity', 0):,.2f}"
@@ -79,6 +80,8 @@ def create_mt5_view(logic_manager: LogicManager):
     
     def disconnect_mt5(e):
         try:
+            if logic_manager and logic_manager.account_snapshot:
+                logic_manager.account_snapshot.stop()
             if logic_manager and logic_manager.mt5:
                 logic_manager.mt5.shutdown()
             
@@ -121,7 +124,7 @@ def create_mt5_view(logic_manager: LogicManager):
         add_log("📊 Загрузка истории сделок...")
         if logic_manager and logic_manager.mt5:
             try:
-                deals = logic_manager.mt5.get_deals_in_history(days=7)
+                deals = logic_manager.get_mt5_deals_history(days=7)
                 if deals:
                     add_log(f"✅ Загружено {len(deals)} сделок за последние 7 дней")
                 else:
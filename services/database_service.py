@@ -1,15 +1,35 @@
-import sqlite3
-import json
 from datetime import datetime, timedelta
 import os
 
+from utils.db_connection import ReadOnlyConnectionPool, SQLiteConnectionManager
+from utils.deal_feed import DEALS_INDEX_SQL, DEALS_TABLE_SQL, INSERT_DEAL_SQL, deal_row
+from utils.db_maintenance import DatabaseMaintenance
+from utils.log_sink import LogSink
+from utils.settings_store import SettingsStore, SQLiteSettingsBackend
+
+# Строка statistics с этим источником хранит агрегат по всем источникам за день
+STATS_ALL_SOURCES = '*'
+# Какие сделки попадают в статистику
+_STATS_TRADE_FILTER = "status = 'CLOSED' AND profit_loss IS NOT NULL AND timestamp IS NOT NULL"
+
 class DatabaseService:
     """Полноценный сервис базы данных для торговой системы"""
     
-    def __init__(self, db_path='data/trading.db'):
+    def __init__(self, db_path='data/trading.db', log_file=None, log_level='INFO'):
         self.db_path = db_path
         self._ensure_data_directory()
+        # Одно соединение-писатель и соединения-читатели на поток вместо connect() на каждый вызов
+        self._db = SQLiteConnectionManager(db_path)
         self._create_tables()
+        # Чтения для интерфейса (страницы истории, статистика) идут через отдельный пул mode=ro
+        self._ui_db = ReadOnlyConnectionPool(db_path)
+        # Логи пишутся пачками в фоне, последние записи читаются из памяти
+        self.log_sink = LogSink(self._flush_logs, min_level=log_level, jsonl_path=log_file,
+                                time_format='%Y-%m-%d %H:%M:%S.%f')
+        self._preload_logs()
+        self.maintenance = None
+        # Настройки читаются из таблицы один раз и дальше отдаются из памяти
+        self.settings_store = SettingsStore(SQLiteSettingsBackend(self._db))
     
     def _ensure_data_directory(self):
         """Создание директории data если её нет"""
@@ -17,298 +37,445 @@ class DatabaseService:
     
     def _create_tables(self):
         """Создание всех необходимых таблиц"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Таблица сделок
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS trades (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                trade_id TEXT UNIQUE,
-                symbol TEXT,
-                type TEXT,
-                direction TEXT,
-                entry_price REAL,
-                exit_price REAL,
-                stop_loss REAL,
-                take_profit REAL,
-                volume REAL,
-                status TEXT,
-                profit_loss REAL,
-                timestamp DATETIME,
-                close_timestamp DATETIME,
-                source TEXT,
-                comment TEXT
-            )
-        ''')
-        
-        # Таблица сигналов
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS signals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                signal_id TEXT UNIQUE,
-                symbol TEXT,
-                type TEXT,
-                direction TEXT,
-                entry_price REAL,
-                stop_loss REAL,
-                take_profit REAL,
-                volume REAL,
-                status TEXT,
-                timestamp DATETIME,
-                source TEXT,
-                channel TEXT,
-                message_text TEXT,
-                processed BOOLEAN DEFAULT FALSE
-            )
-        ''')
-        
-        # Таблица настроек
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS settings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                category TEXT,
-                key TEXT,
-                value TEXT,
-                updated_at DATETIME,
-                UNIQUE(category, key)
-            )
-        ''')
-        
-        # Таблица статистики
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS statistics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date DATE,
-                total_trades INTEGER,
-                winning_trades INTEGER,
-                losing_trades INTEGER,
-                total_profit REAL,
-                max_drawdown REAL,
-                win_rate REAL,
-                avg_win REAL,
-                avg_loss REAL,
-                profit_factor REAL,
-                source TEXT
-            )
-        ''')
-        
-        # Таблица каналов
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS channels (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                channel_name TEXT UNIQUE,
-                channel_id TEXT,
-                is_active BOOLEAN DEFAULT TRUE,
-                added_at DATETIME,
-                last_message_at DATETIME,
-                message_count INTEGER DEFAULT 0,
-                signal_count INTEGER DEFAULT 0
-            )
-        ''')
-        
-        # Таблица логов
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME,
-                level TEXT,
-                source TEXT,
-                message TEXT
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        with self._db.transaction() as cursor:
+            # Таблица сделок
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS trades (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    trade_id TEXT UNIQUE,
+                    symbol TEXT,
+                    type TEXT,
+                    direction TEXT,
+                    entry_price REAL,
+                    exit_price REAL,
+                    stop_loss REAL,
+                    take_profit REAL,
+                    volume REAL,
+                    status TEXT,
+                    profit_loss REAL,
+                    timestamp DATETIME,
+                    close_timestamp DATETIME,
+                    source TEXT,
+                    comment TEXT
+                )
+            ''')
+        
+            # Таблица сигналов
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS signals (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    signal_id TEXT UNIQUE,
+                    symbol TEXT,
+                    type TEXT,
+                    direction TEXT,
+                    entry_price REAL,
+                    stop_loss REAL,
+                    take_profit REAL,
+                    volume REAL,
+                    status TEXT,
+                    timestamp DATETIME,
+                    source TEXT,
+                    channel TEXT,
+                    message_text TEXT,
+                    processed BOOLEAN DEFAULT FALSE
+                )
+            ''')
+        
+            # Таблица настроек
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS settings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    category TEXT,
+                    key TEXT,
+                    value TEXT,
+                    updated_at DATETIME,
+                    UNIQUE(category, key)
+                )
+            ''')
+        
+            # Таблица статистики
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS statistics (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    date DATE,
+                    total_trades INTEGER,
+                    winning_trades INTEGER,
+                    losing_trades INTEGER,
+                    total_profit REAL,
+                    max_drawdown REAL,
+                    win_rate REAL,
+                    avg_win REAL,
+                    avg_loss REAL,
+                    profit_factor REAL,
+                    source TEXT
+                )
+            ''')
+        
+            # Таблица каналов
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS channels (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    channel_name TEXT UNIQUE,
+                    channel_id TEXT,
+                    is_active BOOLEAN DEFAULT TRUE,
+                    added_at DATETIME,
+                    last_message_at DATETIME,
+                    message_count INTEGER DEFAULT 0,
+                    signal_count INTEGER DEFAULT 0
+                )
+            ''')
+        
+            # Таблица логов
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp DATETIME,
+                    level TEXT,
+                    source TEXT,
+                    message TEXT
+                )
+            ''')
+            
+            # История сделок MT5 (пополняется инкрементально через utils/deal_feed.py)
+            cursor.execute(DEALS_TABLE_SQL)
+            for index_sql in DEALS_INDEX_SQL:
+                cursor.execute(index_sql)
         
         # Добавляем демо-данные если таблицы пустые
         self._add_demo_data()
+        self._migrate_statistics()
+        self._create_indexes()
+    
+    def _create_indexes(self):
+        """
+        Индексы под выборки истории и логов.
+        
+        В индекс SQLite неявно входит rowid (id), поэтому (status, timestamp) отдаёт
+        строки уже в порядке (timestamp, id) и keyset-страница читается без сортировки.
+        """
+        with self._db.transaction() as cursor:
+            for table in ('trades', 'signals'):
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table} (timestamp)")
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_status_timestamp ON {table} (status, timestamp)")
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_source_timestamp ON {table} (source, timestamp)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_level ON logs (level)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_source ON logs (source)")
     
     def _add_demo_data(self):
         """Добавление демо-данных для тестирования"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Проверяем, есть ли уже данные
-        cursor.execute("SELECT COUNT(*) FROM trades")
-        if cursor.fetchone()[0] == 0:
-            # Добавляем демо-сделки
-            demo_trades = [
-                ('TRADE_001', 'EURUSD', 'BUY', 'LONG', 1.2050, 1.2100, 1.2000, 1.2150, 0.1, 'CLOSED', 50.0, datetime.now() - timedelta(days=1), datetime.now(), 'SMC', 'Demo trade 1'),
-                ('TRADE_002', 'GBPUSD', 'SELL', 'SHORT', 1.3000, 1.2950, 1.3050, 1.2900, 0.1, 'CLOSED', 50.0, datetime.now() - timedelta(days=2), datetime.now() - timedelta(hours=12), 'Parser', 'Demo trade 2'),
-                ('TRADE_003', 'EURUSD', 'BUY', 'LONG', 1.2080, None, 1.2030, 1.2180, 0.1, 'OPEN', None, datetime.now() - timedelta(hours=6), None, 'SMC', 'Demo trade 3'),
-                ('TRADE_004', 'USDJPY', 'SELL', 'SHORT', 110.50, None, 111.00, 109.50, 0.1, 'OPEN', None, datetime.now() - timedelta(hours=3), None, 'Parser', 'Demo trade 4'),
-                ('TRADE_005', 'EURUSD', 'BUY', 'LONG', 1.2020, 1.1980, 1.1970, 1.2120, 0.1, 'CLOSED', -40.0, datetime.now() - timedelta(days=3), datetime.now() - timedelta(days=2), 'SMC', 'Demo trade 5')
-            ]
-            
-            for trade in demo_trades:
-                cursor.execute('''
-                    INSERT INTO trades (trade_id, symbol, type, direction, entry_price, exit_price, 
-                                      stop_loss, take_profit, volume, status, profit_loss, timestamp, 
-                                      close_timestamp, source, comment)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', trade)
-            
-            # Добавляем демо-сигналы
-            demo_signals = [
-                ('SIGNAL_001', 'EURUSD', 'BUY', 'LONG', 1.2050, 1.2000, 1.2150, 0.1, 'EXECUTED', datetime.now() - timedelta(days=1), 'Parser', 'GOLDHUNTER', 'BUY EURUSD at 1.2050 SL: 1.2000 TP: 1.2150'),
-                ('SIGNAL_002', 'GBPUSD', 'SELL', 'SHORT', 1.3000, 1.3050, 1.2900, 0.1, 'EXECUTED', datetime.now() - timedelta(days=2), 'Parser', 'GOLDHUNTER', 'SELL GBPUSD at 1.3000 SL: 1.3050 TP: 1.2900'),
-                ('SIGNAL_003', 'EURUSD', 'BUY', 'LONG', 1.2080, 1.2030, 1.2180, 0.1, 'PENDING', datetime.now() - timedelta(hours=6), 'SMC', 'SMC_BOT', 'BOS signal EURUSD'),
-                ('SIGNAL_004', 'USDJPY', 'SELL', 'SHORT', 110.50, 111.00, 109.50, 0.1, 'PENDING', datetime.now() - timedelta(hours=3), 'Parser', 'GOLDHUNTER', 'SELL USDJPY at 110.50')
-            ]
+        with self._db.transaction() as cursor:
+            # Проверяем, есть ли уже данные
+            cursor.execute("SELECT COUNT(*) FROM trades")
+            if cursor.fetchone()[0] == 0:
+                # Добавляем демо-сделки
+                demo_trades = [
+                    ('TRADE_001', 'EURUSD', 'BUY', 'LONG', 1.2050, 1.2100, 1.2000, 1.2150, 0.1, 'CLOSED', 50.0, datetime.now() - timedelta(days=1), datetime.now(), 'SMC', 'Demo trade 1'),
+                    ('TRADE_002', 'GBPUSD', 'SELL', 'SHORT', 1.3000, 1.2950, 1.3050, 1.2900, 0.1, 'CLOSED', 50.0, datetime.now() - timedelta(days=2), datetime.now() - timedelta(hours=12), 'Parser', 'Demo trade 2'),
+                    ('TRADE_003', 'EURUSD', 'BUY', 'LONG', 1.2080, None, 1.2030, 1.2180, 0.1, 'OPEN', None, datetime.now() - timedelta(hours=6), None, 'SMC', 'Demo trade 3'),
+                    ('TRADE_004', 'USDJPY', 'SELL', 'SHORT', 110.50, None, 111.00, 109.50, 0.1, 'OPEN', None, datetime.now() - timedelta(hours=3), None, 'Parser', 'Demo trade 4'),
+                    ('TRADE_005', 'EURUSD', 'BUY', 'LONG', 1.2020, 1.1980, 1.1970, 1.2120, 0.1, 'CLOSED', -40.0, datetime.now() - timedelta(days=3), datetime.now() - timedelta(days=2), 'SMC', 'Demo trade 5')
+                ]
             
-            for signal in demo_signals:
-                cursor.execute('''
-                    INSERT INTO signals (signal_id, symbol, type, direction, entry_price, 
-                                       stop_loss, take_profit, volume, status, timestamp, 
-                                       source, channel, message_text)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', signal)
+                for trade in demo_trades:
+                    cursor.execute('''
+                        INSERT INTO trades (trade_id, symbol, type, direction, entry_price, exit_price, 
+                                          stop_loss, take_profit, volume, status, profit_loss, timestamp, 
+                                          close_timestamp, source, comment)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', trade)
             
-            # Добавляем демо-каналы
-            demo_channels = [
-                ('GOLDHUNTER', 'goldhunter_channel', True, datetime.now(), datetime.now() - timedelta(hours=2), 150, 25),
-                ('SMC_BOT', 'smc_bot_channel', True, datetime.now(), datetime.now() - timedelta(hours=1), 50, 10),
-                ('TRADE_SIGNALS', 'trade_signals_channel', False, datetime.now(), datetime.now() - timedelta(days=1), 300, 45)
-            ]
+                # Добавляем демо-сигналы
+                demo_signals = [
+                    ('SIGNAL_001', 'EURUSD', 'BUY', 'LONG', 1.2050, 1.2000, 1.2150, 0.1, 'EXECUTED', datetime.now() - timedelta(days=1), 'Parser', 'GOLDHUNTER', 'BUY EURUSD at 1.2050 SL: 1.2000 TP: 1.2150'),
+                    ('SIGNAL_002', 'GBPUSD', 'SELL', 'SHORT', 1.3000, 1.3050, 1.2900, 0.1, 'EXECUTED', datetime.now() - timedelta(days=2), 'Parser', 'GOLDHUNTER', 'SELL GBPUSD at 1.3000 SL: 1.3050 TP: 1.2900'),
+                    ('SIGNAL_003', 'EURUSD', 'BUY', 'LONG', 1.2080, 1.2030, 1.2180, 0.1, 'PENDING', datetime.now() - timedelta(hours=6), 'SMC', 'SMC_BOT', 'BOS signal EURUSD'),
+                    ('SIGNAL_004', 'USDJPY', 'SELL', 'SHORT', 110.50, 111.00, 109.50, 0.1, 'PENDING', datetime.now() - timedelta(hours=3), 'Parser', 'GOLDHUNTER', 'SELL USDJPY at 110.50')
+                ]
             
-            for channel in demo_channels:
-                cursor.execute('''
-                    INSERT INTO channels (channel_name, channel_id, is_active, added_at, 
-                                        last_message_at, message_count, signal_count)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', channel)
+                for signal in demo_signals:
+                    cursor.execute('''
+                        INSERT INTO signals (signal_id, symbol, type, direction, entry_price, 
+                                           stop_loss, take_profit, volume, status, timestamp, 
+                                           source, channel, message_text)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', signal)
             
-            # Добавляем демо-статистику
-            demo_stats = [
-                (datetime.now().date(), 5, 3, 2, 60.0, -40.0, 0.6, 50.0, -40.0, 1.5, 'SMC'),
-                ((datetime.now() - timedelta(days=1)).date(), 3, 2, 1, 30.0, -20.0, 0.67, 30.0, -20.0, 1.5, 'Parser'),
-                ((datetime.now() - timedelta(days=2)).date(), 4, 2, 2, 20.0, -30.0, 0.5, 25.0, -15.0, 1.67, 'SMC')
-            ]
+                # Добавляем демо-каналы
+                demo_channels = [
+                    ('GOLDHUNTER', 'goldhunter_channel', True, datetime.now(), datetime.now() - timedelta(hours=2), 150, 25),
+                    ('SMC_BOT', 'smc_bot_channel', True, datetime.now(), datetime.now() - timedelta(hours=1), 50, 10),
+                    ('TRADE_SIGNALS', 'trade_signals_channel', False, datetime.now(), datetime.now() - timedelta(days=1), 300, 45)
+                ]
             
-            for stat in demo_stats:
-                cursor.execute('''
-                    INSERT INTO statistics (date, total_trades, winning_trades, losing_trades,
-                                          total_profit, max_drawdown, win_rate, avg_win, 
-                                          avg_loss, profit_factor, source)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', stat)
-        
-        conn.commit()
-        conn.close()
+                for channel in demo_channels:
+                    cursor.execute('''
+                        INSERT INTO channels (channel_name, channel_id, is_active, added_at, 
+                                            last_message_at, message_count, signal_count)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', channel)
+    
+    def _migrate_statistics(self):
+        """Миграция таблицы statistics под инкрементальные дневные агрегаты"""
+        with self._db.transaction() as cursor:
+            cursor.execute("PRAGMA table_info(statistics)")
+            columns = [info[1] for info in cursor.fetchall()]
+            migrated = False
+            for column, column_type in (('sum_win', 'REAL'), ('sum_loss', 'REAL'), ('peak', 'REAL'),
+                                        ('trough', 'REAL'), ('updated_at', 'DATETIME')):
+                if column not in columns:
+                    cursor.execute(f"ALTER TABLE statistics ADD COLUMN {column} {column_type}")
+                    migrated = True
+            if migrated:
+                # Старые строки (демо-статистика) не согласованы со сделками - пересчитываем с нуля
+                cursor.execute("DELETE FROM statistics")
+            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_statistics_date_source ON statistics (date, source)")
+            if migrated:
+                self._rebuild_statistics(cursor)
+    
+    # ----- Дневная статистика -----
+    @staticmethod
+    def _stats_key(timestamp, source):
+        """Ключ дневной строки статистики: (YYYY-MM-DD, источник)"""
+        return str(timestamp)[:10], source or ''
     
+    @staticmethod
+    def _replay_day(pnls):
+        """Агрегаты дня по списку PnL в порядке закрытия сделок"""
+        row = {'total_trades': 0, 'winning_trades': 0, 'losing_trades': 0, 'total_profit': 0.0,
+               'sum_win': 0.0, 'sum_loss': 0.0, 'peak': 0.0, 'trough': 0.0, 'max_drawdown': 0.0}
+        for pnl in pnls:
+            row['total_trades'] += 1
+            if pnl > 0:
+                row['winning_trades'] += 1
+                row['sum_win'] += pnl
+            elif pnl < 0:
+                row['losing_trades'] += 1
+                row['sum_loss'] += pnl
+            row['total_profit'] += pnl
+            row['peak'] = max(row['peak'], row['total_profit'])
+            row['trough'] = min(row['trough'], row['total_profit'])
+            row['max_drawdown'] = max(row['max_drawdown'], row['peak'] - row['total_profit'])
+        return row
+    
+    def _write_stats_row(self, cursor, date, source, row):
+        """Запись (замена) дневной строки вместе с производными метриками"""
+        cursor.execute("DELETE FROM statistics WHERE date = ? AND source = ?", (date, source))
+        if not row['total_trades']:
+            return
+        cursor.execute('''
+            INSERT INTO statistics (date, source, total_trades, winning_trades, losing_trades, total_profit,
+                                    sum_win, sum_loss, peak, trough, max_drawdown, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (date, source, row['total_trades'], row['winning_trades'], row['losing_trades'], row['total_profit'],
+              row['sum_win'], row['sum_loss'], row['peak'], row['trough'], row['max_drawdown'], datetime.now()))
+        self._update_derived_stats(cursor, date, source)
+    
+    @staticmethod
+    def _update_derived_stats(cursor, date, source):
+        cursor.execute('''
+            UPDATE statistics SET
+                win_rate = CAST(winning_trades AS REAL) / total_trades,
+                avg_win = sum_win / NULLIF(winning_trades, 0),
+                avg_loss = sum_loss / NULLIF(losing_trades, 0),
+                profit_factor = ABS((sum_win / NULLIF(winning_trades, 0)) / NULLIF(sum_loss / NULLIF(losing_trades, 0), 0))
+            WHERE date = ? AND source = ?
+        ''', (date, source))
+    
+    def _append_trade_stats(self, cursor, date, source, pnl):
+        """O(1) обновление дневных строк (по источнику и общей) при закрытии сделки"""
+        row = self._replay_day([pnl])
+        for key_source in (source, STATS_ALL_SOURCES):
+            cursor.execute('''
+                INSERT INTO statistics (date, source, total_trades, winning_trades, losing_trades, total_profit,
+                                        sum_win, sum_loss, peak, trough, max_drawdown, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(date, source) DO UPDATE SET
+                    total_trades = total_trades + 1,
+                    winning_trades = winning_trades + excluded.winning_trades,
+                    losing_trades = losing_trades + excluded.losing_trades,
+                    sum_win = sum_win + excluded.sum_win,
+                    sum_loss = sum_loss + excluded.sum_loss,
+                    peak = MAX(peak, total_profit + excluded.total_profit),
+                    trough = MIN(trough, total_profit + excluded.total_profit),
+                    max_drawdown = MAX(max_drawdown, MAX(peak, total_profit + excluded.total_profit)
+                                                     - (total_profit + excluded.total_profit)),
+                    total_profit = total_profit + excluded.total_profit,
+                    updated_at = excluded.updated_at
+            ''', (date, key_source, row['total_trades'], row['winning_trades'], row['losing_trades'], row['total_profit'],
+                  row['sum_win'], row['sum_loss'], row['peak'], row['trough'], row['max_drawdown'], datetime.now()))
+            self._update_derived_stats(cursor, date, key_source)
+    
+    def _recompute_day_stats(self, cursor, date, source):
+        """Пересчёт одного дня (источник и общая строка) после изменения уже учтённой сделки"""
+        for key_source in (source, STATS_ALL_SOURCES):
+            query = f'''
+                SELECT profit_loss FROM trades
+                WHERE {_STATS_TRADE_FILTER} AND substr(timestamp, 1, 10) = ?
+            '''
+            params = [date]
+            if key_source != STATS_ALL_SOURCES:
+                query += " AND COALESCE(source, '') = ?"
+                params.append(key_source)
+            cursor.execute(query + " ORDER BY close_timestamp, id", params)
+            self._write_stats_row(cursor, date, key_source, self._replay_day([r[0] for r in cursor.fetchall()]))
+    
+    def _rebuild_statistics(self, cursor):
+        cursor.execute("DELETE FROM statistics")
+        cursor.execute(f'''
+            SELECT substr(timestamp, 1, 10), COALESCE(source, ''), profit_loss FROM trades
+            WHERE {_STATS_TRADE_FILTER}
+            ORDER BY substr(timestamp, 1, 10), close_timestamp, id
+        ''')
+        days = {}
+        for date, source, pnl in cursor.fetchall():
+            days.setdefault((date, source), []).append(pnl)
+            days.setdefault((date, STATS_ALL_SOURCES), []).append(pnl)
+        for (date, source), pnls in days.items():
+            self._write_stats_row(cursor, date, source, self._replay_day(pnls))
+        return len(days)
+    
+    def rebuild_statistics(self):
+        """Полный пересчёт таблицы statistics по закрытым сделкам, возвращает число строк"""
+        with self._db.transaction() as cursor:
+            return self._rebuild_statistics(cursor)
+    
+    def _stats_snapshot(self, cursor, where, value):
+        """Ключ дня и PnL сделки, если она учитывается в статистике"""
+        cursor.execute(f"SELECT status, profit_loss, timestamp, source FROM trades WHERE {where} = ?", (value,))
+        row = cursor.fetchone()
+        if not row or row[0] != 'CLOSED' or row[1] is None or row[2] is None:
+            return None
+        return self._stats_key(row[2], row[3]), row[1]
+
     def add_trade(self, trade_data):
         """Добавление новой сделки"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO trades (trade_id, symbol, type, direction, entry_price, exit_price,
-                              stop_loss, take_profit, volume, status, profit_loss, timestamp,
-                              close_timestamp, source, comment)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            trade_data.get('trade_id'),
-            trade_data.get('symbol'),
-            trade_data.get('type'),
-            trade_data.get('direction'),
-            trade_data.get('entry_price'),
-            trade_data.get('exit_price'),
-            trade_data.get('stop_loss'),
-            trade_data.get('take_profit'),
-            trade_data.get('volume'),
-            trade_data.get('status'),
-            trade_data.get('profit_loss'),
-            trade_data.get('timestamp'),
-            trade_data.get('close_timestamp'),
-            trade_data.get('source'),
-            trade_data.get('comment')
-        ))
-        
-        conn.commit()
-        conn.close()
+        with self._db.transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO trades (trade_id, symbol, type, direction, entry_price, exit_price,
+                                  stop_loss, take_profit, volume, status, profit_loss, timestamp,
+                                  close_timestamp, source, comment)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                trade_data.get('trade_id'),
+                trade_data.get('symbol'),
+                trade_data.get('type'),
+                trade_data.get('direction'),
+                trade_data.get('entry_price'),
+                trade_data.get('exit_price'),
+                trade_data.get('stop_loss'),
+                trade_data.get('take_profit'),
+                trade_data.get('volume'),
+                trade_data.get('status'),
+                trade_data.get('profit_loss'),
+                trade_data.get('timestamp'),
+                trade_data.get('close_timestamp'),
+                trade_data.get('source'),
+                trade_data.get('comment')
+            ))
+            counted = self._stats_snapshot(cursor, 'id', cursor.lastrowid)
+            if counted:
+                (date, source), pnl = counted
+                self._append_trade_stats(cursor, date, source, pnl)
     
     def update_trade(self, trade_id, updates):
         """Обновление сделки"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        set_clause = ", ".join([f"{key} = ?" for key in updates.keys()])
-        values = list(updates.values()) + [trade_id]
+        with self._db.transaction() as cursor:
+            before = self._stats_snapshot(cursor, 'trade_id', trade_id)
+            set_clause = ", ".join([f"{key} = ?" for key in updates.keys()])
+            values = list(updates.values()) + [trade_id]
         
-        cursor.execute(f"UPDATE trades SET {set_clause} WHERE trade_id = ?", values)
-        
-        conn.commit()
-        conn.close()
+            cursor.execute(f"UPDATE trades SET {set_clause} WHERE trade_id = ?", values)
+            
+            # Статистика обновляется в той же транзакции: закрытие сделки - инкремент,
+            # изменение уже учтённой сделки - пересчёт затронутых дней
+            after = self._stats_snapshot(cursor, 'trade_id', trade_id)
+            if before is None and after is not None:
+                (date, source), pnl = after
+                self._append_trade_stats(cursor, date, source, pnl)
+            elif before is not None and before != after:
+                for date, source in {before[0], after[0] if after else before[0]}:
+                    self._recompute_day_stats(cursor, date, source)
     
-    def get_trades(self, limit=50, status=None, source=None):
-        """Получение списка сделок"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        query = "SELECT * FROM trades WHERE 1=1"
+    def _keyset_page(self, table, limit, cursor, filters, by_timestamp=True):
+        """
+        Страница строк от новых к старым с курсором (keyset-пагинация).
+        
+        Курсор - ключ последней строки предыдущей страницы: (timestamp, id) или id.
+        Запрос продолжает чтение индекса с этого ключа, поэтому стоимость страницы
+        не зависит от её номера и размера таблицы. Возвращает (строки, следующий курсор);
+        курсор None означает, что страниц больше нет.
+        """
+        query = f"SELECT * FROM {table} WHERE 1=1"
         params = []
         
-        if status:
-            query += " AND status = ?"
-            params.append(status)
+        for column, value in filters.items():
+            if value:
+                query += f" AND {column} = ?"
+                params.append(value)
         
-        if source:
-            query += " AND source = ?"
-            params.append(source)
+        if cursor is not None:
+            if by_timestamp:
+                query += " AND (timestamp, id) < (?, ?)"
+                params.extend(cursor)
+            else:
+                query += " AND id < ?"
+                params.append(cursor)
         
-        query += " ORDER BY timestamp DESC LIMIT ?"
+        query += " ORDER BY timestamp DESC, id DESC LIMIT ?" if by_timestamp else " ORDER BY id DESC LIMIT ?"
         params.append(limit)
         
-        cursor.execute(query, params)
-        trades = cursor.fetchall()
-        
-        # Получаем названия колонок
-        column_names = [description[0] for description in cursor.description]
-        
-        # Преобразуем кортежи в словари
-        trades_dict = []
-        for trade in trades:
-            trade_dict = dict(zip(column_names, trade))
-            trades_dict.append(trade_dict)
-        
-        conn.close()
-        return trades_dict
+        # Строки сразу преобразуются в словари по названиям колонок
+        rows = self._ui_db.fetch_dicts(query, params)
+        if len(rows) < limit:
+            return rows, None
+        last = rows[-1]
+        return rows, ((last['timestamp'], last['id']) if by_timestamp else last['id'])
     
-    def get_trading_stats(self, days=30):
-        """Получение торговой статистики"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        date_from = datetime.now() - timedelta(days=days)
-        
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total_trades,
-                SUM(CASE WHEN profit_loss > 0 THEN 1 ELSE 0 END) as winning_trades,
-                SUM(CASE WHEN profit_loss < 0 THEN 1 ELSE 0 END) as losing_trades,
-                SUM(profit_loss) as total_profit,
-                MIN(profit_loss) as max_drawdown,
-                AVG(CASE WHEN profit_loss > 0 THEN profit_loss END) as avg_win,
-                AVG(CASE WHEN profit_loss < 0 THEN profit_loss END) as avg_loss
-            FROM trades 
-            WHERE timestamp >= ? AND status = 'CLOSED'
-        ''', (date_from,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result and result[0] > 0:
-            total_trades, winning_trades, losing_trades, total_profit, max_drawdown, avg_win, avg_loss = result
-            win_rate = (winning_trades / total_trades) * 100 if total_trades > 0 else 0
-            profit_factor = abs(avg_win / avg_loss) if avg_loss and avg_loss != 0 else 0
+    def get_trades_page(self, limit=50, cursor=None, status=None, source=None):
+        """Страница сделок: (строки, курсор следующей страницы)"""
+        return self._keyset_page('trades', limit, cursor, {'status': status, 'source': source})
+    
+    def get_trades(self, limit=50, status=None, source=None):
+        """Получение списка сделок"""
+        return self.get_trades_page(limit, None, status, source)[0]
+    
+    def get_trading_stats(self, days=30, source=None):
+        """Получение торговой статистики (сумма по дневным строкам таблицы statistics)"""
+        date_from = (datetime.now() - timedelta(days=days)).date().isoformat()
+        
+        rows = self._ui_db.fetchall('''
+            SELECT total_trades, winning_trades, losing_trades, total_profit, sum_win, sum_loss, peak, trough, max_drawdown
+            FROM statistics
+            WHERE date >= ? AND source = ?
+            ORDER BY date
+        ''', (date_from, source or STATS_ALL_SOURCES))
+        
+        total_trades = winning_trades = losing_trades = 0
+        total_profit = sum_win = sum_loss = 0.0
+        # Просадка по кривой накопленного PnL: склеиваем дни, перенося пик между ними
+        peak = max_drawdown = 0.0
+        for day_trades, day_wins, day_losses, day_profit, day_win, day_loss, day_peak, day_trough, day_dd in rows:
+            total_trades += day_trades
+            winning_trades += day_wins
+            losing_trades += day_losses
+            sum_win += day_win
+            sum_loss += day_loss
+            max_drawdown = max(max_drawdown, day_dd, peak - (total_profit + day_trough))
+            peak = max(peak, total_profit + day_peak)
+            total_profit += day_profit
+        
+        if total_trades > 0:
+            avg_win = sum_win / winning_trades if winning_trades else None
+            avg_loss = sum_loss / losing_trades if losing_trades else None
+            win_rate = (winning_trades / total_trades) * 100
+            profit_factor = abs(avg_win / avg_loss) if avg_win and avg_loss else 0
             
             return {
                 'total_trades': total_trades,
                 'winning_trades': winning_trades,
                 'losing_trades': losing_trades,
-                'total_profit': total_profit or 0,
-                'max_drawdown': abs(max_drawdown) if max_drawdown else 0,
+                'total_profit': total_profit,
+                'max_drawdown': max_drawdown,
                 'win_rate': win_rate,
                 'avg_win': avg_win or 0,
                 'avg_loss': avg_loss or 0,
@@ -329,200 +496,155 @@ class DatabaseService:
     
     def add_signal(self, signal_data):
         """Добавление нового сигнала"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO signals (signal_id, symbol, type, direction, entry_price,
-                               stop_loss, take_profit, volume, status, timestamp,
-                               source, channel, message_text)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            signal_data.get('signal_id'),
-            signal_data.get('symbol'),
-            signal_data.get('type'),
-            signal_data.get('direction'),
-            signal_data.get('entry_price'),
-            signal_data.get('stop_loss'),
-            signal_data.get('take_profit'),
-            signal_data.get('volume'),
-            signal_data.get('status'),
-            signal_data.get('timestamp'),
-            signal_data.get('source'),
-            signal_data.get('channel'),
-            signal_data.get('message_text')
-        ))
-        
-        conn.commit()
-        conn.close()
+        with self._db.transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO signals (signal_id, symbol, type, direction, entry_price,
+                                   stop_loss, take_profit, volume, status, timestamp,
+                                   source, channel, message_text)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                signal_data.get('signal_id'),
+                signal_data.get('symbol'),
+                signal_data.get('type'),
+                signal_data.get('direction'),
+                signal_data.get('entry_price'),
+                signal_data.get('stop_loss'),
+                signal_data.get('take_profit'),
+                signal_data.get('volume'),
+                signal_data.get('status'),
+                signal_data.get('timestamp'),
+                signal_data.get('source'),
+                signal_data.get('channel'),
+                signal_data.get('message_text')
+            ))
+    
+    def get_signals_page(self, limit=50, cursor=None, status=None, source=None):
+        """Страница сигналов: (строки, курсор следующей страницы)"""
+        return self._keyset_page('signals', limit, cursor, {'status': status, 'source': source})
     
     def get_signals(self, limit=50, status=None, source=None):
         """Получение списка сигналов"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        query = "SELECT * FROM signals WHERE 1=1"
-        params = []
-        
-        if status:
-            query += " AND status = ?"
-            params.append(status)
-        
-        if source:
-            query += " AND source = ?"
-            params.append(source)
-        
-        query += " ORDER BY timestamp DESC LIMIT ?"
-        params.append(limit)
-        
-        cursor.execute(query, params)
-        signals = cursor.fetchall()
-        
-        # Получаем названия колонок
-        column_names = [description[0] for description in cursor.description]
-        
-        # Преобразуем кортежи в словари
-        signals_dict = []
-        for signal in signals:
-            signal_dict = dict(zip(column_names, signal))
-            signals_dict.append(signal_dict)
-        
-        conn.close()
-        return signals_dict
+        return self.get_signals_page(limit, None, status, source)[0]
     
     def add_channel(self, channel_data):
         """Добавление нового канала"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO channels (channel_name, channel_id, is_active, added_at,
-                                           last_message_at, message_count, signal_count)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            channel_data.get('channel_name'),
-            channel_data.get('channel_id'),
-            channel_data.get('is_active', True),
-            channel_data.get('added_at', datetime.now()),
-            channel_data.get('last_message_at'),
-            channel_data.get('message_count', 0),
-            channel_data.get('signal_count', 0)
-        ))
-        
-        conn.commit()
-        conn.close()
+        with self._db.transaction() as cursor:
+            cursor.execute('''
+                INSERT OR REPLACE INTO channels (channel_name, channel_id, is_active, added_at,
+                                               last_message_at, message_count, signal_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                channel_data.get('channel_name'),
+                channel_data.get('channel_id'),
+                channel_data.get('is_active', True),
+                channel_data.get('added_at', datetime.now()),
+                channel_data.get('last_message_at'),
+                channel_data.get('message_count', 0),
+                channel_data.get('signal_count', 0)
+            ))
     
     def get_channels(self, active_only=True):
         """Получение списка каналов"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         query = "SELECT * FROM channels"
         if active_only:
             query += " WHERE is_active = 1"
         query += " ORDER BY added_at DESC"
         
-        cursor.execute(query)
-        channels = cursor.fetchall()
-        
-        conn.close()
-        return channels
+        return self._db.fetchall(query)
     
-    def add_log(self, level, source, message):
-        """Добавление лога"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+    def add_log(self, level, source, message=None):
+        """Добавление лога (не блокирует: запись попадает в буфер и сбрасывается в фоне)"""
+        if message is None:
+            # Вызов в стиле core: add_log(level, message)
+            source, message = None, source
+        self.log_sink.emit(level, message, source)
+    
+    def _flush_logs(self, records):
+        """Пакетная запись накопленных логов одной транзакцией"""
+        self._db.executemany_write('''
             INSERT INTO logs (timestamp, level, source, message)
             VALUES (?, ?, ?, ?)
-        ''', (datetime.now(), level, source, message))
-        
-        conn.commit()
-        conn.close()
+        ''', [(ts, level, source, message) for _, ts, level, source, message in records])
+    
+    def _preload_logs(self):
+        """Заполнение кольцевого буфера последними логами из базы"""
+        rows = self._db.fetchall('''
+            SELECT id, timestamp, level, source, message FROM logs ORDER BY id DESC LIMIT ?
+        ''', (self.log_sink.capacity,))
+        self.log_sink.preload(reversed(rows))
     
     def get_logs(self, limit=100, level=None, source=None):
-        """Получение логов"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        query = "SELECT * FROM logs WHERE 1=1"
-        params = []
+        """Получение логов (из памяти; к базе обращаемся только за записями старше буфера)"""
+        logs = self.log_sink.recent(limit, level, source)
+        if len(logs) >= limit or not self.log_sink.is_full:
+            return logs
         
-        if level:
-            query += " AND level = ?"
-            params.append(level)
-        
-        if source:
-            query += " AND source = ?"
-            params.append(source)
-        
-        query += " ORDER BY timestamp DESC LIMIT ?"
-        params.append(limit)
-        
-        cursor.execute(query, params)
-        logs = cursor.fetchall()
-        
-        conn.close()
-        return logs
+        self.log_sink.flush()
+        return [tuple(row.values()) for row in self.get_logs_page(limit, None, level, source)[0]]
+    
+    def get_logs_page(self, limit=100, cursor=None, level=None, source=None):
+        """Страница логов из базы (курсор - id последней записи): (строки, следующий курсор)"""
+        self.log_sink.flush()
+        return self._keyset_page('logs', limit, cursor, {'level': level, 'source': source}, by_timestamp=False)
+    
+    def save_deals(self, deals):
+        """Сохранение сделок MT5 (словари normalize_deal) одной транзакцией; повторы игнорируются"""
+        return self._db.executemany_write(INSERT_DEAL_SQL, [deal_row(d) for d in deals])
+    
+    def get_last_deal(self):
+        """(тикет, время) последней сохранённой сделки или None - курсор ленты сделок"""
+        return self._db.fetchone("SELECT ticket, time FROM deals ORDER BY ticket DESC LIMIT 1")
+    
+    def get_deals(self, since=None, position_id=None, limit=None):
+        """Сделки из локальной таблицы по возрастанию времени (since - datetime или секунды)"""
+        query, params = "SELECT * FROM deals WHERE 1=1", []
+        if since is not None:
+            query += " AND time >= ?"
+            params.append(int(since.timestamp()) if isinstance(since, datetime) else int(since))
+        if position_id is not None:
+            query += " AND position_id = ?"
+            params.append(position_id)
+        query += " ORDER BY time, ticket"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        return self._ui_db.fetch_dicts(query, params)
     
     def save_setting(self, category, key, value):
-        """Сохранение настройки"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO settings (category, key, value, updated_at)
-            VALUES (?, ?, ?, ?)
-        ''', (category, key, json.dumps(value), datetime.now()))
-        
-        conn.commit()
-        conn.close()
+        """Сохранение настройки (сквозная запись в таблицу + уведомление подписчиков)"""
+        self.settings_store.set(category, key, value)
+    
+    def save_settings(self, settings):
+        """Сохранение пачки настроек {категория: {ключ: значение}} одной транзакцией"""
+        return self.settings_store.update(settings)
     
     def get_setting(self, category, key, default=None):
         """Получение настройки"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT value FROM settings WHERE category = ? AND key = ?
-        ''', (category, key))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            try:
-                return json.loads(result[0])
-            except:
-                return result[0]
-        
-        return default
+        return self.settings_store.get(category, key, default)
     
     def get_all_settings(self, category=None):
         """Получение всех настроек"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        query = "SELECT category, key, value FROM settings"
-        params = []
-        
-        if category:
-            query += " WHERE category = ?"
-            params.append(category)
-        
-        cursor.execute(query, params)
-        settings = cursor.fetchall()
-        
-        conn.close()
-        
-        result = {}
-        for category, key, value in settings:
-            if category not in result:
-                result[category] = {}
-            try:
-                result[category][key] = json.loads(value)
-            except:
-                result[category][key] = value
-        
-        return result 
\ No newline at end of file
+        return self.settings_store.get_all(category)
+    
+    def get_db_stats(self):
+        """Счётчики запросов и время выполнения (для бенчмарков и диагностики)"""
+        stats = self._db.get_stats()
+        stats['ui_pool'] = self._ui_db.get_stats()
+        return stats
+    
+    def start_maintenance(self, **options):
+        """Запуск фонового ретеншна логов/сигналов и инкрементального VACUUM"""
+        if self.maintenance is None:
+            name = os.path.splitext(os.path.basename(self.db_path))[0]
+            options.setdefault('archive_dir', os.path.join(os.path.dirname(self.db_path), 'archive', name))
+            self.maintenance = DatabaseMaintenance(self.db_path, **options)
+            self.maintenance.start()
+        return self.maintenance
+    
+    def close(self):
+        """Закрытие всех соединений с базой"""
+        if self.maintenance:
+            self.maintenance.stop()
+        self.log_sink.close()
+        self._db.close()
+        self._ui_db.close()
\ No newline at end of file
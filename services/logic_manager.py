@@ -1,8 +1,12 @@
 import threading
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 
+from config import DB_MAINTENANCE_CONFIG, MT5_CONFIG, TRAILING_CONFIG
+from utils.account_snapshot import AccountSnapshotPoller
+from utils.deal_feed import DealFeed
+
 # Импорты сервисов
 try:
     from .mt5_service import MT5Service
@@ -68,6 +72,12 @@ class LogicManager:
         self.trade_manager = None
         self.database = None
         self.smc_strategy = None
+        self.account_snapshot = None
+        self.deal_feed = None
+        self._stop_event_stream = None
+        self.trailing_stop = None
+        self._stop_tick_stream = None
+        self._tick_symbols = []
         
         # Состояние системы
         self.is_running = False
@@ -80,7 +90,7 @@ class LogicManager:
         self._initialize_services()
 
     def _load_settings(self):
-        # Пример: загрузка настроек из базы, если есть
+        # Загрузка настроек из кэша базы (таблица читается один раз)
         if self.database:
             try:
                 return self.database.get_all_settings()
@@ -88,14 +98,21 @@ class LogicManager:
                 return {}
         return {}
 
+    def _on_settings_changed(self, changes):
+        # Подписка на хранилище настроек: self.settings всегда актуален
+        self.settings = self.database.get_all_settings()
+        if self.signal_processor:
+            self.signal_processor.update_settings(self.settings)
+        if 'trading' in changes and self.trade_manager:
+            self.trade_manager.update_settings(changes['trading'])
+        if 'smc' in changes and self.smc_strategy:
+            self.smc_strategy.update_settings(changes['smc'])
+
     def update_settings(self, new_settings):
-        # Сохраняет настройки в базу и обновляет self.settings
+        # Сохраняет настройки в базу одной транзакцией; self.settings обновит подписка
         try:
             if self.database:
-                for category, values in new_settings.items():
-                    for key, value in values.items():
-                        self.database.save_setting(category, key, value)
-                self.settings = self.database.get_all_settings()
+                self.database.save_settings(new_settings)
                 return True
         except Exception as e:
             print(f"Ошибка сохранения настроек: {e}")
@@ -127,6 +144,9 @@ class LogicManager:
             # База данных (всегда доступна)
             if DATABASE_AVAILABLE:
                 self.database = DatabaseService()
+                self.database.start_maintenance(**DB_MAINTENANCE_CONFIG)
+                self.settings = self._load_settings()
+                self.database.settings_store.subscribe(self._on_settings_changed)
                 print("✅ DatabaseService инициализирован")
             
             # MT5 сервис - универсальный режим
@@ -144,11 +164,33 @@ class LogicManager:
                 )
                 print("✅ MT5Service инициализирован")
                 
+                # Один опрос позиций/счёта на аккаунт; потребители читают снимок из памяти
+                self.account_snapshot = AccountSnapshotPoller(
+                    self._fetch_positions, self._fetch_account_info,
+                    interval=MT5_CONFIG.get('snapshot_interval', 1.0)
+                )
+                # Сделки догружаются инкрементально в таблицу deals; первая загрузка - за 30 дней
+                self.deal_feed = DealFeed(self.mt5.get_deals_since, store=self.database, bootstrap_days=30)
+                
+                # Трейлинг: позиции - из снимка, тики - из потока событий сервера или опросом
+                if TRAILING_CONFIG.get('enabled'):
+                    try:
+                        from utils.trailing_stop import TrailingStopEngine, load_rule
+                        self.trailing_stop = TrailingStopEngine(
+                            load_rule(TRAILING_CONFIG['rule_file']), modify=self.mt5.modify_many,
+                            min_step_points=TRAILING_CONFIG.get('min_step_points', 20),
+                            symbol_point=self._symbol_point
+                        )
+                        self.account_snapshot.subscribe(self._on_snapshot_for_trailing)
+                    except Exception as e:
+                        print(f"⚠️ Трейлинг-стоп недоступен: {e}")
+                
                 # Автоматически инициализируем MT5 при запуске
                 try:
                     success, message = self.mt5.initialize()
                     if success:
                         print(f"✅ MT5 автоматически подключен: {message}")
+                        self.start_account_snapshot()
                     else:
                         print(f"⚠️ MT5 не подключен: {message}")
                 except Exception as e:
@@ -178,7 +220,7 @@ class LogicManager:
                     db_service=self.database,
                     gpt_service=self.gpt,
                     mt5_service=self.mt5,
-                    settings={},  # Пустые настройки по умолчанию
+                    settings=self.settings,  # Дальнейшие изменения приходят через подписку
                     channels={},  # Пустые каналы по умолчанию
                     page=None  # Страница не нужна для LogicManager
                 )
@@ -200,6 +242,7 @@ class LogicManager:
                 success, message = self.mt5.initialize()
                 if success:
                     print(f"✅ MT5 запущен: {message}")
+                    self.start_account_snapshot()
                 else:
                     print(f"⚠️ MT5 не запущен: {message}")
             
@@ -249,7 +292,17 @@ class LogicManager:
                 self.telegram.shutdown()
                 print("🛑 Telegram остановлен")
             
-            # Остановка MT5
+            # Остановка опроса счёта и MT5
+            if self._stop_event_stream:
+                self._stop_event_stream()
+                self._stop_event_stream = None
+            if self._stop_tick_stream:
+                self._stop_tick_stream()
+                self._stop_tick_stream, self._tick_symbols = None, []
+            if self.trailing_stop:
+                self.trailing_stop.stop()
+            if self.account_snapshot:
+                self.account_snapshot.stop()
             if self.mt5:
                 self.mt5.shutdown()
                 print("🛑 MT5 остановлен")
@@ -350,6 +403,7 @@ class LogicManager:
                 'available': SMC_AVAILABLE,
                 'running': self.smc_strategy.is_running if self.smc_strategy else False
             },
+            'trailing_stop': self.trailing_stop.get_stats() if self.trailing_stop else {'positions': 0},
             'system': {
                 'running': self.is_running,
                 'auto_update': self.auto_update_thread.is_alive() if self.auto_update_thread else False
@@ -378,41 +432,110 @@ class LogicManager:
         """Получение истории сигналов (алиас для get_recent_signals)"""
         return self.get_recent_signals(limit)
     
-    def get_mt5_positions(self):
-        """Получение открытых позиций из MT5"""
+    def get_signal_history_page(self, limit=50, cursor=None):
+        """Страница истории сигналов: (сигналы, курсор следующей страницы)"""
+        if self.database:
+            return self.database.get_signals_page(limit=limit, cursor=cursor)
+        return [], None
+    
+    def _fetch_positions(self):
+        # None (а не []) при отключённом MT5: опрос не должен принять это за закрытие всех позиций
         if self.mt5 and self.mt5.is_initialized:
-            try:
-                # Используем методы MT5Service
-                if hasattr(self.mt5, 'get_positions'):
-                    return self.mt5.get_positions()
-                else:
-                    # Демо-режим или метод не реализован
-                    return []
-            except Exception as e:
-                print(f"Ошибка получения позиций MT5: {e}")
-                return []
+            return self.mt5.get_positions()
+        return None
+    
+    def _fetch_account_info(self):
+        if self.mt5 and self.mt5.is_initialized:
+            return self.mt5.get_account_info()
+        return None
+    
+    def start_account_snapshot(self):
+        """Запуск фонового опроса позиций и счёта (первый снимок - сразу)"""
+        if self.account_snapshot and not self.account_snapshot.is_running:
+            self.account_snapshot.poll_once()
+            self.account_snapshot.start()
+        if self.mt5 and self._stop_event_stream is None:
+            # Во Flask-режиме сервер сам сообщает об изменениях - обновляемся сразу, не дожидаясь опроса
+            self._stop_event_stream = self.mt5.subscribe_events(self._on_mt5_event)
+    
+    def _on_mt5_event(self, event_type, data):
+        if event_type.startswith('position_') and self.account_snapshot:
+            self.account_snapshot.poll_once()
+        elif event_type == 'deal' and self.deal_feed:
+            self.deal_feed.poll()
+    
+    def _on_snapshot_for_trailing(self, event):
+        if event['opened'] or event['closed'] or event['modified']:
+            self.trailing_stop.sync(self.account_snapshot.get_positions())
+            self._update_tick_source()
+    
+    def _symbol_point(self, symbol):
+        """Пункт символа из symbol_info (без point - по digits), None - параметров нет"""
+        info = self.mt5.get_symbol_info(symbol) or {}
+        if info.get('point'):
+            return info['point']
+        return 10.0 ** -info['digits'] if info.get('digits') is not None else None
+    
+    def _update_tick_source(self):
+        """Подписка на тики символов с открытыми позициями (переподписка при смене набора)"""
+        symbols = self.trailing_stop.symbols
+        if self.mt5.mode != "flask":
+            if symbols and not self.trailing_stop.is_running:
+                self.trailing_stop.start(self.mt5.get_tick, TRAILING_CONFIG.get('tick_interval', 0.25))
+            return
+        if symbols == self._tick_symbols:
+            return
+        if self._stop_tick_stream:
+            self._stop_tick_stream()
+            self._stop_tick_stream = None
+        self._tick_symbols = symbols
+        if symbols:
+            self._stop_tick_stream = self.mt5.subscribe_events(self._on_tick_event, symbols=symbols)
+    
+    def _on_tick_event(self, event_type, data):
+        if event_type == 'tick' and data.get('bid') and data.get('ask'):
+            self.trailing_stop.on_tick(data['symbol'], data['bid'], data['ask'])
+    
+    def _ensure_snapshot(self):
+        # Без фонового опроса (MT5 подключили позже) снимаем состояние синхронно
+        if self.account_snapshot and not self.account_snapshot.is_running:
+            self.account_snapshot.poll_once()
+        return self.account_snapshot
+    
+    def get_mt5_positions(self):
+        """Открытые позиции MT5 из последнего снимка (список словарей)"""
+        if self.mt5 and self.mt5.is_initialized and self._ensure_snapshot():
+            return self.account_snapshot.get_positions()
         return []
     
     def get_mt5_account_info(self):
-        """Получение информации об аккаунте MT5"""
-        if self.mt5 and self.mt5.is_initialized:
-            try:
-                return self.mt5.get_account_info()
-            except Exception as e:
-                print(f"Ошибка получения информации об аккаунте MT5: {e}")
-                return None
+        """Информация об аккаунте MT5 из последнего снимка"""
+        if self.mt5 and self.mt5.is_initialized and self._ensure_snapshot():
+            return self.account_snapshot.get_account()
         return None
     
     def get_mt5_deals_history(self, days=7):
-        """Получение истории сделок из MT5"""
-        if self.mt5 and self.mt5.is_initialized:
+        """История сделок MT5 за days дней из локальной таблицы (догружаются только новые сделки)"""
+        if self.mt5 and self.mt5.is_initialized and self.deal_feed:
             try:
-                return self.mt5.get_deals_in_history(days)
+                self.deal_feed.poll()
             except Exception as e:
                 print(f"Ошибка получения истории сделок MT5: {e}")
-                return []
+        if self.database:
+            return self.database.get_deals(since=datetime.now() - timedelta(days=days))
         return []
     
+    def export_history(self, out_dir='data/export', fmt='parquet', since=None, deals_days=365):
+        """Выгрузка сделок, сигналов и истории сделок MT5 в помесячные Parquet/Arrow файлы"""
+        from utils.columnar_export import export_all, export_deals
+        report = {}
+        if self.database:
+            report.update(export_all(self.database.db_path, out_dir, fmt, since))
+        deals = self.get_mt5_deals_history(deals_days)
+        if deals:
+            report['deals'] = export_deals(deals, out_dir, fmt)
+        return report
+    
     def get_mt5_rates(self, symbol, timeframe, count=100):
         """Получение котировок из MT5"""
         if self.mt5 and self.mt5.is_initialized:
@@ -423,6 +546,17 @@ class LogicManager:
                 return None
         return None
     
+    def get_mt5_multi_timeframe(self, symbol, timeframes=None, count=100):
+        """Котировки нескольких таймфреймов из одной базовой серии MT5"""
+        if self.mt5 and self.mt5.is_initialized:
+            try:
+                return self.mt5.get_multi_timeframe(symbol, timeframes or MT5_CONFIG["timeframes"], count,
+                                                    base_timeframe=MT5_CONFIG.get("base_timeframe", "M1"))
+            except Exception as e:
+                print(f"Ошибка получения котировок MT5: {e}")
+                return None
+        return None
+    
     def update_smc_settings(self, settings):
         """Обновление настроек SMC стратегии"""
         if self.smc_strategy:
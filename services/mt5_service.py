@@ -1,10 +1,22 @@
 import sys
 import os
+import json
+import threading
 import time
+import numpy as np
 import pandas as pd
 import requests
 from datetime import datetime, timedelta
 
+from utils.ttl_cache import TTLCache
+from utils.rates_codec import (RATES_MEDIA_TYPE, ARROW_MEDIA_TYPE, JSON_MEDIA_TYPE, RATES_STREAM_MEDIA_TYPE,
+                               NDJSON_MEDIA_TYPE, decode_response, rates_to_dataframe, iter_frames,
+                               columns_to_array, to_rates_array)
+from utils.bar_store import BarStore, TIMEFRAME_SECONDS, range_windows
+from utils.resample import (TimeframeAggregator, base_bars_needed, choose_base_timeframe, plan_base_timeframes,
+                            range_fetch_end, resample_range)
+from utils.synthetic_market import generate_bars, generate_dataframe, symbol_profile
+
 # Импорт MetaTrader5 с обработкой ошибки
 try:
     import MetaTrader5 as mt5
@@ -21,7 +33,9 @@ class MT5Service:
     1. Локальный (через библиотеку MetaTrader5) - для Windows
     2. Удалённый (через Flask API) - для macOS/Linux
     """
-    def __init__(self, path="", login="", password="", server="", flask_url=""):
+    def __init__(self, path="", login="", password="", server="", flask_url="",
+                 symbol_info_ttl=300.0, tick_ttl=0.5, rates_format="binary", rates_compression=False,
+                 demo_seed=None):
         self.path = path
         self.login = login
         self.password = password
@@ -29,6 +43,18 @@ class MT5Service:
         self.flask_url = flask_url
         self.is_initialized = False
         self.mode = self._determine_mode()
+        # Параметры символа (digits, point, шаг объёма, stops level) почти не меняются - долгий TTL;
+        # тики живут доли секунды, чтобы закрытие нескольких позиций по символу стоило одного запроса
+        self.symbol_cache = TTLCache(symbol_info_ttl)
+        self.tick_cache = TTLCache(tick_ttl)
+        # Формат баров от Flask API: "binary" (колонки little-endian), "arrow" (Arrow IPC) или "json";
+        # сервер без поддержки бинарного формата ответит JSON
+        self.rates_format = rates_format
+        self.rates_compression = rates_compression
+        # Сборщики старших таймфреймов по (символ, базовый таймфрейм) для get_multi_timeframe
+        self._aggregators = {}
+        # Демо котировки - одна последовательность на сервис (без пересева при каждом вызове)
+        self._demo_rng = np.random.default_rng(demo_seed)
         
     def _determine_mode(self):
         """Определяет режим работы: локальный или через Flask API"""
@@ -47,6 +73,7 @@ class MT5Service:
 
     def initialize(self):
         """Инициализация MT5 в зависимости от режима"""
+        self.invalidate_cache()
         try:
             if self.mode == "local":
                 return self._initialize_local()
@@ -119,10 +146,135 @@ class MT5Service:
 
     def shutdown(self):
         """Завершение работы MT5"""
+        self.invalidate_cache()
         if self.mode == "local" and self.is_initialized and MT5_AVAILABLE:
             mt5.shutdown()
         self.is_initialized = False
 
+    def _symbol_info(self, symbol):
+        """Параметры символа из кэша (в локальном режиме - объект MT5, во Flask - словарь)"""
+        return self.symbol_cache.get_or_load(symbol, lambda: self._fetch(symbol, "symbol_info"))
+    
+    def _tick(self, symbol):
+        """Последний тик символа из кэша с коротким TTL"""
+        return self.tick_cache.get_or_load(symbol, lambda: self._fetch(symbol, "tick"))
+    
+    def _fetch(self, symbol, kind):
+        """
+        Запрос symbol_info/тика (None при ошибке).
+        
+        В режиме auto сначала спрашивается открытый терминал, затем Flask API
+        (если задан flask_url); в демо-режиме значения строятся по профилю
+        символа синтетического рынка.
+        """
+        try:
+            if self.mode in ("local", "auto"):
+                result = None
+                if MT5_AVAILABLE:
+                    result = mt5.symbol_info(symbol) if kind == "symbol_info" else mt5.symbol_info_tick(symbol)
+                if result is not None or self.mode == "local" or not self.flask_url:
+                    return result
+                return self._fetch_flask(symbol, kind)
+            elif self.mode == "flask":
+                return self._fetch_flask(symbol, kind)
+            else:
+                return self._demo_symbol_data(symbol, kind)
+        except Exception as e:
+            self._log_error(f"Ошибка получения {kind} для {symbol}: {e}")
+        return None
+    
+    def _fetch_flask(self, symbol, kind):
+        response = requests.get(f"{self.flask_url}/{kind}", params={"symbol": symbol}, timeout=10)
+        if response.status_code == 200:
+            data = response.json()
+            return data.get(kind) if data.get("success") else None
+        return None
+    
+    def _demo_symbol_data(self, symbol, kind):
+        """Демо symbol_info/тик: точность и спред из профиля символа, цена - последний синтетический бар"""
+        profile = symbol_profile(symbol)
+        point = 10.0 ** -profile["digits"]
+        if kind == "symbol_info":
+            return {"name": symbol, "digits": profile["digits"], "point": point, "spread": profile["spread"],
+                    "trade_stops_level": 0, "trade_contract_size": 100.0 if "XAU" in symbol else 100000.0,
+                    "volume_min": 0.01, "volume_max": 100.0, "volume_step": 0.01, "visible": True}
+        bar = generate_bars(symbol, "M1", 1, seed=self._demo_rng)[0]
+        bid = float(bar["close"])
+        return {"time": int(time.time()), "bid": bid, "ask": round(bid + int(bar["spread"]) * point, profile["digits"]),
+                "last": 0.0, "volume": 0, "time_msc": int(time.time() * 1000), "flags": 6, "volume_real": 0.0}
+    
+    def get_symbol_info(self, symbol):
+        """Параметры символа в виде словаря (кэшируются до переподключения или истечения TTL)"""
+        info = self._symbol_info(symbol)
+        return info._asdict() if hasattr(info, "_asdict") else info
+    
+    def get_tick(self, symbol):
+        """Текущий тик символа в виде словаря (bid, ask, time, ...)"""
+        tick = self._tick(symbol)
+        return tick._asdict() if hasattr(tick, "_asdict") else tick
+    
+    def invalidate_cache(self):
+        """Сброс кэша параметров символов и тиков"""
+        self.symbol_cache.invalidate()
+        self.tick_cache.invalidate()
+    
+    def get_cache_stats(self):
+        """Счётчики попаданий/промахов кэшей symbol_info и тиков"""
+        return {"symbol_info": self.symbol_cache.get_stats(), "tick": self.tick_cache.get_stats()}
+
+    def subscribe_events(self, callback, symbols=(), reconnect_delay=2.0):
+        """
+        Подписка на push-события mt5_server (/stream, Server-Sent Events) - только во Flask-режиме.
+        
+        callback(event_type, data) вызывается из фонового потока для событий tick,
+        position_opened/closed/modified и deal. При обрыве поток переподключается
+        с Last-Event-ID, и сервер досылает пропущенные события.
+        Возвращает функцию остановки подписки или None, если режим не поддерживает поток.
+        """
+        if self.mode != "flask":
+            return None
+        
+        stop = threading.Event()
+        
+        def run():
+            last_event_id = None
+            while not stop.is_set():
+                try:
+                    headers = {"Accept": "text/event-stream"}
+                    if last_event_id is not None:
+                        headers["Last-Event-ID"] = str(last_event_id)
+                    with requests.get(f"{self.flask_url}/stream", params={"symbols": ",".join(symbols)},
+                                      headers=headers, stream=True, timeout=(5, 60)) as response:
+                        event_type, data_lines = "message", []
+                        for line in response.iter_lines(decode_unicode=True):
+                            if stop.is_set():
+                                return
+                            if line is None:
+                                continue
+                            if not line:
+                                # Пустая строка завершает событие
+                                if data_lines:
+                                    try:
+                                        callback(event_type, json.loads("\n".join(data_lines)))
+                                    except Exception as e:
+                                        self._log_error(f"Ошибка обработчика события {event_type}: {e}")
+                                event_type, data_lines = "message", []
+                            elif line.startswith(":"):
+                                continue
+                            elif line.startswith("event:"):
+                                event_type = line[6:].strip()
+                            elif line.startswith("data:"):
+                                data_lines.append(line[5:].strip())
+                            elif line.startswith("id:"):
+                                last_event_id = int(line[3:].strip())
+                except Exception as e:
+                    if not stop.is_set():
+                        self._log_error(f"Поток событий прерван: {e}")
+                stop.wait(reconnect_delay)
+        
+        threading.Thread(target=run, name="mt5-event-stream", daemon=True).start()
+        return stop.set
+
     def get_account_info(self):
         """Получение информации об аккаунте"""
         if not self.is_initialized:
@@ -147,15 +299,17 @@ class MT5Service:
             return None
 
     def get_positions(self):
-        """Получение всех открытых позиций"""
+        """Получение всех открытых позиций; None, если список получить не удалось (а не "позиций нет")"""
         if not self.is_initialized:
-            return []
+            return None
         
         try:
             if self.mode == "local":
                 if MT5_AVAILABLE:
                     positions = mt5.positions_get()
-                    return [pos._asdict() for pos in positions] if positions else []
+                    if positions is None:
+                        return None
+                    return [pos._asdict() for pos in positions]
             elif self.mode == "flask":
                 response = requests.get(f"{self.flask_url}/positions", timeout=10)
                 if response.status_code == 200:
@@ -164,7 +318,8 @@ class MT5Service:
                 return []  # Демо режим
         except Exception as e:
             self._log_error(f"Ошибка получения позиций: {e}")
-            return []
+            return None
+        return None
 
     def get_open_positions_by_ticket(self, tickets):
         """Получение позиций по тикетам"""
@@ -186,111 +341,108 @@ class MT5Service:
             self._log_error(f"Ошибка получения позиций по тикетам: {e}")
             return []
 
-    def get_historical_data(self, symbol, timeframe, start_date, end_date):
-        """Получение исторических данных для бэктеста"""
+    def get_historical_data(self, symbol, timeframe, start_date, end_date, base_timeframe="M1", max_base_bars=100000):
+        """
+        Получение исторических данных для бэктеста.
+        
+        Если за диапазон выходит не больше max_base_bars баров base_timeframe,
+        грузятся они, а таймфрейм собирается локально (utils/resample.py),
+        иначе таймфрейм грузится напрямую.
+        """
         if not self.is_initialized:
             return None
         
         try:
-            if self.mode == "local":
-                if MT5_AVAILABLE:
-                    # Преобразуем таймфрейм из строки в константу MT5
-                    tf_map = {
-                        "M1": mt5.TIMEFRAME_M1,
-                        "M5": mt5.TIMEFRAME_M5,
-                        "M15": mt5.TIMEFRAME_M15,
-                        "M30": mt5.TIMEFRAME_M30,
-                        "H1": mt5.TIMEFRAME_H1,
-                        "H4": mt5.TIMEFRAME_H4,
-                        "D1": mt5.TIMEFRAME_D1
-                    }
-                    mt5_timeframe = tf_map.get(timeframe, mt5.TIMEFRAME_H1)
-                    
-                    # Выбираем символ
-                    if not mt5.symbol_select(symbol, True):
-                        self._log_error(f"Could not select {symbol}")
-                        return None
-                    
-                    # Получаем исторические данные
-                    rates = mt5.copy_rates_range(symbol, mt5_timeframe, start_date, end_date)
-                    if rates is None or len(rates) == 0:
-                        return None
-                    
-                    return rates
-            elif self.mode == "flask":
-                response = requests.get(f"{self.flask_url}/historical_data", 
-                                     params={
-                                         "symbol": symbol, 
-                                         "timeframe": timeframe,
-                                         "start_date": start_date.isoformat(),
-                                         "end_date": end_date.isoformat()
-                                     }, 
-                                     timeout=30)
-                if response.status_code == 200:
-                    return response.json()
-            else:
+            if self.mode == "demo":
                 # Демо режим - генерируем демо-данные
                 return self._generate_demo_historical_data(symbol, timeframe, start_date, end_date)
+            base = choose_base_timeframe(timeframe, base_timeframe, (end_date - start_date).total_seconds(), max_base_bars)
+            chunks = list(self.iter_historical_data(symbol, base, start_date, range_fetch_end(end_date, timeframe, base)))
+            if not chunks:
+                return None
+            return resample_range(np.concatenate(chunks), timeframe, base, start_date, end_date)
         except Exception as e:
             self._log_error(f"Ошибка получения исторических данных для {symbol}: {e}")
             return None
     
-    def _generate_demo_historical_data(self, symbol, timeframe, start_date, end_date):
-        """Генерация демо исторических данных"""
-        import numpy as np
+    def iter_historical_data(self, symbol, timeframe, start_date, end_date, chunk_bars=50000):
+        """
+        История за диапазон блоками (структурированные массивы как у copy_rates_range).
         
-        # Определяем количество баров в зависимости от таймфрейма
-        tf_minutes = {
-            "M1": 1, "M5": 5, "M15": 15, "M30": 30,
-            "H1": 60, "H4": 240, "D1": 1440
-        }
-        minutes = tf_minutes.get(timeframe, 60)
-        
-        # Рассчитываем количество баров
-        time_diff = end_date - start_date
-        total_minutes = time_diff.total_seconds() / 60
-        num_bars = int(total_minutes / minutes)
+        В локальном режиме диапазон режется на окна по chunk_bars баров, во Flask
+        режиме сервер отдаёт блоки потоком по мере чтения - в памяти одновременно
+        не больше одного блока. Ошибки и обрыв потока пробрасываются вызывающему.
+        """
+        if not self.is_initialized:
+            return
         
-        # Базовая цена для разных символов
-        base_prices = {
-            "EURUSD": 1.1000, "GBPUSD": 1.3000, "USDJPY": 110.00,
-            "AUDUSD": 0.7500, "USDCAD": 1.2500, "XAUUSD": 1800.00
+        if self.mode in ("local", "auto"):
+            if not MT5_AVAILABLE:
+                return
+            mt5_timeframe = self._mt5_timeframe(timeframe)
+            if not mt5.symbol_select(symbol, True):
+                self._log_error(f"Could not select {symbol}")
+                return
+            for window_start, window_end in range_windows(start_date, end_date, timeframe, chunk_bars):
+                rates = mt5.copy_rates_range(symbol, mt5_timeframe, window_start, window_end)
+                if rates is None:
+                    raise RuntimeError(f"copy_rates_range failed: {mt5.last_error()}")
+                if len(rates):
+                    yield rates
+        elif self.mode == "flask":
+            params = {"symbol": symbol, "timeframe": timeframe, "chunk_bars": chunk_bars,
+                      "start_date": start_date.isoformat(), "end_date": end_date.isoformat()}
+            if self.rates_compression:
+                params["compress"] = "zlib"
+            with requests.get(f"{self.flask_url}/historical_data", params=params, stream=True,
+                              headers={"Accept": f"{RATES_STREAM_MEDIA_TYPE}, {NDJSON_MEDIA_TYPE};q=0.5"},
+                              timeout=30) as response:
+                response.raise_for_status()
+                if response.headers.get("Content-Type", "").startswith(RATES_STREAM_MEDIA_TYPE):
+                    for columns in iter_frames(response.iter_content(chunk_size=65536)):
+                        yield columns_to_array(columns)
+                else:
+                    for line in response.iter_lines():
+                        if line:
+                            yield to_rates_array(json.loads(line))
+        else:
+            yield self._generate_demo_historical_data(symbol, timeframe, start_date, end_date)
+    
+    @staticmethod
+    def _mt5_timeframe(timeframe, default="H1"):
+        """Строковый таймфрейм ("M15") -> константа MetaTrader5"""
+        if not isinstance(timeframe, str):
+            return timeframe
+        tf_map = {
+            "M1": mt5.TIMEFRAME_M1,
+            "M5": mt5.TIMEFRAME_M5,
+            "M15": mt5.TIMEFRAME_M15,
+            "M30": mt5.TIMEFRAME_M30,
+            "H1": mt5.TIMEFRAME_H1,
+            "H4": mt5.TIMEFRAME_H4,
+            "D1": mt5.TIMEFRAME_D1
         }
-        base_price = base_prices.get(symbol, 1.0000)
-        
-        # Генерируем данные
-        np.random.seed(42)
-        rates = []
-        current_time = start_date
-        current_price = base_price
-        
-        for i in range(num_bars):
-            # Генерируем изменение цены
-            volatility = 0.0005 if symbol != "XAUUSD" else 0.005
-            change = np.random.normal(0, volatility)
-            current_price += change
-            
-            # OHLC
-            open_price = current_price
-            high_price = current_price + abs(np.random.normal(0, volatility/2))
-            low_price = current_price - abs(np.random.normal(0, volatility/2))
-            close_price = current_price + np.random.normal(0, volatility/3)
-            
-            rates.append({
-                'time': int(current_time.timestamp()),
-                'open': open_price,
-                'high': high_price,
-                'low': low_price,
-                'close': close_price,
-                'tick_volume': np.random.randint(100, 1000),
-                'spread': np.random.randint(1, 5),
-                'real_volume': 0
-            })
-            
-            current_time += timedelta(minutes=minutes)
-            current_price = close_price
-        
-        return rates
+        return tf_map.get(timeframe, tf_map[default])
+    
+    def download_history(self, symbol, timeframe, start_date, end_date, store=None, chunk_bars=50000):
+        """
+        Загружает историю в локальное хранилище баров, дописывая блоки по мере получения.
+        Возвращает число новых баров или None при ошибке (уже записанные блоки сохраняются).
+        """
+        store = store or BarStore()
+        saved = 0
+        try:
+            for rates in self.iter_historical_data(symbol, timeframe, start_date, end_date, chunk_bars):
+                saved += store.append(symbol, timeframe, rates)
+        except Exception as e:
+            self._log_error(f"Ошибка загрузки истории {symbol} {timeframe}: {e}")
+            return None
+        return saved
+    
+    def _generate_demo_historical_data(self, symbol, timeframe, start_date, end_date):
+        """Демо история: синтетический рынок (utils/synthetic_market.py) без выходных"""
+        timeframe = timeframe if timeframe in TIMEFRAME_SECONDS else "H1"
+        return generate_bars(symbol, timeframe, start=start_date, end=end_date, seed=self._demo_rng)
 
     def get_rates(self, symbol, timeframe, count=10):
         """Получение котировок"""
@@ -298,54 +450,114 @@ class MT5Service:
             return None
         
         try:
-            if self.mode == "local":
+            if self.mode in ("local", "auto"):
                 if MT5_AVAILABLE:
                     if not mt5.symbol_select(symbol, True):
                         self._log_error(f"Could not select {symbol}")
-                    rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, count)
+                    rates = mt5.copy_rates_from_pos(symbol, self._mt5_timeframe(timeframe), 0, count)
                     if rates is None or len(rates) == 0:
                         return None
                     rates_df = pd.DataFrame(rates)
                     rates_df['time'] = pd.to_datetime(rates_df['time'], unit='s')
                     return rates_df
             elif self.mode == "flask":
-                response = requests.get(f"{self.flask_url}/rates", 
-                                     params={"symbol": symbol, "timeframe": timeframe, "count": count}, 
-                                     timeout=10)
+                params = {"symbol": symbol, "timeframe": timeframe, "count": count}
+                if self.rates_compression:
+                    params["compress"] = "zlib"
+                response = requests.get(f"{self.flask_url}/rates", params=params,
+                                     headers={"Accept": self._rates_accept()}, timeout=10)
                 if response.status_code == 200:
+                    columns = decode_response(response.headers.get("Content-Type"), response.content)
+                    if columns is not None:
+                        return rates_to_dataframe(columns)
                     data = response.json()
-                    return pd.DataFrame(data)
+                    if not data.get("success", True):
+                        return None
+                    rates_df = pd.DataFrame(data.get("rates", []))
+                    if not rates_df.empty:
+                        rates_df['time'] = pd.to_datetime(rates_df['time'])
+                    return rates_df
             else:
-                return self._get_demo_rates(symbol, count)
+                return self._get_demo_rates(symbol, count, timeframe)
         except Exception as e:
             self._log_error(f"Ошибка получения котировок для {symbol}: {e}")
             return None
 
-    def _get_demo_rates(self, symbol, count=10):
-        """Демо-данные для macOS"""
-        import numpy as np
-        from datetime import datetime, timedelta
-        
-        base_price = 1.2000 if "EUR" in symbol else 1.3000 if "GBP" in symbol else 110.0
-        dates = [datetime.now() - timedelta(minutes=i) for i in range(count, 0, -1)]
-        
-        # Генерируем демо-данные
-        np.random.seed(42)
-        prices = [base_price]
-        for i in range(1, count):
-            change = np.random.normal(0, 0.0005)
-            prices.append(prices[-1] + change)
-        
-        data = {
-            'time': dates,
-            'open': prices,
-            'high': [p + abs(np.random.normal(0, 0.0002)) for p in prices],
-            'low': [p - abs(np.random.normal(0, 0.0002)) for p in prices],
-            'close': prices,
-            'tick_volume': [np.random.randint(100, 1000) for _ in range(count)]
-        }
+    def get_multi_timeframe(self, symbol, timeframes, count=100, base_timeframe="M1", max_base_bars=100000):
+        """
+        Бары нескольких таймфреймов из общих базовых серий.
         
-        return pd.DataFrame(data)
+        Через мост идёт только base_timeframe: первый вызов загружает историю,
+        последующие - лишь бары с последнего полученного, а старшие таймфреймы
+        собираются локально (utils/resample.py) с учётом границ суток и выходных.
+        Таймфрейм, которому для count баров нужно больше max_base_bars базовых,
+        грузится сам (utils/resample.plan_base_timeframes). Возвращает {таймфрейм: DataFrame}.
+        """
+        timeframes = list(timeframes)
+        frames = {}
+        for base, group in plan_base_timeframes(timeframes, base_timeframe, count, max_base_bars).items():
+            aggregator = self._update_aggregator(symbol, base, group, count, max_base_bars)
+            if aggregator is None:
+                return None
+            frames.update({tf: aggregator.get_dataframe(tf, count) for tf in group})
+        return {tf: frames[tf] for tf in timeframes}
+    
+    def _update_aggregator(self, symbol, base_timeframe, timeframes, count, max_base_bars):
+        """Сборщик (символ, базовый таймфрейм), дополненный барами с последнего обновления"""
+        key = (symbol, base_timeframe)
+        aggregator = self._aggregators.get(key)
+        # Демо-бары каждый раз новые - склеивать их с прошлыми нельзя, только полная загрузка
+        if (self.mode != "demo" and aggregator is not None and aggregator.max_bars >= count
+                and not set(timeframes) - set(aggregator.timeframes) - {base_timeframe}):
+            rates = self._get_rates_since(symbol, base_timeframe, aggregator.last_time, max_base_bars)
+            if rates is None:
+                return None
+            if len(rates):
+                aggregator.update(rates)
+                return aggregator
+        if aggregator is not None:
+            # Прежние таймфреймы сборщика сохраняются - разные наборы запросов не пересоздают его по очереди
+            timeframes = set(timeframes) | set(aggregator.timeframes)
+        aggregator = TimeframeAggregator(base_timeframe, sorted(timeframes, key=TIMEFRAME_SECONDS.__getitem__),
+                                         max_bars=max(count, 1000))
+        rates = self.get_rates(symbol, base_timeframe, min(base_bars_needed(timeframes, base_timeframe, count), max_base_bars))
+        if rates is None or len(rates) == 0:
+            return None
+        aggregator.update(rates)
+        self._aggregators[key] = aggregator
+        return aggregator
+    
+    def _get_rates_since(self, symbol, timeframe, last_time, max_bars, first_count=4):
+        """
+        Бары с last_time (включительно - он мог ещё формироваться). Число баров
+        не угадывается по часам: запрос увеличивается, пока самый старый
+        полученный бар не дойдёт до last_time. Пустой результат - разрыв
+        длиннее max_bars (нужна полная загрузка), None - ошибка.
+        """
+        count = first_count
+        while True:
+            rates = self.get_rates(symbol, timeframe, count)
+            if rates is None or len(rates) == 0:
+                return None
+            rates = to_rates_array(rates)
+            if rates['time'][0] <= last_time:
+                return rates
+            if count >= max_bars or len(rates) < count:
+                return rates[:0]
+            count = min(count * 8, max_bars)
+
+    def _rates_accept(self):
+        """Заголовок Accept для баров: предпочитаемый формат, JSON - запасной"""
+        if self.rates_format == "arrow":
+            return f"{ARROW_MEDIA_TYPE}, {RATES_MEDIA_TYPE};q=0.9, {JSON_MEDIA_TYPE};q=0.5"
+        if self.rates_format == "binary":
+            return f"{RATES_MEDIA_TYPE}, {JSON_MEDIA_TYPE};q=0.5"
+        return JSON_MEDIA_TYPE
+
+    def _get_demo_rates(self, symbol, count=10, timeframe="M1"):
+        """Демо-данные для macOS: последние count баров синтетического рынка"""
+        timeframe = timeframe if timeframe in TIMEFRAME_SECONDS else "M1"
+        return generate_dataframe(symbol, timeframe, count, seed=self._demo_rng)
 
     def get_deals_in_history(self, days=1):
         """Получение истории сделок"""
@@ -362,12 +574,39 @@ class MT5Service:
                 response = requests.get(f"{self.flask_url}/deals_history", 
                                      params={"days": days}, timeout=10)
                 if response.status_code == 200:
-                    return response.json()
+                    data = response.json()
+                    return data.get("deals", []) if isinstance(data, dict) else data
             else:
                 return []  # Демо режим
         except Exception as e:
             self._log_error(f"Ошибка получения истории сделок: {e}")
             return []
+    
+    def get_deals_since(self, date_from):
+        """
+        Сделки начиная с date_from (datetime в UTC) - для инкрементальной ленты сделок.
+        Возвращает None при ошибке, чтобы лента не сдвигала курсор.
+        """
+        if not self.is_initialized:
+            return None
+        
+        try:
+            if self.mode == "local":
+                if MT5_AVAILABLE:
+                    # Конец диапазона с запасом в сутки: время сделок - серверное время брокера
+                    return mt5.history_deals_get(date_from, datetime.now() + timedelta(days=1))
+            elif self.mode == "flask":
+                response = requests.get(f"{self.flask_url}/deals_history",
+                                     params={"since": int(date_from.timestamp())}, timeout=10)
+                if response.status_code == 200:
+                    data = response.json()
+                    return data.get("deals", []) if data.get("success", True) else None
+                return None
+            else:
+                return []  # Демо режим
+        except Exception as e:
+            self._log_error(f"Ошибка получения истории сделок: {e}")
+            return None
 
     def close_position_by_ticket(self, ticket):
         """Закрытие позиции по тикету"""
@@ -386,7 +625,10 @@ class MT5Service:
                     volume = position.volume
                     order_type = position.type
                     close_action_type = mt5.ORDER_TYPE_SELL if order_type == mt5.ORDER_TYPE_BUY else mt5.ORDER_TYPE_BUY
-                    price = mt5.symbol_info_tick(symbol).bid if order_type == mt5.ORDER_TYPE_BUY else mt5.symbol_info_tick(symbol).ask
+                    tick = self._tick(symbol)
+                    if not tick:
+                        return False, f"Не удалось получить тик {symbol}"
+                    price = tick.bid if order_type == mt5.ORDER_TYPE_BUY else tick.ask
                     
                     request = {
                         "action": mt5.TRADE_ACTION_DEAL, "position": ticket, "symbol": symbol,
@@ -435,7 +677,7 @@ class MT5Service:
                         return False, f"Позиция с тикетом {ticket} не найдена"
                     
                     position = positions[0]
-                    symbol_info = mt5.symbol_info(position.symbol)
+                    symbol_info = self._symbol_info(position.symbol)
                     if not symbol_info:
                         return False, f"Не удалось получить информацию о {position.symbol}"
                     
@@ -463,6 +705,62 @@ class MT5Service:
         except Exception as e:
             return False, f"Ошибка изменения SL/TP позиции {ticket}: {e}"
 
+    def modify_many(self, changes):
+        """
+        Модификация SL/TP нескольких позиций (ноги одного сигнала): changes - [(тикет, sl, tp)].
+        Во Flask режиме - один запрос /modify_many (сервер без него - по одному запросу на тикет).
+        Возвращает {тикет: (успех, сообщение)} в порядке changes.
+        """
+        changes = [(int(ticket), sl, tp) for ticket, sl, tp in changes]
+        if not self.is_initialized:
+            return {ticket: (False, "MT5 не инициализирован") for ticket, _, _ in changes}
+        if self.mode == "flask":
+            payload = {"changes": [{"ticket": ticket, "sl": sl, "tp": tp} for ticket, sl, tp in changes]}
+            batch = self._post_batch("/modify_many", payload, [ticket for ticket, _, _ in changes])
+            if batch is not None:
+                return {ticket: (result.get("success", False), self._batch_message(result))
+                        for ticket, result in batch.items()}
+        return {ticket: self.modify_position_sltp(ticket, sl, tp) for ticket, sl, tp in changes}
+
+    def close_many(self, tickets):
+        """
+        Закрытие нескольких позиций. Возвращает {тикет: (статус, сообщение)},
+        статус - 'CLOSED' или None при ошибке (как у core MT5Service.close_many).
+        """
+        tickets = [int(ticket) for ticket in tickets]
+        if not self.is_initialized:
+            return {ticket: (None, "MT5 не инициализирован") for ticket in tickets}
+        if self.mode == "flask":
+            batch = self._post_batch("/close_many", {"tickets": tickets}, tickets)
+            if batch is not None:
+                return {ticket: ('CLOSED' if result.get("success") else None, self._batch_message(result))
+                        for ticket, result in batch.items()}
+        results = {}
+        for ticket in tickets:
+            success, message = self.close_position_by_ticket(ticket)
+            results[ticket] = ('CLOSED' if success else None, message)
+        return results
+
+    def _post_batch(self, route, payload, tickets):
+        """
+        Пакетный запрос к Flask API: {тикет: результат} или None, если сервер
+        не знает маршрута (старый mt5_server) и нужно идти по одному тикету.
+        """
+        try:
+            response = requests.post(f"{self.flask_url}{route}", json=payload, timeout=10 + 2 * len(tickets))
+        except Exception as e:
+            return {ticket: {"success": False, "error": f"Ошибка пакетного запроса {route}: {e}"} for ticket in tickets}
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            return {ticket: {"success": False, "error": f"Ошибка Flask API: {response.status_code}"} for ticket in tickets}
+        by_ticket = {int(r["ticket"]): r for r in response.json().get("results", []) if r.get("ticket") is not None}
+        return {ticket: by_ticket.get(ticket, {"success": False, "error": "Нет результата"}) for ticket in tickets}
+
+    @staticmethod
+    def _batch_message(result):
+        return result.get("message") or result.get("error") or "Неизвестная ошибка"
+
     def place_order(self, signal_data, volume_per_tp, source_comment="CombineTradeBot"):
         """Размещение ордера"""
         if not self.is_initialized:
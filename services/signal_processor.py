@@ -217,13 +217,9 @@ class SignalProcessor:
             self.db.add_log("WARNING", f"Could not find specific ticket for {target_ticket}")
 
     def _modify_all_tickets(self, tickets, new_sl, new_tp, signal_id):
-        """Модифицирует все тикеты."""
-        for ticket in tickets:
-            success, msg = self.mt5.modify_position_sltp(ticket, new_sl, new_tp)
-            if success:
-                self.db.add_log("SUCCESS", f"Ticket {ticket} modified successfully.")
-            else:
-                self.db.add_log("ERROR", f"Failed to modify ticket {ticket}: {msg}")
+        """Модифицирует все тикеты одним пакетом (один запрос к мосту)."""
+        results = self.mt5.modify_many([(ticket, new_sl, new_tp) for ticket in tickets])
+        self._log_bulk_result("Modified", signal_id, results)
         
         # Обновляем запись в БД новыми данными
         original_signal = self.db.get_signal_by_id(signal_id)
@@ -369,17 +365,23 @@ class SignalProcessor:
             self.db.add_log("WARNING", f"Could not find specific ticket for {target_ticket}")
 
     def _cancel_all_tickets(self, tickets, signal_id):
-        """Отменяет все тикеты."""
-        for ticket in tickets:
-            # Try to close position first
-            success, msg = self.mt5.close_position_by_ticket(ticket)
-            if not success:
-                # If closing fails, try to cancel pending order
-                success, msg = self.mt5.cancel_pending_order(ticket)
-            
-            if success:
-                self.db.add_log("SUCCESS", f"Ticket {ticket} cancelled successfully.")
+        """Отменяет все тикеты: открытые позиции закрываются одним пакетом, остальные - как отложенные ордера."""
+        results = {}
+        for ticket, (status, msg) in self.mt5.close_many(tickets).items():
+            if status is None:
+                # Не открытая позиция - пробуем отменить отложенный ордер
+                results[ticket] = self.mt5.cancel_pending_order(ticket)
             else:
-                self.db.add_log("ERROR", f"Failed to cancel ticket {ticket}: {msg}")
+                results[ticket] = (True, msg)
+        self._log_bulk_result("Cancelled", signal_id, results)
         
-        self.db.update_signal_status(signal_id, 'CANCELLED') 
\ No newline at end of file
+        self.db.update_signal_status(signal_id, 'CANCELLED')
+
+    def _log_bulk_result(self, action, signal_id, results):
+        """Одна запись лога на пакетную операцию; неудачные тикеты - с причинами."""
+        failed = {ticket: msg for ticket, (success, msg) in results.items() if not success}
+        done = len(results) - len(failed)
+        if done:
+            self.db.add_log("SUCCESS", f"{action} {done}/{len(results)} tickets of signal ID {signal_id}.")
+        if failed:
+            self.db.add_log("ERROR", f"Signal ID {signal_id}: " + "; ".join(f"ticket {t}: {msg}" for t, msg in failed.items())) 
\ No newline at end of file
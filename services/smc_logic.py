@@ -6,6 +6,8 @@ import time
 import json
 import sqlite3
 
+from config import MT5_CONFIG
+
 try:
     import MetaTrader5 as mt5
     MT5_AVAILABLE = True
@@ -72,8 +74,10 @@ class SMCStrategy:
             return self._get_demo_structure(symbol, count)
             
         try:
-            # Получаем данные с MT5
-            rates = self.mt5_service.get_rates(symbol, timeframe, count)
+            # Бары с MT5 через общий сборщик таймфреймов (дозагружается только базовый таймфрейм)
+            frames = self.mt5_service.get_multi_timeframe(symbol, [timeframe], count,
+                                                         base_timeframe=MT5_CONFIG.get("base_timeframe", "M1"))
+            rates = frames[timeframe] if frames else None
             if rates is None or len(rates) < 50:
                 return None
                 
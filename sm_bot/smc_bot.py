@@ -5,13 +5,15 @@ try:
 except ImportError:
     mt5 = None # Or a mock object
 from datetime import datetime
+from utils.resample import choose_base_timeframe, range_fetch_end, resample_range
 from PyQt6.QtWidgets import QApplication, QMainWindow, QLabel, QVBoxLayout, QWidget, QTableWidget, QTableWidgetItem, QPushButton
 from PyQt6.QtCore import Qt
 import sys
 import telegram
 
 # ======== MT5 Data Load ============
-def load_mt5_data(symbol="XAUUSD", timeframe="M15", date_from="2025-01-01", date_to="2025-06-01"):
+def load_mt5_data(symbol="XAUUSD", timeframe="M15", date_from="2025-01-01", date_to="2025-06-01",
+                  base_timeframe="M1", max_base_bars=100000):
     if not mt5:
         print("❌ MetaTrader5 library is not installed. Cannot load data.")
         return pd.DataFrame() # Return empty dataframe
@@ -24,13 +26,14 @@ def load_mt5_data(symbol="XAUUSD", timeframe="M15", date_from="2025-01-01", date
         print("❌ MT5 initialize() failed")
         quit()
 
-    rates = mt5.copy_rates_range(symbol, tf_map[timeframe],
-                                 datetime.strptime(date_from, "%Y-%m-%d"),
-                                 datetime.strptime(date_to, "%Y-%m-%d"))
+    start, end = datetime.strptime(date_from, "%Y-%m-%d"), datetime.strptime(date_to, "%Y-%m-%d")
+    # Base timeframe once, the requested one is resampled locally (unless it needs more than max_base_bars)
+    base = choose_base_timeframe(timeframe, base_timeframe, (end - start).total_seconds(), max_base_bars)
+    rates = mt5.copy_rates_range(symbol, tf_map[base], start, range_fetch_end(end, timeframe, base))
 
     mt5.shutdown()
 
-    df = pd.DataFrame(rates)
+    df = pd.DataFrame(resample_range(rates, timeframe, base, start, end))
     df["datetime"] = pd.to_datetime(df["time"], unit="s")
     df = df[["datetime", "open", "high", "low", "close"]]
     df = df.sort_values(by="datetime").reset_index(drop=True)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Тест пакетного писателя SQLite (utils/db_writer.py)
+"""
+
+import sys
+import os
+import sqlite3
+import tempfile
+import threading
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.db_writer import BatchWriter
+
+
+def _writer(**kwargs):
+    db_path = os.path.join(tempfile.mkdtemp(), "writer.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT UNIQUE, seq INTEGER)")
+    conn.commit()
+    conn.close()
+    return db_path, BatchWriter(db_path, **kwargs)
+
+
+def _rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT name, seq FROM items ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def test_group_commit():
+    """Операции из нескольких потоков фиксируются общими транзакциями"""
+    db_path, writer = _writer(max_batch=500, max_delay=0.05)
+    try:
+        def produce(thread_index):
+            for i in range(100):
+                writer.submit("INSERT INTO items (name, seq) VALUES (?, ?)", (f"t{thread_index}-{i}", i))
+
+        threads = [threading.Thread(target=produce, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert writer.flush(timeout=10)
+        stats = writer.get_stats()
+        assert len(_rows(db_path)) == 400
+        assert stats['operations'] == 400 and stats['failed_operations'] == 0
+        assert stats['batches'] < 400 and stats['avg_batch_size'] > 1
+    finally:
+        writer.close()
+
+
+def test_failing_operation_rolls_back_alone():
+    """Ошибка одной операции откатывает только её SAVEPOINT, остальные в пачке сохраняются"""
+    db_path, writer = _writer(max_batch=10, max_delay=0.2)
+    try:
+        first = writer.submit("INSERT INTO items (name, seq) VALUES (?, ?)", ("a", 1))
+
+        def partial_then_fail(cursor):
+            # Вставка внутри операции откатывается вместе с ней
+            cursor.execute("INSERT INTO items (name, seq) VALUES ('b', 2)")
+            cursor.execute("INSERT INTO items (name, seq) VALUES ('a', 3)")
+
+        failed = writer.call(partial_then_fail)
+        last = writer.submit("INSERT INTO items (name, seq) VALUES (?, ?)", ("c", 4))
+        assert first.result(5) and last.result(5)
+        try:
+            failed.result(5)
+            raise AssertionError("ожидалась ошибка UNIQUE")
+        except sqlite3.IntegrityError:
+            pass
+        assert _rows(db_path) == [("a", 1), ("c", 4)]
+        stats = writer.get_stats()
+        assert stats['failed_operations'] == 1 and stats['failed_batches'] == 0
+    finally:
+        writer.close()
+
+
+def test_flush_ordering():
+    """Операции применяются в порядке постановки; flush ждёт коммита всех поставленных"""
+    db_path, writer = _writer(max_batch=7, max_delay=0.001)
+    try:
+        for i in range(50):
+            writer.submit("INSERT INTO items (name, seq) VALUES (?, ?)", (f"n{i}", i))
+        writer.submit("UPDATE items SET seq = -1 WHERE name = ?", ("n49",))
+        assert writer.flush(timeout=10)
+        rows = _rows(db_path)
+        assert [seq for _, seq in rows] == list(range(49)) + [-1]
+        assert writer.get_stats()['pending'] == 0
+        # Синхронная запись возвращает lastrowid уже зафиксированной строки
+        rowid = writer.execute("INSERT INTO items (name, seq) VALUES (?, ?)", ("last", 50), timeout=5)
+        assert rowid == 51 and _rows(db_path)[-1] == ("last", 50)
+    finally:
+        writer.close()
+
+
+def test_closed_writer_rejects_operations():
+    """close() дописывает очередь, после него submit запрещён"""
+    db_path, writer = _writer()
+    future = writer.submit("INSERT INTO items (name, seq) VALUES (?, ?)", ("x", 1))
+    writer.close()
+    assert future.result(5) == 1
+    try:
+        writer.submit("INSERT INTO items (name, seq) VALUES (?, ?)", ("y", 2))
+        raise AssertionError("ожидался RuntimeError")
+    except RuntimeError:
+        pass
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
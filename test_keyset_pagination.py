@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Тест keyset-пагинации истории сделок, сигналов и логов (services/database_service.py)
+"""
+
+import sys
+import os
+import tempfile
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.database_service import DatabaseService
+
+
+# Своя метка источника: новая база уже содержит демо-сделки и сигналы
+SOURCE = "pagination-test"
+
+
+def _database():
+    return DatabaseService(os.path.join(tempfile.mkdtemp(), "trading.db"))
+
+
+def _collect(fetch_page, limit):
+    rows, cursor, pages = [], None, 0
+    while True:
+        page, cursor = fetch_page(limit, cursor)
+        rows.extend(page)
+        pages += 1
+        if cursor is None:
+            return rows, pages
+
+
+def test_trades_pages_cover_all_rows():
+    """Страницы идут от новых к старым без пропусков и повторов, в том числе при равных timestamp"""
+    db = _database()
+    try:
+        for i in range(23):
+            # По три сделки на одну метку времени - порядок внутри неё задаёт id
+            db.add_trade({'trade_id': f"T{i}", 'symbol': "XAUUSD", 'status': "OPEN" if i % 2 else "CLOSED",
+                          'source': SOURCE, 'timestamp': f"2024-05-{1 + i // 3:02d} 10:00:00"})
+        rows, pages = _collect(lambda limit, cursor: db.get_trades_page(limit, cursor, source=SOURCE), 5)
+        assert pages == 5
+        keys = [(row['timestamp'], row['id']) for row in rows]
+        assert len(rows) == 23 and len(set(keys)) == 23
+        assert keys == sorted(keys, reverse=True)
+        assert db.get_trades(limit=5, source=SOURCE) == rows[:5]
+    finally:
+        db.close()
+
+
+def test_filtered_pages():
+    """Фильтр по статусу сохраняется между страницами"""
+    db = _database()
+    try:
+        for i in range(12):
+            db.add_signal({'signal_id': f"S{i}", 'symbol': "EURUSD", 'status': "NEW" if i % 3 else "CLOSED",
+                           'source': SOURCE, 'timestamp': f"2024-06-01 10:{i:02d}:00"})
+        rows, _ = _collect(lambda limit, cursor: db.get_signals_page(limit, cursor, status="NEW", source=SOURCE), 3)
+        assert [row['signal_id'] for row in rows] == [f"S{i}" for i in reversed(range(12)) if i % 3]
+    finally:
+        db.close()
+
+
+def test_exact_multiple_ends_with_empty_page():
+    """При числе строк, кратном размеру страницы, последняя страница пустая и без курсора"""
+    db = _database()
+    try:
+        for i in range(6):
+            db.add_trade({'trade_id': f"T{i}", 'source': SOURCE, 'timestamp': f"2024-05-01 10:0{i}:00"})
+        page, cursor = db.get_trades_page(3, source=SOURCE)
+        page, cursor = db.get_trades_page(3, cursor, source=SOURCE)
+        assert len(page) == 3 and cursor is not None
+        assert db.get_trades_page(3, cursor, source=SOURCE) == ([], None)
+    finally:
+        db.close()
+
+
+def test_logs_pages_by_id():
+    """Логи листаются по id; записи из буфера сбрасываются в базу перед чтением"""
+    db = _database()
+    try:
+        for i in range(10):
+            db.add_log("INFO", "test", f"message {i}")
+        db.add_log("ERROR", "test", "failure")
+        rows, pages = _collect(lambda limit, cursor: db.get_logs_page(limit, cursor, source="test"), 4)
+        assert pages == 3
+        assert [row['message'] for row in rows] == ["failure"] + [f"message {i}" for i in reversed(range(10))]
+        errors, cursor = db.get_logs_page(10, None, level="ERROR", source="test")
+        assert [row['message'] for row in errors] == ["failure"] and cursor is None
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Тест сборки старших таймфреймов из базовой серии (utils/resample.py)
+"""
+
+import sys
+import os
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime, timezone
+
+import numpy as np
+
+from utils.resample import (TimeframeAggregator, plan_base_timeframes, range_fetch_end, resample,
+                            resample_range)
+from utils.synthetic_market import generate_bars
+
+# Понедельник 2024-01-08 00:00 UTC
+MONDAY = 1704672000
+
+
+def _bars(count=3000, start=MONDAY):
+    return generate_bars("XAUUSD", "M1", count, start=start, seed=7)
+
+
+def test_resample_ohlc():
+    """Бар H1: open первого, close последнего, экстремумы и сумма объёмов"""
+    bars = _bars(180)
+    h1 = resample(bars, "H1", "M1")
+    assert len(h1) == 3
+    assert list(h1['time']) == [MONDAY, MONDAY + 3600, MONDAY + 7200]
+    first = bars[:60]
+    assert h1['open'][0] == first['open'][0]
+    assert h1['close'][0] == first['close'][-1]
+    assert h1['high'][0] == first['high'].max()
+    assert h1['low'][0] == first['low'].min()
+    assert h1['tick_volume'][0] == first['tick_volume'].sum()
+
+
+def test_resample_d1_merges_weekend():
+    """Воскресные бары D1 относятся к понедельнику"""
+    sunday = MONDAY - 86400 + 22 * 3600
+    bars = np.concatenate([generate_bars("XAUUSD", "H1", 2, start=sunday, seed=1, skip_weekends=False),
+                           generate_bars("XAUUSD", "H1", 24, start=MONDAY, seed=2)])
+    d1 = resample(bars, "D1", "H1")
+    assert list(d1['time']) == [MONDAY]
+    assert d1['open'][0] == bars['open'][0]
+
+
+def test_aggregator_incremental_matches_batch():
+    """Инкрементальные обновления (с повтором формирующегося бара) дают то же, что разовая сборка"""
+    bars = _bars()
+    aggregator = TimeframeAggregator("M1", ["M5", "H1"], max_bars=100)
+    position = 0
+    for size in (500, 1, 37, 900, 1562):
+        # Каждое обновление начинается с последнего уже переданного бара - он мог формироваться
+        aggregator.update(bars[max(0, position - 1):position + size])
+        position += size
+    for tf in ("M5", "H1"):
+        expected = resample(bars, tf)
+        assert np.array_equal(aggregator.get(tf, 50), expected[-50:])
+        assert np.array_equal(aggregator.get(tf, include_forming=False), expected[:-1][-100:])
+    assert aggregator.last_time == int(bars['time'][-1])
+
+
+def test_plan_base_timeframes():
+    """Таймфрейм, которому не хватает max_base_bars базовых баров, грузится сам"""
+    plan = plan_base_timeframes(["M1", "M5", "H1", "H4", "D1"], "M1", 100, 100000)
+    assert plan == {"M1": ["M1", "M5", "H1", "H4"], "D1": ["D1"]}
+    assert plan_base_timeframes(["D1"], "M1", 100, 100000) == {"D1": ["D1"]}
+    assert plan_base_timeframes(["M15", "H1"], "M1", 100, 100000) == {"M1": ["M15", "H1"]}
+
+
+def test_resample_range_bounds():
+    """Как copy_rates_range старшего таймфрейма: бары, открывшиеся в [start, end], последний полный"""
+    bars = _bars()
+    start, end = MONDAY + 1234, MONDAY + 20 * 3600
+    fetched = bars[(bars['time'] >= start) & (bars['time'] <= end + 3600 - 60)]
+    end_date = datetime.fromtimestamp(end, timezone.utc)
+    assert range_fetch_end(end_date, "H1", "M1").timestamp() == end + 3600 - 60
+    h1 = resample_range(fetched, "H1", "M1", start, end)
+    assert h1['time'][0] == MONDAY + 3600 and h1['time'][-1] == end
+    expected = resample(bars, "H1")
+    assert np.array_equal(h1, expected[(expected['time'] >= start) & (expected['time'] <= end)])
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
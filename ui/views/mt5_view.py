@@ -5,6 +5,7 @@ from PySide6.QtWidgets import (
 from PySide6.QtGui import QColor
 import qtawesome as qta
 ACCENT_COLOR = "#6C5ECF"
+POSITION_COLUMNS = ("ticket", "symbol", "type", "volume", "price_open", "profit")
 
 class MT5Card(QFrame):
     def __init__(self, title, value, icon_name, parent=None):
@@ -77,15 +78,19 @@ class MT5View(QWidget):
         self.log_output.setPlainText("NOTE: MetaTrader5 connection is disabled on this operating system (macOS/Linux). This view is for demonstration purposes.")
 
     def update_account_info(self, info):
-        """Updates the account info cards. Expects an object with .balance, .equity, etc."""
-        self.balance_card.value_label.setText(f"${info.balance:,.2f}")
-        self.equity_card.value_label.setText(f"${info.equity:,.2f}")
-        self.margin_card.value_label.setText(f"${info.margin_free:,.2f}")
+        """Updates the account info cards from an account dict (or an object with .balance, .equity, etc.)."""
+        get = info.get if isinstance(info, dict) else lambda key, default=0.0: getattr(info, key, default)
+        self.balance_card.value_label.setText(f"${get('balance', 0.0):,.2f}")
+        self.equity_card.value_label.setText(f"${get('equity', 0.0):,.2f}")
+        self.margin_card.value_label.setText(f"${get('margin_free', 0.0):,.2f}")
 
     def update_positions_table(self, positions):
-        """Updates the open positions table."""
+        """Updates the open positions table from row tuples or position dicts."""
         self.positions_table.setRowCount(len(positions))
         for row, pos in enumerate(positions):
+            if isinstance(pos, dict):
+                side = {0: "BUY", 1: "SELL"}.get(pos.get("type"), pos.get("type"))
+                pos = [side if key == "type" else pos.get(key) for key in POSITION_COLUMNS]
             for col, data in enumerate(pos):
                 self.positions_table.setItem(row, col, QTableWidgetItem(str(data)))
 
@@ -15,10 +15,14 @@ from ui.views.settings_view import SettingsView
 from ui.views.smartmoney_view import SmartMoneyView
 from ui.views.parser_view import ParserView
 from ui.views.mt5_view import MT5View
+from config import DB_MAINTENANCE_CONFIG
 from core.database_service import DatabaseService
 from core.gpt_service import GptService
 from core.telegram_service import TelegramService
 from core.signal_processor import SignalProcessor
+from utils.settings_store import SettingsStore
+
+DEFAULT_SETTINGS = {"telegram":{},"gpt":{},"mt5":{},"trading":{},"breakeven":{},"signal_parser":{"enabled":True},"sm_bot":{"enabled":True}}
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -30,7 +34,12 @@ class MainWindow(QMainWindow):
         if os.path.exists(icon_path):
             self.setWindowIcon(QIcon(icon_path))
 
-        self.settings = self._load_config_file("data/config.json")
+        # Shared in-process cache of data/config.json: reads from memory, atomic write-through
+        self.settings_store = SettingsStore.shared_json("data/config.json", DEFAULT_SETTINGS)
+        if self.settings_store.load_error:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить data/config.json: {self.settings_store.load_error}")
+        self.settings = self.settings_store.get_all()
+        self.settings_store.subscribe(self._on_settings_changed)
         self.channels = self._load_config_file("data/channels.json", is_channels=True)
         self.all_dialogs = []
         self.is_bot_running = False
@@ -48,7 +57,7 @@ class MainWindow(QMainWindow):
         try:
             os.makedirs(os.path.dirname(path), exist_ok=True)
             if not os.path.exists(path):
-                default = {"telegram":{},"gpt":{},"mt5":{},"trading":{},"breakeven":{},"signal_parser":{"enabled":True},"sm_bot":{"enabled":True}}
+                default = {} if is_channels else DEFAULT_SETTINGS
                 with open(path, "w", encoding="utf-8") as f:
                     json.dump(default, f, indent=4)
             with open(path, "r", encoding="utf-8") as f:
@@ -135,9 +144,10 @@ class MainWindow(QMainWindow):
         self.settings_page.save_button.clicked.connect(self.save_settings)
 
     def _initialize_and_start_services(self):
-        self.settings = self._load_config_file("data/config.json")
+        self.settings = self.settings_store.get_all()
         
         db = DatabaseService()
+        db.start_maintenance(**DB_MAINTENANCE_CONFIG)
         self.backend_services['db'] = db
         self.dashboard_page.update_status('database', True)
         
@@ -229,19 +239,19 @@ class MainWindow(QMainWindow):
             if not self.is_bot_running and db and hasattr(db, 'close_connection'):
                 db.close_connection()
 
+    def _on_settings_changed(self, changes):
+        """Pushes saved settings to running services instead of requiring a restart."""
+        self.settings = self.settings_store.get_all()
+        processor = self.backend_services.get('processor')
+        if processor: processor.update_settings(self.settings)
+
     @Slot()
     def save_settings(self):
         """Saves all settings from the UI to the config file."""
         try:
             new_settings = self.settings_page.collect_settings()
-            # It's better to merge with existing settings to not lose any unexposed config
-            for section, values in new_settings.items():
-                if section not in self.settings:
-                    self.settings[section] = {}
-                self.settings[section].update(values)
-            
-            with open("data/config.json", "w", encoding="utf-8") as f:
-                json.dump(self.settings, f, indent=4)
+            # Merged key by key with existing settings, so unexposed config is kept
+            self.settings_store.update(new_settings)
             
             QMessageBox.information(self, "Success", "Settings have been saved successfully.")
         except Exception as e:
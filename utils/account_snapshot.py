@@ -0,0 +1,197 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Событие: {'time', 'opened': [позиции], 'closed': [позиции], 'modified': [(было, стало)],
+#           'account': {...}, 'account_changed': bool}
+SnapshotEvent = Dict[str, Any]
+SnapshotCallback = Callable[[SnapshotEvent], None]
+
+# Поля, изменение которых считается модификацией позиции (price_current/profit меняются на каждом тике)
+MODIFY_FIELDS = ('sl', 'tp', 'volume')
+# Поля аккаунта, изменение которых публикуется подписчикам
+ACCOUNT_FIELDS = ('balance', 'equity', 'margin', 'margin_free', 'profit')
+
+
+def normalize_position(position: Any) -> Dict[str, Any]:
+    """Позиция MT5 (TradePosition) или словарь Flask API -> словарь"""
+    if isinstance(position, dict):
+        return position
+    if hasattr(position, '_asdict'):
+        return position._asdict()
+    return dict(vars(position))
+
+
+def normalize_positions(raw: Any) -> Optional[List[Dict[str, Any]]]:
+    """Список позиций из ответа любого режима MT5Service; None - ответ не получен"""
+    if raw is None:
+        return None
+    if isinstance(raw, dict):
+        # Ответ mt5_server: {"success": ..., "positions": [...]}
+        if not raw.get('success', True):
+            return None
+        raw = raw.get('positions', [])
+    return [normalize_position(p) for p in raw]
+
+
+def diff_positions(previous: Dict[int, Dict[str, Any]], current: Dict[int, Dict[str, Any]],
+                   fields: Tuple[str, ...] = MODIFY_FIELDS):
+    """Разница двух снимков позиций по тикету: (открытые, закрытые, изменённые)"""
+    opened = [current[t] for t in current.keys() - previous.keys()]
+    closed = [previous[t] for t in previous.keys() - current.keys()]
+    modified = []
+    for ticket in current.keys() & previous.keys():
+        old, new = previous[ticket], current[ticket]
+        if any(old.get(f) != new.get(f) for f in fields):
+            modified.append((old, new))
+    return opened, closed, modified
+
+
+class AccountSnapshotPoller:
+    """
+    Единый опрос позиций и состояния счёта для всех потребителей.
+
+    Фоновый поток раз в interval секунд запрашивает позиции (и раз в
+    account_every циклов - информацию о счёте), сравнивает с предыдущим
+    снимком и рассылает подписчикам открытые, закрытые и изменённые позиции.
+    Интерфейс и сервисы читают последний снимок из памяти и не ходят в MT5.
+    Неудачный запрос не считается закрытием всех позиций - снимок просто
+    не обновляется.
+    """
+
+    def __init__(self, fetch_positions: Callable[[], Any], fetch_account: Callable[[], Any],
+                 interval: float = 1.0, account_every: int = 1, modify_fields: Tuple[str, ...] = MODIFY_FIELDS):
+        self.fetch_positions = fetch_positions
+        self.fetch_account = fetch_account
+        self.interval = interval
+        self.account_every = max(1, account_every)
+        self.modify_fields = modify_fields
+
+        self._lock = threading.RLock()
+        self._positions: Dict[int, Dict[str, Any]] = {}
+        self._account: Optional[Dict[str, Any]] = None
+        self._updated_at: Optional[float] = None
+        self._synced = False
+        self._subscribers: List[SnapshotCallback] = []
+        self._stats = {'polls': 0, 'errors': 0, 'events': 0, 'opened': 0, 'closed': 0, 'modified': 0,
+                       'last_poll_ms': 0.0}
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ----- Чтение снимка -----
+    def get_positions(self) -> List[Dict[str, Any]]:
+        """Открытые позиции из последнего снимка"""
+        with self._lock:
+            return list(self._positions.values())
+
+    def get_position(self, ticket: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._positions.get(ticket)
+
+    def get_account(self) -> Optional[Dict[str, Any]]:
+        """Состояние счёта из последнего снимка"""
+        with self._lock:
+            return dict(self._account) if self._account else None
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'time': self._updated_at, 'account': self.get_account(), 'positions': self.get_positions()}
+
+    @property
+    def is_synced(self) -> bool:
+        """Был ли хотя бы один успешный опрос позиций"""
+        return self._synced
+
+    # ----- Подписки -----
+    def subscribe(self, callback: SnapshotCallback) -> Callable[[], None]:
+        """Подписка на изменения снимка; возвращает функцию отписки"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def _publish(self, event: SnapshotEvent):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"--- [SNAPSHOT] Subscriber error: {e} ---")
+
+    # ----- Опрос -----
+    def poll_once(self) -> Optional[SnapshotEvent]:
+        """Один цикл опроса; возвращает опубликованное событие или None"""
+        started = time.perf_counter()
+        with self._lock:
+            poll_account = self._stats['polls'] % self.account_every == 0
+            self._stats['polls'] += 1
+        try:
+            positions = normalize_positions(self.fetch_positions())
+            account = self.fetch_account() if poll_account else None
+        except Exception as e:
+            positions, account = None, None
+            print(f"--- [SNAPSHOT] Poll error: {e} ---")
+        if positions is None:
+            with self._lock:
+                self._stats['errors'] += 1
+            return None
+
+        current = {p['ticket']: p for p in positions if p.get('ticket') is not None}
+        with self._lock:
+            opened, closed, modified = diff_positions(self._positions, current, self.modify_fields)
+            account_changed = False
+            if isinstance(account, dict) and account.get('success', True):
+                old = self._account or {}
+                account_changed = any(old.get(f) != account.get(f) for f in ACCOUNT_FIELDS)
+                self._account = account
+            self._positions = current
+            self._updated_at = time.time()
+            self._synced = True
+            self._stats['last_poll_ms'] = (time.perf_counter() - started) * 1000
+            if not (opened or closed or modified or account_changed):
+                return None
+            self._stats['events'] += 1
+            self._stats['opened'] += len(opened)
+            self._stats['closed'] += len(closed)
+            self._stats['modified'] += len(modified)
+            event = {'time': self._updated_at, 'opened': opened, 'closed': closed, 'modified': modified,
+                     'account': dict(self._account) if self._account else None, 'account_changed': account_changed}
+        self._publish(event)
+        return event
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.poll_once()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Запуск фонового опроса (повторный вызов ничего не делает)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="account-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счётчики опросов, ошибок и опубликованных изменений"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['positions'] = len(self._positions)
+        stats['interval'] = self.interval
+        return stats
@@ -0,0 +1,100 @@
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterator, Optional, Tuple
+
+import numpy as np
+
+from utils.rates_codec import RATES_DTYPE, to_rates_array
+
+# Длительность баров по таймфреймам MT5
+TIMEFRAME_SECONDS = {
+    "M1": 60, "M5": 300, "M15": 900, "M30": 1800,
+    "H1": 3600, "H4": 14400, "D1": 86400,
+}
+
+
+def _utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def range_windows(start: datetime, end: datetime, timeframe: str,
+                  chunk_bars: int = 50000) -> Iterator[Tuple[datetime, datetime]]:
+    """
+    Делит диапазон [start, end] на окна не длиннее chunk_bars баров таймфрейма.
+
+    Окна не пересекаются (copy_rates_range включает обе границы), поэтому
+    бар на стыке не придёт дважды. Naive datetime считаются UTC.
+    """
+    start, end = _utc(start), _utc(end)
+    step = timedelta(seconds=TIMEFRAME_SECONDS.get(timeframe, 3600) * max(1, chunk_bars))
+    while start <= end:
+        window_end = min(start + step - timedelta(seconds=1), end)
+        yield start, window_end
+        start = window_end + timedelta(seconds=1)
+
+
+class BarStore:
+    """
+    Локальное хранилище баров: по файлу на символ и таймфрейм
+    (root/SYMBOL_TF.bin) с записями RATES_DTYPE, отсортированными по времени.
+
+    Блоки дописываются в конец по мере загрузки (append), бары не новее
+    последнего сохранённого отбрасываются, так что повторная загрузка
+    пересекающегося диапазона безопасна. Чтение идёт через np.memmap,
+    выборка по времени - бинарным поиском без загрузки всего файла.
+    """
+
+    def __init__(self, root: str = "data/bars"):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def path(self, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root, f"{symbol}_{timeframe}.bin")
+
+    def count(self, symbol: str, timeframe: str) -> int:
+        path = self.path(symbol, timeframe)
+        return os.path.getsize(path) // RATES_DTYPE.itemsize if os.path.exists(path) else 0
+
+    def last_time(self, symbol: str, timeframe: str) -> Optional[int]:
+        """Время последнего сохранённого бара (секунды UTC) или None"""
+        path = self.path(symbol, timeframe)
+        if self.count(symbol, timeframe) == 0:
+            return None
+        with open(path, 'rb') as f:
+            f.seek(-RATES_DTYPE.itemsize, os.SEEK_END)
+            return int(np.frombuffer(f.read(RATES_DTYPE.itemsize), dtype=RATES_DTYPE)['time'][0])
+
+    def append(self, symbol: str, timeframe: str, rates: Any) -> int:
+        """Дописывает блок баров; возвращает число сохранённых (новых) баров"""
+        array = to_rates_array(rates)
+        if len(array) == 0:
+            return 0
+        with self._lock:
+            last = self.last_time(symbol, timeframe)
+            if last is not None:
+                array = array[array['time'] > last]
+            if len(array) == 0:
+                return 0
+            array = np.sort(array, order='time')
+            os.makedirs(self.root, exist_ok=True)
+            with open(self.path(symbol, timeframe), 'ab') as f:
+                f.write(array.tobytes())
+        return len(array)
+
+    def load(self, symbol: str, timeframe: str, start: Optional[datetime] = None,
+             end: Optional[datetime] = None) -> np.ndarray:
+        """Бары в диапазоне [start, end] (представление memmap только для чтения)"""
+        if self.count(symbol, timeframe) == 0:
+            return np.zeros(0, dtype=RATES_DTYPE)
+        bars = np.memmap(self.path(symbol, timeframe), dtype=RATES_DTYPE, mode='r')
+        lo = 0 if start is None else np.searchsorted(bars['time'], int(_utc(start).timestamp()), side='left')
+        hi = len(bars) if end is None else np.searchsorted(bars['time'], int(_utc(end).timestamp()), side='right')
+        return bars[lo:hi]
+
+    def load_dataframe(self, symbol: str, timeframe: str, start: Optional[datetime] = None,
+                       end: Optional[datetime] = None):
+        import pandas as pd
+        df = pd.DataFrame(np.array(self.load(symbol, timeframe, start, end)))
+        df['time'] = pd.to_datetime(df['time'], unit='s')
+        return df
@@ -0,0 +1,540 @@
+import calendar
+import csv
+import random
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from utils.rates_codec import RATES_DTYPE
+from utils.synthetic_market import generate_bars
+
+# Структуры с теми же полями, что и у MetaTrader5 (включая _asdict())
+TradePosition = namedtuple('TradePosition', 'ticket time time_msc time_update type magic identifier reason volume '
+                                            'price_open sl tp price_current swap profit symbol comment')
+TradeOrder = namedtuple('TradeOrder', 'ticket time_setup type state magic volume_initial volume_current '
+                                      'price_open sl tp price_current symbol comment')
+TradeDeal = namedtuple('TradeDeal', 'ticket order time time_msc type entry magic position_id reason volume '
+                                    'price commission swap profit fee symbol comment')
+Tick = namedtuple('Tick', 'time bid ask last volume time_msc flags volume_real')
+SymbolInfo = namedtuple('SymbolInfo', 'name digits point spread trade_stops_level trade_contract_size '
+                                      'volume_min volume_max volume_step visible')
+AccountInfo = namedtuple('AccountInfo', 'login balance equity margin margin_free margin_level profit '
+                                        'leverage currency server name')
+OrderSendResult = namedtuple('OrderSendResult', 'retcode deal order volume price bid ask comment request_id')
+
+WEEK_SECONDS = 7 * 86400
+
+
+def load_candles_csv(path: str) -> np.ndarray:
+    """
+    Свечи из CSV в массив RATES_DTYPE.
+
+    Понимает экспорт терминала MT5 (<DATE>\t<TIME>\t<OPEN>...<SPREAD>) и
+    обычный CSV с колонками time/open/high/low/close[/tick_volume/spread].
+    """
+    with open(path, newline='') as f:
+        sample = f.readline()
+        f.seek(0)
+        reader = csv.DictReader(f, delimiter='\t' if '\t' in sample else ',')
+        rows = list(reader)
+    rates = np.zeros(len(rows), dtype=RATES_DTYPE)
+    for i, row in enumerate(rows):
+        row = {k.strip('<>').lower(): v for k, v in row.items() if k}
+        value = row.get('time', '')
+        if 'date' not in row and value.isdigit():
+            # Секунды эпохи уже в UTC
+            rates[i]['time'] = int(value)
+        else:
+            if 'date' in row:
+                stamp = datetime.strptime(f"{row['date']} {value or '00:00:00'}", '%Y.%m.%d %H:%M:%S')
+            else:
+                stamp = datetime.fromisoformat(value)
+            # Время терминала трактуется как UTC
+            rates[i]['time'] = calendar.timegm(stamp.timetuple()) if stamp.tzinfo is None else int(stamp.timestamp())
+        rates[i]['open'], rates[i]['high'] = float(row['open']), float(row['high'])
+        rates[i]['low'], rates[i]['close'] = float(row['low']), float(row['close'])
+        rates[i]['tick_volume'] = int(float(row.get('tickvol') or row.get('tick_volume') or 0))
+        rates[i]['spread'] = int(float(row.get('spread') or 0))
+        rates[i]['real_volume'] = int(float(row.get('vol') or row.get('real_volume') or 0))
+    return np.sort(rates, order='time')
+
+
+def _symbol_defaults(symbol: str, bars: np.ndarray) -> Dict[str, Any]:
+    digits = 2 if 'XAU' in symbol else 3 if 'JPY' in symbol else 5
+    return {'digits': digits, 'point': 10 ** -digits,
+            'contract_size': 100.0 if 'XAU' in symbol else 100000.0,
+            'spread': int(np.median(bars['spread'])) if len(bars) and bars['spread'].any() else 20}
+
+
+class BrokerSimulator:
+    """
+    Офлайн-брокер с интерфейсом модуля MetaTrader5.
+
+    Проигрывает свечи по символам (общие часы, по бару за шаг), держит
+    настоящие позиции и отложенные ордера, исполняет по bid/ask (ask = bid +
+    spread из CSV), срабатывает SL/TP внутри бара по high/low (если в одном
+    баре задеты оба - считается SL) и пишет сделки в историю. В order_send
+    можно добавить задержку и случайные отказы (requote).
+
+    Экземпляр подменяет модуль MetaTrader5 (install_metatrader5), поэтому
+    MT5Service, mt5_server и торговые сервисы работают с ним без изменений.
+    Время баров сдвигается на целое число недель так, чтобы проигрывание
+    начиналось с текущего момента (дни недели и сессии сохраняются), а
+    запрос истории сделок с концом "сейчас или позже" видит все сделки
+    симуляции - иначе ускоренные часы уходили бы за границу запроса.
+    """
+
+    TIMEFRAME_M1, TIMEFRAME_M5, TIMEFRAME_M15, TIMEFRAME_M30 = 1, 5, 15, 30
+    TIMEFRAME_H1, TIMEFRAME_H4, TIMEFRAME_D1 = 16385, 16388, 16408
+    ORDER_TYPE_BUY, ORDER_TYPE_SELL = 0, 1
+    ORDER_TYPE_BUY_LIMIT, ORDER_TYPE_SELL_LIMIT, ORDER_TYPE_BUY_STOP, ORDER_TYPE_SELL_STOP = 2, 3, 4, 5
+    POSITION_TYPE_BUY, POSITION_TYPE_SELL = 0, 1
+    TRADE_ACTION_DEAL, TRADE_ACTION_PENDING, TRADE_ACTION_SLTP, TRADE_ACTION_MODIFY, TRADE_ACTION_REMOVE = 1, 5, 6, 7, 8
+    ORDER_TIME_GTC = 0
+    ORDER_FILLING_FOK, ORDER_FILLING_IOC, ORDER_FILLING_RETURN = 0, 1, 2
+    ORDER_STATE_PLACED = 1
+    TRADE_RETCODE_REQUOTE, TRADE_RETCODE_REJECT, TRADE_RETCODE_DONE = 10004, 10006, 10009
+    TRADE_RETCODE_INVALID, TRADE_RETCODE_INVALID_VOLUME, TRADE_RETCODE_INVALID_STOPS = 10013, 10014, 10016
+    TRADE_RETCODE_NO_MONEY, TRADE_RETCODE_POSITION_CLOSED = 10019, 10036
+    DEAL_TYPE_BUY, DEAL_TYPE_SELL = 0, 1
+    DEAL_ENTRY_IN, DEAL_ENTRY_OUT = 0, 1
+    DEAL_REASON_CLIENT, DEAL_REASON_EXPERT, DEAL_REASON_SL, DEAL_REASON_TP = 0, 3, 4, 5
+
+    def __init__(self, bars: Dict[str, np.ndarray], balance: float = 10000.0, leverage: int = 100,
+                 warmup_bars: int = 200, commission_per_lot: float = 0.0, latency_ms: float = 0.0,
+                 latency_jitter_ms: float = 0.0, reject_rate: float = 0.0, rebase_time: bool = True,
+                 login: int = 1000001, seed: Optional[int] = None):
+        self.initial_balance = balance
+        self.leverage = leverage
+        self.commission_per_lot = commission_per_lot
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.reject_rate = reject_rate
+        self.login_id = login
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+
+        self.bars: Dict[str, np.ndarray] = {}
+        self.symbols: Dict[str, Dict[str, Any]] = {}
+        for symbol, rates in bars.items():
+            rates = np.array(rates, dtype=RATES_DTYPE)
+            self.bars[symbol] = rates
+            self.symbols[symbol] = _symbol_defaults(symbol, rates)
+        first_times = [int(r['time'][min(warmup_bars, len(r) - 1)]) for r in self.bars.values() if len(r)]
+        if not first_times:
+            raise ValueError("Нет баров для симуляции")
+        periods = [int(np.median(np.diff(r['time']))) for r in self.bars.values() if len(r) > 1]
+        self.period = min(periods) if periods else 60
+        start = min(first_times)
+        shift = 0
+        if rebase_time:
+            shift = -(-(int(time.time()) - start) // WEEK_SECONDS) * WEEK_SECONDS
+            for rates in self.bars.values():
+                rates['time'] += shift
+        self._start_time = start + shift
+
+        self._clock: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.reset()
+
+    @classmethod
+    def from_csv(cls, path: str, symbol: str, **kwargs) -> 'BrokerSimulator':
+        return cls({symbol: load_candles_csv(path)}, **kwargs)
+
+    @classmethod
+    def from_synthetic(cls, symbols: List[str], timeframe: str = 'M15', count: int = 20000,
+                       seed: Optional[int] = None, model: str = 'regime', **kwargs) -> 'BrokerSimulator':
+        """Симулятор на синтетических свечах (utils.synthetic_market) - без CSV"""
+        rng = np.random.default_rng(seed)
+        bars = {symbol: generate_bars(symbol, timeframe, count, seed=rng, model=model) for symbol in symbols}
+        return cls(bars, seed=seed, **kwargs)
+
+    # ----- Состояние и часы -----
+    def reset(self):
+        """Возврат к началу проигрывания с пустым счётом"""
+        with self._lock:
+            self.now = self._start_time
+            self._index = {s: int(np.searchsorted(r['time'], self.now, side='right')) - 1 for s, r in self.bars.items()}
+            self.balance = self.initial_balance
+            self.positions: Dict[int, Dict[str, Any]] = {}
+            self.orders: Dict[int, Dict[str, Any]] = {}
+            self.deals: List[TradeDeal] = []
+            self._next_ticket = 5000001
+            self._next_deal = 9000001
+            self._error = (1, 'Success')
+            self.stats = {'bars': 0, 'orders_sent': 0, 'rejected': 0, 'filled': 0, 'pending_triggered': 0,
+                          'sl_hits': 0, 'tp_hits': 0, 'closed': 0}
+
+    def _bar(self, symbol: str):
+        index = self._index.get(symbol, -1)
+        return self.bars[symbol][index] if index >= 0 else None
+
+    def _quote(self, symbol: str):
+        """(bid, ask) по закрытию текущего бара"""
+        bar = self._bar(symbol)
+        if bar is None:
+            return None
+        spread = (int(bar['spread']) or self.symbols[symbol]['spread']) * self.symbols[symbol]['point']
+        return float(bar['close']), float(bar['close']) + spread
+
+    @property
+    def finished(self) -> bool:
+        return all(self._index[s] >= len(r) - 1 for s, r in self.bars.items())
+
+    def step(self, bars: int = 1) -> int:
+        """Сдвигает часы на bars периодов, обрабатывая каждый новый бар; возвращает число баров"""
+        processed = 0
+        with self._lock:
+            for _ in range(bars):
+                if self.finished:
+                    break
+                self.now += self.period
+                for symbol, rates in self.bars.items():
+                    while self._index[symbol] + 1 < len(rates) and rates['time'][self._index[symbol] + 1] <= self.now:
+                        self._index[symbol] += 1
+                        self._process_bar(symbol, rates[self._index[symbol]])
+                        processed += 1
+            self.stats['bars'] += processed
+        return processed
+
+    def run(self, speed: float = 60.0):
+        """Фоновое проигрывание: speed секунд рынка за секунду реального времени (0 - без пауз)"""
+        if self._clock and self._clock.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.is_set() and not self.finished:
+                self.step()
+                if speed > 0:
+                    self._stop.wait(self.period / speed)
+        self._clock = threading.Thread(target=loop, name="broker-sim-clock", daemon=True)
+        self._clock.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._clock:
+            self._clock.join(timeout)
+            self._clock = None
+
+    def get_state(self) -> Dict[str, Any]:
+        """Сводка для /sim/state и отчётов нагрузочных прогонов"""
+        with self._lock:
+            account = self.account_info()
+            return {'time': self.now, 'finished': self.finished, 'running': bool(self._clock and self._clock.is_alive()),
+                    'bars': {s: self._index[s] for s in self.bars}, 'balance': account.balance,
+                    'equity': account.equity, 'positions': len(self.positions), 'orders': len(self.orders),
+                    'deals': len(self.deals), 'stats': dict(self.stats)}
+
+    # ----- Исполнение внутри бара -----
+    def _process_bar(self, symbol: str, bar):
+        spread = (int(bar['spread']) or self.symbols[symbol]['spread']) * self.symbols[symbol]['point']
+        bid_open, bid_high, bid_low = float(bar['open']), float(bar['high']), float(bar['low'])
+        ask_open, ask_high, ask_low = bid_open + spread, bid_high + spread, bid_low + spread
+
+        for ticket, order in list(self.orders.items()):
+            if order['symbol'] != symbol:
+                continue
+            kind, price = order['type'], order['price_open']
+            fill = None
+            if kind == self.ORDER_TYPE_BUY_LIMIT and ask_low <= price:
+                fill = min(price, ask_open)
+            elif kind == self.ORDER_TYPE_BUY_STOP and ask_high >= price:
+                fill = max(price, ask_open)
+            elif kind == self.ORDER_TYPE_SELL_LIMIT and bid_high >= price:
+                fill = max(price, bid_open)
+            elif kind == self.ORDER_TYPE_SELL_STOP and bid_low <= price:
+                fill = min(price, bid_open)
+            if fill is not None:
+                del self.orders[ticket]
+                side = self.ORDER_TYPE_BUY if kind in (self.ORDER_TYPE_BUY_LIMIT, self.ORDER_TYPE_BUY_STOP) else self.ORDER_TYPE_SELL
+                self._open_position(symbol, side, order['volume'], fill, order['sl'], order['tp'],
+                                    order['magic'], order['comment'], ticket)
+                self.stats['pending_triggered'] += 1
+
+        for ticket, position in list(self.positions.items()):
+            if position['symbol'] != symbol:
+                continue
+            sl, tp = position['sl'], position['tp']
+            exit_price, reason = None, None
+            if position['type'] == self.POSITION_TYPE_BUY:
+                if sl and bid_low <= sl:
+                    exit_price, reason = min(sl, bid_open), self.DEAL_REASON_SL
+                elif tp and bid_high >= tp:
+                    exit_price, reason = max(tp, bid_open), self.DEAL_REASON_TP
+            else:
+                if sl and ask_high >= sl:
+                    exit_price, reason = max(sl, ask_open), self.DEAL_REASON_SL
+                elif tp and ask_low <= tp:
+                    exit_price, reason = min(tp, ask_open), self.DEAL_REASON_TP
+            if exit_price is not None:
+                self._close_position(ticket, position['volume'], exit_price, reason)
+                self.stats['sl_hits' if reason == self.DEAL_REASON_SL else 'tp_hits'] += 1
+
+    def _profit(self, position: Dict[str, Any], price: float, volume: float) -> float:
+        direction = 1 if position['type'] == self.POSITION_TYPE_BUY else -1
+        return (price - position['price_open']) * direction * volume * self.symbols[position['symbol']]['contract_size']
+
+    def _deal(self, order: int, position: Dict[str, Any], deal_type: int, entry: int, reason: int,
+              volume: float, price: float, profit: float) -> TradeDeal:
+        commission = -self.commission_per_lot * volume
+        deal = TradeDeal(self._next_deal, order, self.now, self.now * 1000, deal_type, entry, position['magic'],
+                         position['ticket'], reason, volume, price, commission, 0.0, profit, 0.0,
+                         position['symbol'], position['comment'])
+        self._next_deal += 1
+        self.deals.append(deal)
+        self.balance += profit + commission
+        return deal
+
+    def _open_position(self, symbol, side, volume, price, sl, tp, magic, comment, ticket=None) -> TradeDeal:
+        ticket = ticket or self._new_ticket()
+        position = {'ticket': ticket, 'symbol': symbol, 'type': side, 'volume': volume, 'price_open': price,
+                    'sl': sl or 0.0, 'tp': tp or 0.0, 'magic': magic, 'comment': comment,
+                    'time': self.now, 'time_update': self.now}
+        self.positions[ticket] = position
+        self.stats['filled'] += 1
+        deal_type = self.DEAL_TYPE_BUY if side == self.POSITION_TYPE_BUY else self.DEAL_TYPE_SELL
+        return self._deal(ticket, position, deal_type, self.DEAL_ENTRY_IN, self.DEAL_REASON_EXPERT, volume, price, 0.0)
+
+    def _close_position(self, ticket, volume, price, reason) -> TradeDeal:
+        position = self.positions[ticket]
+        volume = min(volume, position['volume'])
+        deal_type = self.DEAL_TYPE_SELL if position['type'] == self.POSITION_TYPE_BUY else self.DEAL_TYPE_BUY
+        deal = self._deal(self._new_ticket(), position, deal_type, self.DEAL_ENTRY_OUT, reason, volume, price,
+                          round(self._profit(position, price, volume), 2))
+        position['volume'] = round(position['volume'] - volume, 8)
+        position['time_update'] = self.now
+        if position['volume'] <= 0:
+            del self.positions[ticket]
+            self.stats['closed'] += 1
+        return deal
+
+    def _new_ticket(self) -> int:
+        self._next_ticket += 1
+        return self._next_ticket
+
+    # ----- API модуля MetaTrader5 -----
+    def initialize(self, *args, **kwargs) -> bool:
+        return True
+
+    def login(self, *args, **kwargs) -> bool:
+        return True
+
+    def shutdown(self):
+        self.stop()
+
+    def last_error(self):
+        return self._error
+
+    def symbol_select(self, symbol: str, enable: bool = True) -> bool:
+        return symbol in self.bars
+
+    def symbol_info(self, symbol: str) -> Optional[SymbolInfo]:
+        params = self.symbols.get(symbol)
+        if params is None:
+            return None
+        return SymbolInfo(symbol, params['digits'], params['point'], params['spread'], 0,
+                          params['contract_size'], 0.01, 100.0, 0.01, True)
+
+    def symbol_info_tick(self, symbol: str) -> Optional[Tick]:
+        with self._lock:
+            quote = self._quote(symbol) if symbol in self.bars else None
+            if quote is None:
+                return None
+            return Tick(self.now, quote[0], quote[1], 0.0, 0, self.now * 1000, 6, 0.0)
+
+    def account_info(self) -> AccountInfo:
+        with self._lock:
+            profit, margin = 0.0, 0.0
+            for position in self.positions.values():
+                bid, ask = self._quote(position['symbol'])
+                price = bid if position['type'] == self.POSITION_TYPE_BUY else ask
+                profit += self._profit(position, price, position['volume'])
+                margin += position['volume'] * self.symbols[position['symbol']]['contract_size'] * position['price_open'] / self.leverage
+            equity = self.balance + profit
+            return AccountInfo(self.login_id, round(self.balance, 2), round(equity, 2), round(margin, 2),
+                               round(equity - margin, 2), round(equity / margin * 100, 2) if margin else 0.0,
+                               round(profit, 2), self.leverage, 'USD', 'BrokerSimulator', 'Simulator')
+
+    def _position_tuple(self, position: Dict[str, Any]) -> TradePosition:
+        bid, ask = self._quote(position['symbol'])
+        price = bid if position['type'] == self.POSITION_TYPE_BUY else ask
+        return TradePosition(position['ticket'], position['time'], position['time'] * 1000, position['time_update'],
+                             position['type'], position['magic'], position['ticket'], self.DEAL_REASON_EXPERT,
+                             position['volume'], position['price_open'], position['sl'], position['tp'], price, 0.0,
+                             round(self._profit(position, price, position['volume']), 2), position['symbol'],
+                             position['comment'])
+
+    def positions_get(self, symbol: Optional[str] = None, group: Optional[str] = None,
+                      ticket: Optional[int] = None, tickets=None):
+        self._delay()
+        with self._lock:
+            wanted = set(tickets) if tickets else ({ticket} if ticket else None)
+            return tuple(self._position_tuple(p) for t, p in self.positions.items()
+                         if (wanted is None or t in wanted) and (symbol is None or p['symbol'] == symbol))
+
+    def orders_get(self, symbol: Optional[str] = None, group: Optional[str] = None, ticket: Optional[int] = None):
+        with self._lock:
+            result = []
+            for t, o in self.orders.items():
+                if (ticket is None or t == ticket) and (symbol is None or o['symbol'] == symbol):
+                    bid, ask = self._quote(o['symbol'])
+                    result.append(TradeOrder(t, o['time'], o['type'], self.ORDER_STATE_PLACED, o['magic'], o['volume'],
+                                             o['volume'], o['price_open'], o['sl'], o['tp'],
+                                             ask if o['type'] in (self.ORDER_TYPE_BUY_LIMIT, self.ORDER_TYPE_BUY_STOP) else bid,
+                                             o['symbol'], o['comment']))
+            return tuple(result)
+
+    def history_deals_get(self, date_from=None, date_to=None, group=None, ticket=None, position=None):
+        self._delay()
+        with self._lock:
+            if position is not None or ticket is not None:
+                return tuple(d for d in self.deals if d.position_id == position or d.ticket == ticket)
+            start = self._epoch(date_from) if date_from is not None else 0
+            end = self._epoch(date_to) if date_to is not None else None
+            # Конец "сейчас или позже" по настенным часам = до текущего момента симуляции
+            if end is None or end >= time.time():
+                end = float('inf')
+            return tuple(d for d in self.deals if start <= d.time <= end)
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        """Бары до текущего момента симуляции (в таймфрейме данных; timeframe не пересчитывается)"""
+        self._delay()
+        with self._lock:
+            if symbol not in self.bars:
+                return None
+            end = self._index[symbol] + 1 - start_pos
+            return self.bars[symbol][max(0, end - count):max(0, end)].copy()
+
+    def copy_rates_range(self, symbol, timeframe, date_from, date_to):
+        self._delay()
+        with self._lock:
+            if symbol not in self.bars:
+                return None
+            rates = self.bars[symbol][:self._index[symbol] + 1]
+            lo = np.searchsorted(rates['time'], self._epoch(date_from), side='left')
+            hi = np.searchsorted(rates['time'], self._epoch(date_to), side='right')
+            return rates[lo:hi].copy()
+
+    def order_send(self, request: Dict[str, Any]) -> OrderSendResult:
+        self._delay(self.latency_ms, self.latency_jitter_ms)
+        with self._lock:
+            self.stats['orders_sent'] += 1
+            action = request.get('action')
+            symbol = request.get('symbol')
+            quote = self._quote(symbol) if symbol in self.bars else (0.0, 0.0)
+            if self.reject_rate and self._random.random() < self.reject_rate:
+                self.stats['rejected'] += 1
+                return self._result(self.TRADE_RETCODE_REQUOTE, quote, comment='Requote')
+            if action == self.TRADE_ACTION_DEAL:
+                return self._market(request, quote)
+            if action == self.TRADE_ACTION_PENDING:
+                if symbol not in self.bars:
+                    return self._result(self.TRADE_RETCODE_INVALID, quote, comment='Unknown symbol')
+                ticket = self._new_ticket()
+                self.orders[ticket] = {'symbol': symbol, 'type': request['type'], 'volume': float(request['volume']),
+                                       'price_open': float(request['price']), 'sl': request.get('sl') or 0.0,
+                                       'tp': request.get('tp') or 0.0, 'magic': request.get('magic', 0),
+                                       'comment': request.get('comment', ''), 'time': self.now}
+                return self._result(self.TRADE_RETCODE_DONE, quote, order=ticket, volume=request['volume'],
+                                    price=request['price'])
+            if action == self.TRADE_ACTION_SLTP:
+                position = self.positions.get(request.get('position'))
+                if position is None:
+                    return self._result(self.TRADE_RETCODE_POSITION_CLOSED, quote, comment='Position not found')
+                bid, ask = self._quote(position['symbol'])
+                sl, tp = request.get('sl') or 0.0, request.get('tp') or 0.0
+                if not self._valid_stops(position['type'], bid if position['type'] == self.POSITION_TYPE_BUY else ask, sl, tp):
+                    return self._result(self.TRADE_RETCODE_INVALID_STOPS, (bid, ask), comment='Invalid stops')
+                position['sl'], position['tp'], position['time_update'] = sl, tp, self.now
+                return self._result(self.TRADE_RETCODE_DONE, (bid, ask), order=position['ticket'])
+            if action in (self.TRADE_ACTION_REMOVE, self.TRADE_ACTION_MODIFY):
+                order = self.orders.get(request.get('order'))
+                if order is None:
+                    return self._result(self.TRADE_RETCODE_INVALID, quote, comment='Order not found')
+                if action == self.TRADE_ACTION_REMOVE:
+                    del self.orders[request['order']]
+                else:
+                    order.update({k: request[k] for k in ('sl', 'tp') if k in request})
+                    if request.get('price'):
+                        order['price_open'] = float(request['price'])
+                return self._result(self.TRADE_RETCODE_DONE, quote, order=request['order'])
+            return self._result(self.TRADE_RETCODE_INVALID, quote, comment='Unsupported action')
+
+    def _market(self, request: Dict[str, Any], quote) -> OrderSendResult:
+        bid, ask = quote
+        volume = float(request.get('volume') or 0)
+        if request.get('position'):
+            position = self.positions.get(request['position'])
+            if position is None:
+                return self._result(self.TRADE_RETCODE_POSITION_CLOSED, quote, comment='Position not found')
+            bid, ask = self._quote(position['symbol'])
+            price = bid if position['type'] == self.POSITION_TYPE_BUY else ask
+            deal = self._close_position(position['ticket'], volume or position['volume'], price, self.DEAL_REASON_EXPERT)
+            return self._result(self.TRADE_RETCODE_DONE, (bid, ask), deal=deal.ticket, order=deal.order,
+                                volume=deal.volume, price=price)
+        symbol = request.get('symbol')
+        if symbol not in self.bars:
+            return self._result(self.TRADE_RETCODE_INVALID, quote, comment='Unknown symbol')
+        if volume <= 0:
+            return self._result(self.TRADE_RETCODE_INVALID_VOLUME, quote, comment='Invalid volume')
+        side = request.get('type')
+        price = ask if side == self.ORDER_TYPE_BUY else bid
+        sl, tp = request.get('sl') or 0.0, request.get('tp') or 0.0
+        if not self._valid_stops(side, price, sl, tp):
+            return self._result(self.TRADE_RETCODE_INVALID_STOPS, quote, comment='Invalid stops')
+        required = volume * self.symbols[symbol]['contract_size'] * price / self.leverage
+        if required > self.account_info().margin_free:
+            return self._result(self.TRADE_RETCODE_NO_MONEY, quote, comment='No money')
+        deal = self._open_position(symbol, side, volume, price, sl, tp, request.get('magic', 0), request.get('comment', ''))
+        return self._result(self.TRADE_RETCODE_DONE, quote, deal=deal.ticket, order=deal.order, volume=volume, price=price)
+
+    def _valid_stops(self, side: int, price: float, sl: float, tp: float) -> bool:
+        if side == self.ORDER_TYPE_BUY:
+            return (not sl or sl < price) and (not tp or tp > price)
+        return (not sl or sl > price) and (not tp or tp < price)
+
+    def _result(self, retcode, quote, deal=0, order=0, volume=0.0, price=0.0, comment='Request executed'):
+        self._error = (1, 'Success') if retcode == self.TRADE_RETCODE_DONE else (retcode, comment)
+        return OrderSendResult(retcode, deal, order, volume, price, quote[0], quote[1], comment, 0)
+
+    def _delay(self, base_ms: float = 0.0, jitter_ms: float = 0.0):
+        delay = base_ms + (self._random.uniform(0, jitter_ms) if jitter_ms else 0.0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    @staticmethod
+    def _epoch(value) -> int:
+        # Наивное время - UTC, как в bar_store и resample
+        if isinstance(value, datetime):
+            return int((value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp())
+        return int(value.timestamp()) if hasattr(value, 'timestamp') else int(value)
+
+
+def install_metatrader5(simulator: BrokerSimulator):
+    """
+    Подменяет модуль MetaTrader5 симулятором: для последующих импортов и
+    для уже загруженных модулей проекта, которые держат ссылку mt5.
+    """
+    sys.modules['MetaTrader5'] = simulator
+    for name in ('mt5_server', 'core.mt5_service', 'core.trade_manager_service', 'core.ai_trader_service',
+                 'services.mt5_service', 'services.trade_manager_service'):
+        module = sys.modules.get(name)
+        if module is not None and hasattr(module, 'mt5'):
+            module.mt5 = simulator
+            if hasattr(module, 'MT5_AVAILABLE'):
+                module.MT5_AVAILABLE = True
+
+
+def create_simulated_mt5_service(simulator: BrokerSimulator, **kwargs):
+    """core MT5Service поверх симулятора (для прогонов TradeManager и SignalProcessor без терминала)"""
+    install_metatrader5(simulator)
+    from core.mt5_service import MT5Service
+    service = MT5Service(path='', login=str(simulator.login_id), password='', server='BrokerSimulator', **kwargs)
+    service.initialize()
+    return service
@@ -0,0 +1,330 @@
+import os
+import sqlite3
+from datetime import datetime, timezone
+from itertools import groupby
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from utils.db_connection import read_only_uri
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Колонка времени, по которой таблица режется на месячные партиции
+TIME_COLUMNS = {
+    'trades': 'timestamp',
+    'signals': 'timestamp',
+    'deals': 'time',
+}
+
+FORMATS = ('parquet', 'arrow')
+
+
+def _require_pyarrow():
+    if not PYARROW_AVAILABLE:
+        raise ImportError("pyarrow не установлен: pip install pyarrow")
+
+
+def _month_of(value: Any) -> str:
+    # Метки времени SQLite - текст 'YYYY-MM-DD ...', у сделок MT5 - секунды UTC
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=timezone.utc).strftime('%Y-%m')
+    return str(value)[:7]
+
+
+def _partition_path(out_dir: str, table: str, month: str, fmt: str) -> str:
+    # Hive-разметка: out_dir/trades/month=2024-05/part.parquet
+    return os.path.join(out_dir, table, f"month={month}", f"part.{'parquet' if fmt == 'parquet' else 'arrow'}")
+
+
+def _parse_time(value: Any) -> Optional[datetime]:
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=timezone.utc).replace(tzinfo=None)
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _to_timestamp(values: List[Any]) -> "pa.Array":
+    """Метки времени SQLite -> timestamp[us]; неразобранные значения становятся null, а не меняют тип колонки"""
+    array = pa.array([None if v is None else str(v) for v in values], pa.string())
+    try:
+        return pc.cast(pc.replace_substring(array, 'T', ' '), pa.timestamp('us'))
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return pa.array([None if v is None else _parse_time(v) for v in values], pa.timestamp('us'))
+
+
+def _declared_type(declared: str) -> "pa.DataType":
+    """Тип Arrow по объявленному типу колонки SQLite (правила affinity SQLite)"""
+    declared = (declared or '').upper()
+    if 'INT' in declared:
+        return pa.int64()
+    if any(t in declared for t in ('CHAR', 'CLOB', 'TEXT')):
+        return pa.string()
+    if 'BLOB' in declared:
+        return pa.binary()
+    if any(t in declared for t in ('REAL', 'FLOA', 'DOUB')):
+        return pa.float64()
+    if 'DATE' in declared or 'TIME' in declared:
+        return pa.timestamp('us')
+    if 'BOOL' in declared:
+        return pa.bool_()
+    # NUMERIC/DECIMAL и колонки без типа
+    return pa.float64() if declared else pa.string()
+
+
+def _table_schema(conn: sqlite3.Connection, table: str, columns: List[str], time_column: str) -> "pa.Schema":
+    """
+    Одна схема на таблицу по объявленным типам колонок: все месячные
+    партиции пишутся с ней и читаются одним набором данных. Текстовая
+    колонка времени хранится как timestamp[us].
+    """
+    declared = {name: kind for _, name, kind, *_ in conn.execute(f"PRAGMA table_info({table})")}
+    fields = []
+    for name in columns:
+        kind = _declared_type(declared.get(name, ''))
+        if name == time_column and pa.types.is_string(kind):
+            kind = pa.timestamp('us')
+        fields.append(pa.field(name, kind))
+    return pa.schema(fields)
+
+
+def _records_schema(columns: List[str], rows: List[tuple]) -> "pa.Schema":
+    """Одна схема по всем строкам сразу (для сделок без объявленных типов)"""
+    fields = []
+    for index, name in enumerate(columns):
+        kinds = {type(row[index]) for row in rows if row[index] is not None}
+        if kinds and kinds <= {bool}:
+            kind = pa.bool_()
+        elif kinds and kinds <= {int}:
+            kind = pa.int64()
+        elif kinds and kinds <= {int, float}:
+            kind = pa.float64()
+        elif kinds and kinds <= {bytes}:
+            kind = pa.binary()
+        else:
+            kind = pa.string()
+        fields.append(pa.field(name, kind))
+    return pa.schema(fields)
+
+
+def _coerce(value: Any, kind: "pa.DataType") -> Any:
+    # SQLite не проверяет типы: значение, не подходящее колонке, становится null (строковой колонке - текстом)
+    if value is None:
+        return None
+    try:
+        if pa.types.is_string(kind):
+            return value if isinstance(value, str) else str(value)
+        if pa.types.is_integer(kind):
+            return int(value)
+        if pa.types.is_floating(kind):
+            return float(value)
+        if pa.types.is_boolean(kind):
+            return bool(int(value)) if not isinstance(value, str) else value.strip().lower() in ('1', 'true')
+        if pa.types.is_binary(kind):
+            return value if isinstance(value, bytes) else str(value).encode()
+    except (TypeError, ValueError):
+        return None
+    return value
+
+
+def _column_array(values: List[Any], kind: "pa.DataType") -> "pa.Array":
+    if pa.types.is_timestamp(kind):
+        return _to_timestamp(values)
+    try:
+        return pa.array(values, kind)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return pa.array([_coerce(v, kind) for v in values], kind)
+
+
+class _PartitionWriter:
+    """
+    Пишет файл партиции пачками строк со схемой таблицы. Файл появляется
+    под своим именем только после close(), до этого пишется во временный.
+    """
+
+    def __init__(self, path: str, fmt: str, schema: "pa.Schema"):
+        self.path = path
+        self.fmt = fmt
+        self.schema = schema
+        self.rows = 0
+        self._tmp_path = f"{path}.tmp"
+        self._sink = None
+        self._writer = None
+
+    def write(self, rows: List[tuple]):
+        if not rows:
+            return
+        # Транспонируем строки в колонки один раз на пачку
+        arrays = [_column_array(list(values), field.type) for values, field in zip(zip(*rows), self.schema)]
+        table = pa.Table.from_arrays(arrays, schema=self.schema)
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if self.fmt == 'parquet':
+                self._writer = pq.ParquetWriter(self._tmp_path, self.schema, compression='zstd')
+            else:
+                # Arrow IPC без сжатия: при чтении файл отображается в память без копирования
+                self._sink = pa.OSFile(self._tmp_path, 'wb')
+                self._writer = ipc.new_file(self._sink, self.schema)
+        self._writer.write_table(table)
+        self.rows += len(rows)
+
+    def _close_files(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+        self._writer = self._sink = None
+
+    def close(self) -> int:
+        self._close_files()
+        if self.rows:
+            os.replace(self._tmp_path, self.path)
+        return self.rows
+
+    def abort(self):
+        self._close_files()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+def _write_months(name: str, schema: "pa.Schema", rows_by_month: Dict[str, List[tuple]], out_dir: str,
+                  fmt: str) -> Dict[str, int]:
+    written = {}
+    for month, rows in sorted(rows_by_month.items()):
+        writer = _PartitionWriter(_partition_path(out_dir, name, month, fmt), fmt, schema)
+        try:
+            writer.write(rows)
+        except Exception:
+            writer.abort()
+            raise
+        written[month] = writer.close()
+    return written
+
+
+def export_table(db_path: str, table: str, out_dir: str = 'data/export', fmt: str = 'parquet',
+                 since: Optional[str] = None, batch_size: int = 50_000) -> Dict[str, int]:
+    """
+    Выгружает таблицу SQLite в помесячные файлы Parquet/Arrow IPC.
+
+    since='YYYY-MM' ограничивает выгрузку месяцами начиная с указанного
+    (месяцы перезаписываются целиком, поэтому повторный запуск идемпотентен).
+    Строки читаются по порядку времени пачками по batch_size и сразу
+    дописываются в файл своего месяца - в памяти не больше одной пачки.
+    Возвращает {месяц: число строк}.
+    """
+    _require_pyarrow()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    time_column = TIME_COLUMNS.get(table, 'timestamp')
+    conn = sqlite3.connect(read_only_uri(db_path), uri=True)
+    written: Dict[str, int] = {}
+    writer, month = None, None
+    try:
+        query, params = f"SELECT * FROM {table} WHERE {time_column} IS NOT NULL", []
+        if since:
+            query += f" AND {time_column} >= ?"
+            params.append(since if time_column != 'time' else
+                          datetime.strptime(since[:7], '%Y-%m').replace(tzinfo=timezone.utc).timestamp())
+        cursor = conn.execute(query + f" ORDER BY {time_column}", params)
+        columns = [d[0] for d in cursor.description]
+        schema = _table_schema(conn, table, columns, time_column)
+        ts_index = columns.index(time_column)
+        while True:
+            # Строки остаются кортежами - без словаря на каждую строку
+            chunk = cursor.fetchmany(batch_size)
+            if not chunk:
+                break
+            # Строки отсортированы по времени, так что месяц пачки меняется только вперёд
+            for chunk_month, rows in groupby(chunk, key=lambda row: _month_of(row[ts_index])):
+                if chunk_month != month:
+                    if writer is not None:
+                        written[month] = writer.close()
+                    month = chunk_month
+                    writer = _PartitionWriter(_partition_path(out_dir, table, month, fmt), fmt, schema)
+                writer.write(list(rows))
+        if writer is not None:
+            written[month] = writer.close()
+            writer = None
+    finally:
+        if writer is not None:
+            writer.abort()
+        conn.close()
+    return written
+
+
+def _deal_to_dict(deal: Any) -> Dict[str, Any]:
+    if isinstance(deal, dict):
+        return deal
+    if hasattr(deal, '_asdict'):
+        return deal._asdict()
+    return {name: getattr(deal, name) for name in dir(deal) if not name.startswith('_') and not callable(getattr(deal, name))}
+
+
+def export_deals(deals: Iterable[Any], out_dir: str = 'data/export', fmt: str = 'parquet') -> Dict[str, int]:
+    """
+    Выгружает историю сделок MT5 (TradeDeal из MetaTrader5 или словари Flask API)
+    в помесячные файлы; месяц определяется по полю time (секунды UTC).
+    """
+    _require_pyarrow()
+    records = [_deal_to_dict(deal) for deal in deals or []]
+    if not records:
+        return {}
+    columns = list(records[0].keys())
+    rows = [tuple(record.get(c) for c in columns) for record in records]
+    schema = _records_schema(columns, rows)
+    rows_by_month: Dict[str, List[tuple]] = {}
+    for record, row in zip(records, rows):
+        rows_by_month.setdefault(_month_of(record.get('time', 0)), []).append(row)
+    return _write_months('deals', schema, rows_by_month, out_dir, fmt)
+
+
+def load_table(table: str, out_dir: str = 'data/export', months: Optional[Sequence[str]] = None,
+               columns: Optional[Sequence[str]] = None, fmt: Optional[str] = None) -> "pa.Table":
+    """
+    Читает выгруженные партиции как одну таблицу Arrow.
+
+    months - список 'YYYY-MM' (остальные партиции не открываются), columns -
+    проекция колонок. Файлы Arrow IPC отображаются в память без копирования.
+    """
+    _require_pyarrow()
+    base = os.path.join(out_dir, table)
+    if not os.path.isdir(base):
+        return pa.table({})
+    files = sorted(os.path.join(root, name) for root, _, names in os.walk(base) for name in names
+                   if name.endswith(('.arrow', '.parquet')))
+    if fmt is None:
+        fmt = 'arrow' if any(path.endswith('.arrow') for path in files) else 'parquet'
+    # Только файлы выбранного формата: после смены формата выгрузки в каталоге лежат оба
+    files = [path for path in files if path.endswith('.arrow' if fmt == 'arrow' else '.parquet')]
+    if not files:
+        return pa.table({})
+    dataset = ds.dataset(files, format='ipc' if fmt == 'arrow' else 'parquet', partitioning='hive',
+                         partition_base_dir=base)
+    filter_expr = ds.field('month').isin(list(months)) if months else None
+    return dataset.to_table(columns=list(columns) if columns else None, filter=filter_expr)
+
+
+def load_dataframe(table: str, out_dir: str = 'data/export', months: Optional[Sequence[str]] = None,
+                   columns: Optional[Sequence[str]] = None, fmt: Optional[str] = None):
+    """То же, что load_table, но в виде pandas.DataFrame (числовые колонки без лишних копий)"""
+    arrow_table = load_table(table, out_dir, months, columns, fmt)
+    return arrow_table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def export_all(db_path: str, out_dir: str = 'data/export', fmt: str = 'parquet', since: Optional[str] = None,
+               tables: Sequence[str] = ('trades', 'signals')) -> Dict[str, Dict[str, int]]:
+    """Выгружает несколько таблиц базы (отсутствующие пропускаются)"""
+    conn = sqlite3.connect(read_only_uri(db_path), uri=True)
+    try:
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    finally:
+        conn.close()
+    return {table: export_table(db_path, table, out_dir, fmt, since) for table in tables if table in existing}
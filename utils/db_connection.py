@@ -0,0 +1,306 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from urllib.parse import quote
+
+
+class SQLiteConnectionManager:
+    """
+    Менеджер соединений SQLite.
+
+    Держит одно долгоживущее соединение для записи (под блокировкой) и по одному
+    соединению для чтения на каждый поток. Все соединения работают в режиме WAL
+    с synchronous=NORMAL и используют кэш подготовленных выражений sqlite3,
+    поэтому повторные запросы не открывают файл и не компилируют SQL заново.
+    """
+
+    def __init__(self, db_path: str, cached_statements: int = 256, busy_timeout_ms: int = 5000,
+                 row_factory=None):
+        self.db_path = db_path
+        self.cached_statements = cached_statements
+        self.busy_timeout_ms = busy_timeout_ms
+        self.row_factory = row_factory
+
+        self._write_lock = threading.RLock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._stats = self._empty_stats()
+
+    # ----- Соединения -----
+    def _connect(self) -> sqlite3.Connection:
+        """Открывает новое соединение с нужными PRAGMA"""
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        with self._stats_lock:
+            self._stats['connections_opened'] += 1
+        return conn
+
+    @property
+    def writer(self) -> sqlite3.Connection:
+        """Единственное соединение для записи"""
+        if self._writer is None:
+            with self._write_lock:
+                if self._writer is None:
+                    self._writer = self._connect()
+        return self._writer
+
+    def reader(self) -> sqlite3.Connection:
+        """Соединение для чтения, закреплённое за текущим потоком"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            conn.row_factory = self.row_factory
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def close(self):
+        """Закрывает все открытые соединения"""
+        with self._readers_lock:
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    # ----- Запись -----
+    @contextmanager
+    def transaction(self):
+        """Транзакция на соединении-писателе: commit при успехе, rollback при ошибке"""
+        with self._write_lock:
+            conn = self.writer
+            started = time.perf_counter()
+            cursor = conn.cursor()
+            try:
+                yield cursor
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+                self._record('writes', 'write_time', started)
+
+    def execute_write(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """Выполняет один оператор записи, возвращает lastrowid"""
+        with self.transaction() as cursor:
+            cursor.execute(sql, params)
+            return cursor.lastrowid
+
+    def executemany_write(self, sql: str, seq_of_params: Iterable[Sequence[Any]]) -> int:
+        """Выполняет пакетную запись одной транзакцией, возвращает число строк"""
+        with self.transaction() as cursor:
+            cursor.executemany(sql, seq_of_params)
+            return cursor.rowcount
+
+    # ----- Чтение -----
+    def _read(self, sql: str, params: Sequence[Any]):
+        conn = self.reader()
+        started = time.perf_counter()
+        try:
+            cursor = conn.execute(sql, params)
+            rows = cursor.fetchall()
+            columns = [description[0] for description in cursor.description] if cursor.description else []
+            return rows, columns
+        finally:
+            self._record('reads', 'read_time', started)
+
+    def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        """Возвращает все строки в виде кортежей"""
+        rows, _ = self._read(sql, params)
+        return rows
+
+    def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+        """Возвращает первую строку или None"""
+        rows, _ = self._read(sql, params)
+        return rows[0] if rows else None
+
+    def fetch_dicts(self, sql: str, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+        """Возвращает строки в виде словарей (имена колонок берутся один раз на запрос)"""
+        rows, columns = self._read(sql, params)
+        return [dict(zip(columns, row)) for row in rows]
+
+    # ----- Счётчики -----
+    @staticmethod
+    def _empty_stats() -> Dict[str, Any]:
+        return {'reads': 0, 'writes': 0, 'read_time': 0.0, 'write_time': 0.0, 'connections_opened': 0}
+
+    def _record(self, counter: str, timer: str, started: float):
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self._stats[counter] += 1
+            self._stats[timer] += elapsed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счётчики запросов и суммарное/среднее время в миллисекундах"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['avg_read_ms'] = stats['read_time'] * 1000 / stats['reads'] if stats['reads'] else 0.0
+        stats['avg_write_ms'] = stats['write_time'] * 1000 / stats['writes'] if stats['writes'] else 0.0
+        stats['read_time_ms'] = stats.pop('read_time') * 1000
+        stats['write_time_ms'] = stats.pop('write_time') * 1000
+        return stats
+
+    def reset_stats(self):
+        """Обнуляет счётчики (кроме числа открытых соединений)"""
+        with self._stats_lock:
+            opened = self._stats['connections_opened']
+            self._stats = self._empty_stats()
+            self._stats['connections_opened'] = opened
+
+
+def read_only_uri(db_path: str) -> str:
+    """URI для открытия базы только на чтение (mode=ro)"""
+    return "file:" + quote(os.path.abspath(db_path).replace(os.sep, '/'), safe='/:') + "?mode=ro"
+
+
+class ReadOnlyConnectionPool:
+    """
+    Пул соединений только для чтения (mode=ro, query_only) для интерфейса.
+
+    Соединения не участвуют в записи и не делят блокировку с писателем: в режиме
+    WAL читатель видит последний зафиксированный снимок и не ждёт транзакций
+    торгового цикла, а долгий запрос страницы истории не задерживает запись.
+    Размер пула ограничен: при исчерпании поток ждёт освободившееся соединение.
+    """
+
+    def __init__(self, db_path: str, size: int = 4, busy_timeout_ms: int = 5000,
+                 cached_statements: int = 128, row_factory=None):
+        self.db_path = db_path
+        self.size = size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self.row_factory = row_factory
+
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self._stats_lock = threading.Lock()
+        self._stats = self._empty_stats()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(read_only_uri(self.db_path), uri=True, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.execute("PRAGMA query_only=1")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.row_factory = self.row_factory
+        with self._stats_lock:
+            self._stats['connections_opened'] += 1
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+            if len(self._all) < self.size:
+                conn = self._connect()
+                self._all.append(conn)
+                return conn
+        started = time.perf_counter()
+        conn = self._idle.get()
+        with self._stats_lock:
+            self._stats['waits'] += 1
+            self._stats['wait_time'] += time.perf_counter() - started
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Соединение из пула на время блока"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.put(conn)
+
+    @contextmanager
+    def snapshot(self):
+        """Несколько запросов в одной читающей транзакции - все видят один и тот же снимок базы"""
+        with self.connection() as conn:
+            conn.execute("BEGIN")
+            yield conn
+
+    def _read(self, sql: str, params: Sequence[Any]):
+        started = time.perf_counter()
+        try:
+            with self.connection() as conn:
+                cursor = conn.execute(sql, params)
+                rows = cursor.fetchall()
+                columns = [description[0] for description in cursor.description] if cursor.description else []
+                return rows, columns
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._stats_lock:
+                self._stats['reads'] += 1
+                self._stats['read_time'] += elapsed
+
+    def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        """Возвращает все строки"""
+        rows, _ = self._read(sql, params)
+        return rows
+
+    def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+        """Возвращает первую строку или None"""
+        rows, _ = self._read(sql, params)
+        return rows[0] if rows else None
+
+    def fetch_dicts(self, sql: str, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+        """Возвращает строки в виде словарей"""
+        rows, columns = self._read(sql, params)
+        return [dict(zip(columns, row)) for row in rows]
+
+    def close(self):
+        """Закрывает свободные соединения; занятые закроются при возврате в пул"""
+        with self._lock:
+            self._closed = True
+            self._all = []
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, Any]:
+        return {'reads': 0, 'read_time': 0.0, 'waits': 0, 'wait_time': 0.0, 'connections_opened': 0}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Число запросов, ожиданий свободного соединения и время в миллисекундах"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['avg_read_ms'] = stats['read_time'] * 1000 / stats['reads'] if stats['reads'] else 0.0
+        stats['read_time_ms'] = stats.pop('read_time') * 1000
+        stats['wait_time_ms'] = stats.pop('wait_time') * 1000
+        stats['pool_size'] = self.size
+        return stats
@@ -0,0 +1,297 @@
+import gzip
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+# Статусы сигналов, которые считаются незавершёнными и не архивируются
+DEFAULT_KEEP_SIGNAL_STATUSES = ('NEW', 'PENDING', 'PARTIAL_ENTRY', 'PROCESSED_ACTIVE', 'MODIFIED_ACTIVE', 'BREAKEVEN_SET')
+
+
+class DatabaseMaintenance:
+    """
+    Ретеншн и фоновое сжатие базы.
+
+    - логи старше log_retention_days переносятся в помесячные архивы
+      (archive_dir/logs_YYYY-MM.db или logs_YYYY-MM.jsonl.gz) и удаляются из базы;
+    - завершённые сигналы старше signal_retention_days сжимаются в таблицу
+      signals_archive (id, timestamp, symbol, status, data=JSON всей строки)
+      в archive_dir/signals_archive.db вместе со строками дочерних таблиц;
+    - освободившиеся страницы возвращаются через PRAGMA incremental_vacuum
+      (если база уже в auto_vacuum=INCREMENTAL - перевод делает `db_maintenance.py compact`).
+
+    Работа идёт пачками по batch_size строк в коротких транзакциях, поэтому
+    писатель приложения ждёт не дольше одной пачки (busy_timeout).
+    """
+
+    def __init__(self, db_path: str, archive_dir: str = 'data/archive', log_retention_days: Optional[int] = 30,
+                 signal_retention_days: Optional[int] = 90, archive_format: str = 'sqlite',
+                 keep_signal_statuses: Sequence[str] = DEFAULT_KEEP_SIGNAL_STATUSES,
+                 child_tables: Optional[Dict[str, str]] = None, batch_size: int = 5000,
+                 vacuum_pages: int = 2000, interval: float = 6 * 3600, busy_timeout_ms: int = 5000):
+        if archive_format not in ('sqlite', 'jsonl.gz'):
+            raise ValueError(f"Unknown archive format: {archive_format}")
+        self.db_path = db_path
+        self.archive_dir = archive_dir
+        self.log_retention_days = log_retention_days
+        self.signal_retention_days = signal_retention_days
+        self.archive_format = archive_format
+        self.keep_signal_statuses = tuple(keep_signal_statuses)
+        # Таблицы, строки которых уходят в архив вместе с сигналом: имя -> колонка со ссылкой на signals.id
+        self.child_tables = child_tables if child_tables is not None else {'signal_tickets': 'signal_id'}
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.interval = interval
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_report: Dict[str, Any] = {}
+
+    # ----- Соединения -----
+    def _connect(self, path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return conn
+
+    @staticmethod
+    def _table_exists(conn: sqlite3.Connection, table: str) -> bool:
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+    @staticmethod
+    def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+        return [info[1] for info in conn.execute(f"PRAGMA table_info({table})")]
+
+    @staticmethod
+    def _cutoff(days: int) -> str:
+        # Строковое сравнение работает для обоих форматов меток времени в проекте
+        return (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+    # ----- Логи -----
+    def archive_logs(self, conn: Optional[sqlite3.Connection] = None) -> int:
+        """Переносит старые логи в помесячные архивы, возвращает число перенесённых строк"""
+        if self.log_retention_days is None:
+            return 0
+        own = conn is None
+        conn = conn or self._connect(self.db_path)
+        try:
+            if not self._table_exists(conn, 'logs'):
+                return 0
+            columns = self._columns(conn, 'logs')
+            cutoff = self._cutoff(self.log_retention_days)
+            moved = 0
+            while not self._stop.is_set():
+                # Логи пишутся по порядку, поэтому старые строки - это префикс по id:
+                # читаем только начало таблицы, без сканирования по timestamp
+                rows = conn.execute(f"SELECT {', '.join(columns)} FROM logs ORDER BY id LIMIT ?", (self.batch_size,)).fetchall()
+                ts_index = columns.index('timestamp')
+                expired = []
+                for row in rows:
+                    if row[ts_index] is None or str(row[ts_index]) >= cutoff:
+                        break
+                    expired.append(row)
+                if not expired:
+                    break
+                by_month: Dict[str, List[tuple]] = {}
+                for row in expired:
+                    by_month.setdefault(str(row[ts_index])[:7], []).append(row)
+                for month, month_rows in by_month.items():
+                    self._write_log_archive(month, columns, month_rows)
+                # Удаляем только после записи архива. Если удаление не прошло, пачка запишется снова:
+                # в .db это INSERT OR IGNORE по id, в .jsonl.gz - дубликаты, которые пропускает read_log_archive
+                conn.execute("DELETE FROM logs WHERE id <= ?", (expired[-1][columns.index('id')],))
+                moved += len(expired)
+                if len(expired) < len(rows):
+                    break
+            return moved
+        finally:
+            if own:
+                conn.close()
+
+    def _write_log_archive(self, month: str, columns: List[str], rows: List[tuple]):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        if self.archive_format == 'jsonl.gz':
+            # Каждая пачка дописывается отдельным gzip-членом, файл читается как один поток
+            with gzip.open(os.path.join(self.archive_dir, f"logs_{month}.jsonl.gz"), "at", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + "\n")
+            return
+        archive = self._connect(os.path.join(self.archive_dir, f"logs_{month}.db"))
+        try:
+            column_defs = ", ".join('id INTEGER PRIMARY KEY' if c == 'id' else c for c in columns)
+            archive.execute(f"CREATE TABLE IF NOT EXISTS logs ({column_defs})")
+            archive.execute("BEGIN")
+            archive.executemany(f"INSERT OR IGNORE INTO logs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+            archive.execute("COMMIT")
+        finally:
+            archive.close()
+
+    # ----- Сигналы -----
+    def compact_signals(self, conn: Optional[sqlite3.Connection] = None) -> int:
+        """Переносит завершённые старые сигналы в signals_archive, возвращает число сигналов"""
+        if self.signal_retention_days is None:
+            return 0
+        own = conn is None
+        conn = conn or self._connect(self.db_path)
+        try:
+            if not self._table_exists(conn, 'signals'):
+                return 0
+            columns = self._columns(conn, 'signals')
+            children = {table: column for table, column in self.child_tables.items() if self._table_exists(conn, table)}
+            cutoff = self._cutoff(self.signal_retention_days)
+            placeholders = ", ".join('?' * len(self.keep_signal_statuses)) or "''"
+            archive = self._connect(os.path.join(self._ensure_archive_dir(), "signals_archive.db"))
+            archive.execute("""
+                CREATE TABLE IF NOT EXISTS signals_archive (
+                    id INTEGER PRIMARY KEY,
+                    timestamp TEXT,
+                    symbol TEXT,
+                    status TEXT,
+                    data TEXT,
+                    archived_at TEXT
+                )
+            """)
+            moved = 0
+            try:
+                while not self._stop.is_set():
+                    rows = conn.execute(f"""
+                        SELECT {', '.join(columns)} FROM signals
+                        WHERE timestamp < ? AND COALESCE(status, '') NOT IN ({placeholders})
+                        ORDER BY id LIMIT ?
+                    """, (cutoff, *self.keep_signal_statuses, self.batch_size)).fetchall()
+                    if not rows:
+                        break
+                    records = [dict(zip(columns, row)) for row in rows]
+                    by_id = {record['id']: record for record in records}
+                    ids = list(by_id)
+                    id_list = ", ".join('?' * len(ids))
+                    for table, column in children.items():
+                        child_columns = self._columns(conn, table)
+                        for child in conn.execute(f"SELECT {', '.join(child_columns)} FROM {table} WHERE {column} IN ({id_list})", ids):
+                            child = dict(zip(child_columns, child))
+                            by_id[child[column]].setdefault(table, []).append(child)
+
+                    archived_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    archive.execute("BEGIN")
+                    archive.executemany("INSERT OR REPLACE INTO signals_archive VALUES (?, ?, ?, ?, ?, ?)", [
+                        (r['id'], str(r.get('timestamp')), r.get('symbol'), r.get('status'),
+                         json.dumps(r, ensure_ascii=False, default=str), archived_at) for r in records])
+                    archive.execute("COMMIT")
+
+                    conn.execute("BEGIN")
+                    for table, column in children.items():
+                        conn.execute(f"DELETE FROM {table} WHERE {column} IN ({id_list})", ids)
+                    conn.execute(f"DELETE FROM signals WHERE id IN ({id_list})", ids)
+                    conn.execute("COMMIT")
+                    moved += len(rows)
+            finally:
+                archive.close()
+            return moved
+        finally:
+            if own:
+                conn.close()
+
+    def _ensure_archive_dir(self) -> str:
+        os.makedirs(self.archive_dir, exist_ok=True)
+        return self.archive_dir
+
+    # ----- VACUUM -----
+    def incremental_vacuum(self, conn: Optional[sqlite3.Connection] = None, pages: Optional[int] = None,
+                           convert: bool = False) -> int:
+        """
+        Возвращает свободные страницы файлу, возвращает число освобождённых страниц.
+
+        Инкрементальный режим требует auto_vacuum=INCREMENTAL. Без него проход
+        пропускается: перевод старой базы делает полный VACUUM с эксклюзивной
+        блокировкой дольше busy_timeout, поэтому он выполняется только при
+        convert=True (команда `db_maintenance.py compact`), не в фоне.
+        """
+        own = conn is None
+        conn = conn or self._connect(self.db_path)
+        try:
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                if not convert:
+                    return 0
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+            else:
+                # executescript шагает оператор до конца; через execute() освобождается одна страница
+                conn.executescript(f"PRAGMA incremental_vacuum({int(pages or self.vacuum_pages)});")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+        finally:
+            if own:
+                conn.close()
+
+    # ----- Запуск -----
+    def run_once(self, convert_vacuum: bool = False) -> Dict[str, Any]:
+        """Один проход: архив логов, сжатие сигналов, инкрементальный VACUUM (convert_vacuum - см. incremental_vacuum)"""
+        started = datetime.now()
+        conn = self._connect(self.db_path)
+        try:
+            report = {
+                'logs_archived': self.archive_logs(conn),
+                'signals_archived': self.compact_signals(conn),
+                'pages_freed': self.incremental_vacuum(conn, convert=convert_vacuum),
+            }
+        finally:
+            conn.close()
+        report['duration_sec'] = (datetime.now() - started).total_seconds()
+        report['finished_at'] = datetime.now().isoformat()
+        self.last_report = report
+        return report
+
+    def start(self):
+        """Запускает фоновый поток обслуживания (первый проход - сразу)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="db-maintenance", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                report = self.run_once()
+                if report['logs_archived'] or report['signals_archived'] or report['pages_freed']:
+                    print(f"--- [DB MAINTENANCE] {os.path.basename(self.db_path)}: {report} ---")
+            except Exception as e:
+                print(f"--- [DB MAINTENANCE] Error: {e} ---")
+            self._stop.wait(self.interval)
+
+    def stop(self, timeout: Optional[float] = 10.0):
+        """Останавливает фоновый поток (текущая пачка дописывается)"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def read_log_archive(path: str) -> Iterable[Dict[str, Any]]:
+    """Читает записи из архива логов (.db или .jsonl.gz) по возрастанию id, без повторов"""
+    if path.endswith('.jsonl.gz'):
+        # Пачки дописываются по возрастанию id, поэтому id не больше уже прочитанного -
+        # повторная запись пачки после сбоя между архивацией и удалением из базы
+        last_id = None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                record_id = record.get('id')
+                if record_id is not None and last_id is not None and record_id <= last_id:
+                    continue
+                last_id = record_id if record_id is not None else last_id
+                yield record
+        return
+    conn = sqlite3.connect(path)
+    try:
+        cursor = conn.execute("SELECT * FROM logs ORDER BY id")
+        columns = [d[0] for d in cursor.description]
+        for row in cursor:
+            yield dict(zip(columns, row))
+    finally:
+        conn.close()
@@ -0,0 +1,187 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Sequence
+
+_STOP = object()
+
+
+class _WriteOp:
+    """Одна операция записи в очереди писателя"""
+
+    __slots__ = ('sql', 'params', 'many', 'fn', 'future')
+
+    def __init__(self, sql=None, params=(), many=False, fn=None):
+        self.sql = sql
+        self.params = params
+        self.many = many
+        self.fn = fn
+        self.future = Future()
+
+    def run(self, cursor):
+        if self.fn is not None:
+            return self.fn(cursor)
+        if self.many:
+            cursor.executemany(self.sql, self.params)
+            return cursor.rowcount
+        cursor.execute(self.sql, self.params)
+        return cursor.lastrowid
+
+
+class BatchWriter:
+    """
+    Единственный поток-писатель SQLite с групповыми коммитами.
+
+    Операции из любых потоков кладутся в очередь, поток-писатель забирает их
+    пачкой (до max_batch штук или пока не истечёт окно max_delay секунд) и
+    фиксирует одной транзакцией. Каждая операция выполняется внутри SAVEPOINT,
+    поэтому ошибка в одной не откатывает остальные. submit() возвращает Future,
+    который завершается после COMMIT (результат - lastrowid или rowcount).
+    """
+
+    def __init__(self, db_path: str, max_batch: int = 200, max_delay: float = 0.005,
+                 busy_timeout_ms: int = 5000):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._pending = 0
+        self._pending_cond = threading.Condition()
+        self._closed = False
+        self._stats = {'operations': 0, 'batches': 0, 'failed_operations': 0, 'failed_batches': 0}
+
+        self._thread = threading.Thread(target=self._run, name="sqlite-batch-writer", daemon=True)
+        self._thread.start()
+
+    # ----- Публичный API -----
+    def submit(self, sql: str, params: Sequence[Any] = ()) -> Future:
+        """Ставит в очередь один оператор; Future вернёт lastrowid"""
+        return self._enqueue(_WriteOp(sql, params))
+
+    def submit_many(self, sql: str, seq_of_params) -> Future:
+        """Ставит в очередь executemany; Future вернёт rowcount"""
+        return self._enqueue(_WriteOp(sql, list(seq_of_params), many=True))
+
+    def call(self, fn: Callable[[sqlite3.Cursor], Any]) -> Future:
+        """Выполняет fn(cursor) в потоке-писателе внутри общей транзакции"""
+        return self._enqueue(_WriteOp(fn=fn))
+
+    def execute(self, sql: str, params: Sequence[Any] = (), timeout: Optional[float] = None) -> int:
+        """Синхронная запись: ждёт коммита и возвращает lastrowid"""
+        return self.submit(sql, params).result(timeout)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Ждёт, пока все поставленные операции будут зафиксированы"""
+        if threading.current_thread() is self._thread:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._pending_cond:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._pending_cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """Дописывает очередь и останавливает поток-писатель"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Число операций, пачек и средний размер пачки"""
+        stats = dict(self._stats)
+        stats['pending'] = self._pending
+        stats['avg_batch_size'] = stats['operations'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
+
+    # ----- Поток-писатель -----
+    def _enqueue(self, op: _WriteOp) -> Future:
+        if self._closed:
+            raise RuntimeError("BatchWriter is closed")
+        with self._pending_cond:
+            self._pending += 1
+        self._queue.put(op)
+        return op.future
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: транзакциями управляем вручную (BEGIN/COMMIT на пачку)
+        conn = sqlite3.connect(self.db_path, isolation_level=None, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return conn
+
+    def _collect_batch(self, first):
+        """Добирает операции в пачку до max_batch или до конца окна max_delay"""
+        batch = [first]
+        stop = False
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                op = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if op is _STOP:
+                stop = True
+                break
+            batch.append(op)
+        return batch, stop
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                op = self._queue.get()
+                if op is _STOP:
+                    break
+                batch, stop = self._collect_batch(op)
+                self._commit_batch(conn, batch)
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch):
+        results = []
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN")
+            for op in batch:
+                cursor.execute("SAVEPOINT write_op")
+                try:
+                    results.append((op, op.run(cursor), None))
+                    cursor.execute("RELEASE write_op")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO write_op")
+                    cursor.execute("RELEASE write_op")
+                    results.append((op, None, e))
+            cursor.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            self._stats['failed_batches'] += 1
+            results = [(op, None, e) for op in batch]
+        finally:
+            cursor.close()
+
+        self._stats['batches'] += 1
+        for op, result, error in results:
+            self._stats['operations'] += 1
+            if error is not None:
+                self._stats['failed_operations'] += 1
+                op.future.set_exception(error)
+            else:
+                op.future.set_result(result)
+
+        with self._pending_cond:
+            self._pending -= len(batch)
+            self._pending_cond.notify_all()
@@ -0,0 +1,156 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# Колонки локальной таблицы deals (order хранится как order_id - ORDER зарезервировано в SQL)
+DEAL_COLUMNS = ('ticket', 'order_id', 'time', 'time_msc', 'type', 'entry', 'magic', 'position_id', 'reason',
+                'volume', 'price', 'commission', 'swap', 'profit', 'fee', 'symbol', 'comment')
+
+DEALS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS deals (
+        ticket INTEGER PRIMARY KEY,
+        order_id INTEGER,
+        time INTEGER NOT NULL,
+        time_msc INTEGER,
+        type INTEGER,
+        entry INTEGER,
+        magic INTEGER,
+        position_id INTEGER,
+        reason INTEGER,
+        volume REAL,
+        price REAL,
+        commission REAL,
+        swap REAL,
+        profit REAL,
+        fee REAL,
+        symbol TEXT,
+        comment TEXT
+    )
+'''
+
+DEALS_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS idx_deals_time ON deals(time)",
+    "CREATE INDEX IF NOT EXISTS idx_deals_position ON deals(position_id)",
+)
+
+INSERT_DEAL_SQL = f"INSERT OR IGNORE INTO deals ({', '.join(DEAL_COLUMNS)}) VALUES ({', '.join('?' * len(DEAL_COLUMNS))})"
+
+DealCallback = Callable[[List[Dict[str, Any]]], None]
+
+
+def normalize_deal(deal: Any) -> Dict[str, Any]:
+    """Сделка MT5 (TradeDeal) или словарь Flask API -> словарь с колонками DEAL_COLUMNS"""
+    if isinstance(deal, dict):
+        data = deal
+    elif hasattr(deal, '_asdict'):
+        data = deal._asdict()
+    else:
+        data = dict(vars(deal))
+    record = {column: data.get(column) for column in DEAL_COLUMNS}
+    if record['order_id'] is None:
+        record['order_id'] = data.get('order')
+    return record
+
+
+def deal_row(deal: Dict[str, Any]) -> tuple:
+    """Кортеж параметров для INSERT_DEAL_SQL"""
+    return tuple(deal.get(column) for column in DEAL_COLUMNS)
+
+
+class DealFeed:
+    """
+    Инкрементальная лента сделок MT5.
+
+    Запоминает последний увиденный тикет и время сделки и при каждом poll()
+    запрашивает историю только с этого момента (минус overlap_seconds на
+    расхождение часов терминала и сервера брокера), отбрасывая уже виденные
+    тикеты. Новые сделки сохраняются в локальную таблицу deals (store) и
+    рассылаются подписчикам, поэтому объём запросов не растёт в течение дня.
+    После перезапуска курсор восстанавливается из store.
+
+    fetch_since(date_from) - функция MT5Service.get_deals_since;
+    store - объект с save_deals(deals) и get_last_deal() -> (ticket, time) или None.
+    """
+
+    def __init__(self, fetch_since: Callable[[datetime], Optional[Iterable[Any]]], store=None,
+                 bootstrap_days: int = 1, overlap_seconds: int = 3 * 3600):
+        self.fetch_since = fetch_since
+        self.store = store
+        self.bootstrap_days = bootstrap_days
+        self.overlap_seconds = overlap_seconds
+
+        self._lock = threading.Lock()
+        self._last_ticket: Optional[int] = None
+        self._last_time: Optional[int] = None
+        self._restored = False
+        self._subscribers: List[DealCallback] = []
+        self._stats = {'polls': 0, 'errors': 0, 'fetched': 0, 'new_deals': 0}
+
+    def _restore(self):
+        self._restored = True
+        if self.store is None:
+            return
+        last = self.store.get_last_deal()
+        if last:
+            self._last_ticket, self._last_time = int(last[0]), int(last[1])
+
+    def _date_from(self) -> datetime:
+        if self._last_time is None:
+            return datetime.now(timezone.utc) - timedelta(days=self.bootstrap_days)
+        return datetime.fromtimestamp(self._last_time - self.overlap_seconds, tz=timezone.utc)
+
+    @property
+    def cursor(self):
+        """(последний тикет, время последней сделки)"""
+        return self._last_ticket, self._last_time
+
+    def subscribe(self, callback: DealCallback) -> Callable[[], None]:
+        """Подписка на новые сделки; возвращает функцию отписки"""
+        self._subscribers.append(callback)
+
+        def unsubscribe():
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+        return unsubscribe
+
+    def poll(self) -> List[Dict[str, Any]]:
+        """Запрашивает сделки новее курсора; возвращает только новые (по возрастанию тикета)"""
+        with self._lock:
+            if not self._restored:
+                self._restore()
+            self._stats['polls'] += 1
+            try:
+                raw = self.fetch_since(self._date_from())
+            except Exception as e:
+                print(f"--- [DEALS] Fetch error: {e} ---")
+                raw = None
+            if raw is None:
+                self._stats['errors'] += 1
+                return []
+
+            deals = [normalize_deal(d) for d in raw]
+            self._stats['fetched'] += len(deals)
+            last_ticket = self._last_ticket or 0
+            new_deals = sorted((d for d in deals if d['ticket'] is not None and d['ticket'] > last_ticket),
+                               key=lambda d: d['ticket'])
+            if not new_deals:
+                return []
+            if self.store is not None:
+                self.store.save_deals(new_deals)
+            self._last_ticket = new_deals[-1]['ticket']
+            self._last_time = max(self._last_time or 0, max(d['time'] or 0 for d in new_deals))
+            self._stats['new_deals'] += len(new_deals)
+
+        for callback in list(self._subscribers):
+            try:
+                callback(new_deals)
+            except Exception as e:
+                print(f"--- [DEALS] Subscriber error: {e} ---")
+        return new_deals
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счётчики опросов, полученных и новых сделок"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['last_ticket'], stats['last_time'] = self.cursor
+        return stats
@@ -0,0 +1,218 @@
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence, Tuple
+
+# Уровни логов, которые используются в проекте (SUCCESS - между INFO и WARNING)
+LOG_LEVELS = {
+    'DEBUG': 10,
+    'INFO': 20,
+    'SUCCESS': 25,
+    'WARNING': 30,
+    'ERROR': 40,
+    'CRITICAL': 50,
+}
+
+# Запись лога: (seq, timestamp, level, source, message)
+LogRecord = Tuple[int, str, str, Optional[str], str]
+
+
+def level_value(level: str) -> int:
+    """Числовое значение уровня (неизвестные уровни считаются INFO)"""
+    return LOG_LEVELS.get(str(level).upper(), LOG_LEVELS['INFO'])
+
+
+class JsonlFileSink:
+    """Запись логов в JSONL-файл с ротацией по размеру (app.jsonl -> app.jsonl.1 -> ...)"""
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def write(self, records: Sequence[LogRecord]):
+        lines = "".join(
+            json.dumps({'seq': seq, 'timestamp': ts, 'level': level, 'source': source, 'message': message},
+                       ensure_ascii=False) + "\n"
+            for seq, ts, level, source, message in records
+        )
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+            size = f.tell()
+        if size >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            return
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+class LogSink:
+    """
+    Неблокирующий конвейер логов.
+
+    emit() только кладёт запись в кольцевой буфер и очередь на запись - без
+    обращения к диску, поэтому не добавляет задержки торговой логике. Фоновый
+    поток раз в flush_interval секунд (или при накоплении batch_size записей)
+    отдаёт пачку в flush_callback (например, один executemany в таблицу logs)
+    и, если задан, дописывает её в JSONL-файл. recent() читает последние записи
+    прямо из кольцевого буфера.
+    """
+
+    def __init__(self, flush_callback: Optional[Callable[[List[LogRecord]], None]] = None,
+                 capacity: int = 5000, min_level: str = 'INFO', flush_interval: float = 1.0,
+                 batch_size: int = 500, max_pending: int = 100_000, jsonl_path: Optional[str] = None,
+                 jsonl_max_bytes: int = 10 * 1024 * 1024, jsonl_backup_count: int = 5, echo: bool = False,
+                 time_format: str = '%Y-%m-%d %H:%M:%S'):
+        self.flush_callback = flush_callback
+        self.capacity = capacity
+        self.min_level = level_value(min_level)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.echo = echo
+        self.time_format = time_format
+        self.file_sink = JsonlFileSink(jsonl_path, jsonl_max_bytes, jsonl_backup_count) if jsonl_path else None
+
+        self._ring: deque = deque(maxlen=capacity)
+        self._pending: deque = deque(maxlen=max_pending)
+        # Пачки, которые не удалось записать в flush_callback (в файл они уже попали) - повторяются первыми
+        self._retry: deque = deque()
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._seq = 0
+        self._dropped = 0
+        self._errors = 0
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+        self._thread.start()
+
+    # ----- Запись -----
+    def emit(self, level: str, message: str, source: Optional[str] = None) -> Optional[LogRecord]:
+        """Добавляет запись; записи ниже min_level отбрасываются"""
+        level = str(level).upper()
+        if level_value(level) < self.min_level:
+            return None
+        timestamp = datetime.now().strftime(self.time_format)
+        with self._lock:
+            self._seq += 1
+            record = (self._seq, timestamp, level, source, str(message))
+            self._ring.append(record)
+            if len(self._pending) == self._pending.maxlen:
+                self._dropped += 1
+            self._pending.append(record)
+            pending = len(self._pending)
+        if pending >= self.batch_size:
+            self._wakeup.set()
+        return record
+
+    def preload(self, records: Sequence[LogRecord]):
+        """Заполняет кольцевой буфер уже сохранёнными записями (от старых к новым)"""
+        with self._lock:
+            for record in records:
+                self._ring.append(tuple(record))
+                self._seq = max(self._seq, record[0])
+
+    @property
+    def is_full(self) -> bool:
+        """Буфер заполнен - более старые записи есть только на диске"""
+        return len(self._ring) == self._ring.maxlen
+
+    # ----- Чтение -----
+    def recent(self, limit: int = 100, level: Optional[str] = None, source: Optional[str] = None) -> List[LogRecord]:
+        """Последние записи из памяти, от новых к старым"""
+        with self._lock:
+            snapshot = list(self._ring)
+        result = []
+        wanted_level = str(level).upper() if level else None
+        for record in reversed(snapshot):
+            if wanted_level and record[2] != wanted_level:
+                continue
+            if source and record[3] != source:
+                continue
+            result.append(record)
+            if len(result) >= limit:
+                break
+        return result
+
+    def get_stats(self):
+        """Размер буфера, очередь на запись, потерянные записи и ошибки сброса"""
+        with self._lock:
+            return {'buffered': len(self._ring), 'pending': len(self._pending) + len(self._retry),
+                    'dropped': self._dropped, 'flush_errors': self._errors, 'last_seq': self._seq}
+
+    # ----- Сброс -----
+    def flush(self) -> bool:
+        """
+        Синхронно сбрасывает все накопленные записи. При ошибке flush_callback
+        пачка остаётся в очереди повтора и уходит первой при следующем сбросе;
+        возвращает False, если что-то осталось несохранённым.
+        """
+        with self._flush_lock:
+            with self._lock:
+                retry = list(self._retry)
+                self._retry.clear()
+            if retry and not self._deliver(retry):
+                return False
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        return True
+                    batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                self._write_file(batch)
+                if not self._deliver(batch):
+                    return False
+
+    def _write_file(self, batch: List[LogRecord]):
+        if self.echo:
+            for _, ts, level, source, message in batch:
+                print(f"[{ts}] {level}{f' [{source}]' if source else ''}: {message}")
+        if self.file_sink:
+            # Файл пишется независимо от базы: недоступная таблица не теряет записи в JSONL
+            try:
+                self.file_sink.write(batch)
+            except Exception as e:
+                self._errors += 1
+                print(f"--- [LOG SINK] File sink error: {e} ---")
+
+    def _deliver(self, batch: List[LogRecord]) -> bool:
+        if not self.flush_callback:
+            return True
+        try:
+            self.flush_callback(batch)
+            return True
+        except Exception as e:
+            with self._lock:
+                self._errors += 1
+                self._retry.extendleft(reversed(batch))
+                # Очередь повтора ограничена так же, как основная: отбрасываются самые старые записи
+                while len(self._retry) > self.max_pending:
+                    self._retry.popleft()
+                    self._dropped += 1
+            print(f"--- [LOG SINK] Flush error (batch of {len(batch)} kept for retry): {e} ---")
+            return False
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """Останавливает фоновый поток и сбрасывает остаток"""
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self.flush()
@@ -0,0 +1,206 @@
+import struct
+import zlib
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Колоночный формат баров: заголовок + колонки little-endian подряд
+#   magic b'RTS1' | uint32 число баров | uint32 флаги (бит 0 - zlib) | колонки RATES_COLUMNS
+RATES_MEDIA_TYPE = 'application/x-mt5-rates'
+ARROW_MEDIA_TYPE = 'application/vnd.apache.arrow.stream'
+JSON_MEDIA_TYPE = 'application/json'
+# Поток кадров: uint32 длина | кадр encode_rates; кадр нулевой длины - конец потока
+RATES_STREAM_MEDIA_TYPE = 'application/x-mt5-rates-stream'
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+RATES_COLUMNS = (
+    ('time', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('tick_volume', '<i8'),
+    ('spread', '<i4'),
+    ('real_volume', '<i8'),
+)
+RATES_DTYPE = np.dtype(list(RATES_COLUMNS))
+
+_MAGIC = b'RTS1'
+_HEADER = struct.Struct('<4sII')
+_FRAME = struct.Struct('<I')
+FLAG_ZLIB = 1
+
+
+def to_rates_array(rates: Any) -> np.ndarray:
+    """Бары MT5 (структурированный массив copy_rates_*), список словарей или DataFrame -> массив RATES_DTYPE"""
+    if isinstance(rates, np.ndarray) and rates.dtype.names:
+        out = np.zeros(len(rates), dtype=RATES_DTYPE)
+        for name, _ in RATES_COLUMNS:
+            if name in rates.dtype.names:
+                out[name] = rates[name]
+        return out
+    if hasattr(rates, 'to_dict') and hasattr(rates, 'columns'):
+        out = np.zeros(len(rates), dtype=RATES_DTYPE)
+        for name, _ in RATES_COLUMNS:
+            if name not in rates.columns:
+                continue
+            values = rates[name].to_numpy()
+            if name == 'time' and np.issubdtype(values.dtype, np.datetime64):
+                values = values.astype('datetime64[s]').astype('int64')
+            out[name] = values
+        return out
+    rates = list(rates or [])
+    out = np.zeros(len(rates), dtype=RATES_DTYPE)
+    for name, _ in RATES_COLUMNS:
+        values = [r.get(name, 0) for r in rates]
+        if name == 'time':
+            values = [_epoch(v) for v in values]
+        out[name] = values
+    return out
+
+
+def columns_to_array(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """Колонки decode_rates -> структурированный массив, как у copy_rates_*"""
+    count = len(columns['time']) if 'time' in columns else 0
+    out = np.zeros(count, dtype=RATES_DTYPE)
+    for name, _ in RATES_COLUMNS:
+        if name in columns:
+            out[name] = columns[name]
+    return out
+
+
+def _epoch(value: Any) -> int:
+    if hasattr(value, 'timestamp'):
+        return int(value.timestamp())
+    if isinstance(value, str):
+        from datetime import datetime
+        return int(datetime.fromisoformat(value).timestamp())
+    return int(value)
+
+
+def encode_rates(rates: Any, compress: bool = False) -> bytes:
+    """Кодирует бары в колоночный бинарный формат (опционально со сжатием zlib)"""
+    array = to_rates_array(rates)
+    body = b''.join(np.ascontiguousarray(array[name]).astype(dtype, copy=False).tobytes() for name, dtype in RATES_COLUMNS)
+    flags = 0
+    if compress:
+        body = zlib.compress(body, 1)
+        flags |= FLAG_ZLIB
+    return _HEADER.pack(_MAGIC, len(array), flags) + body
+
+
+def decode_rates(payload: bytes) -> Dict[str, np.ndarray]:
+    """
+    Декодирует бинарные бары в словарь колонок numpy.
+
+    Без сжатия колонки - представления np.frombuffer над исходным буфером
+    (без копирования); массивы только для чтения.
+    """
+    magic, count, flags = _HEADER.unpack_from(payload, 0)
+    if magic != _MAGIC:
+        raise ValueError("Not an MT5 rates payload")
+    body = memoryview(payload)[_HEADER.size:]
+    if flags & FLAG_ZLIB:
+        body = memoryview(zlib.decompress(body))
+    columns, offset = {}, 0
+    for name, dtype in RATES_COLUMNS:
+        column = np.frombuffer(body, dtype=dtype, count=count, offset=offset)
+        columns[name] = column
+        offset += column.nbytes
+    return columns
+
+
+def encode_rates_arrow(rates: Any) -> bytes:
+    """Бары в формате Arrow IPC stream (нужен pyarrow)"""
+    if not PYARROW_AVAILABLE:
+        raise ImportError("pyarrow не установлен")
+    array = to_rates_array(rates)
+    table = pa.table({name: array[name] for name, _ in RATES_COLUMNS})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def decode_rates_arrow(payload: bytes) -> Dict[str, np.ndarray]:
+    if not PYARROW_AVAILABLE:
+        raise ImportError("pyarrow не установлен")
+    table = pa.ipc.open_stream(pa.py_buffer(payload)).read_all()
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+
+def rates_to_dataframe(columns: Dict[str, np.ndarray]):
+    """Колонки баров -> DataFrame с колонкой time в datetime (как в MT5Service.get_rates)"""
+    import pandas as pd
+    df = pd.DataFrame(columns, copy=False)
+    df['time'] = pd.to_datetime(df['time'], unit='s')
+    return df
+
+
+def negotiate(accept: Optional[str], available: Iterable[str] = (RATES_MEDIA_TYPE, ARROW_MEDIA_TYPE, JSON_MEDIA_TYPE),
+              default: str = JSON_MEDIA_TYPE) -> str:
+    """Выбирает формат ответа по заголовку Accept (q-веса учитываются, иначе default)"""
+    available = [m for m in available if m != ARROW_MEDIA_TYPE or PYARROW_AVAILABLE]
+    best, best_q = default, 0.0
+    for part in (accept or '').split(','):
+        media, _, params = part.strip().partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media.strip() in available and q > best_q:
+            best, best_q = media.strip(), q
+    return best
+
+
+def decode_response(content_type: str, payload: bytes) -> Optional[Dict[str, np.ndarray]]:
+    """Колонки из тела ответа по Content-Type; None - ответ в JSON"""
+    media = (content_type or '').split(';')[0].strip()
+    if media == RATES_MEDIA_TYPE:
+        return decode_rates(payload)
+    if media == ARROW_MEDIA_TYPE:
+        return decode_rates_arrow(payload)
+    return None
+
+
+def encode_frame(rates: Any, compress: bool = False) -> bytes:
+    """Кадр потока: длина + закодированный блок баров"""
+    payload = encode_rates(rates, compress)
+    return _FRAME.pack(len(payload)) + payload
+
+
+def end_frame() -> bytes:
+    """Завершающий кадр потока (отличает полный ответ от оборванного)"""
+    return _FRAME.pack(0)
+
+
+def iter_frames(chunks: Iterable[bytes]) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Собирает кадры из произвольно нарезанных кусков ответа и отдаёт колонки
+    по мере поступления. В памяти держится не больше одного кадра.
+    Обрыв потока до завершающего кадра - ConnectionError.
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= _FRAME.size:
+            (size,) = _FRAME.unpack_from(buffer, 0)
+            if size == 0:
+                return
+            if len(buffer) < _FRAME.size + size:
+                break
+            # bytes() копирует кадр, чтобы колонки не ссылались на изменяемый буфер
+            frame = bytes(buffer[_FRAME.size:_FRAME.size + size])
+            del buffer[:_FRAME.size + size]
+            yield decode_rates(frame)
+    raise ConnectionError("Поток баров оборвался до завершающего кадра")
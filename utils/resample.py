@@ -0,0 +1,207 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from utils.bar_store import TIMEFRAME_SECONDS
+from utils.rates_codec import RATES_DTYPE, to_rates_array
+
+DAY_SECONDS = 86400
+# 1970-01-01 - четверг: сдвиг до понедельника для номера дня недели
+_EPOCH_WEEKDAY = 3
+
+
+def bucket_starts(times: np.ndarray, timeframe: str, day_offset: int = 0, merge_weekend: bool = True) -> np.ndarray:
+    """
+    Начало бара таймфрейма для каждого времени (секунды, время сервера MT5).
+
+    Внутридневные бары выравниваются от начала суток (H4 - 00:00, 04:00, ...),
+    day_offset сдвигает границу суток (секунды). D1 при merge_weekend
+    относит бары субботы и воскресенья (ранняя воскресная сессия) к понедельнику,
+    чтобы не появлялось коротких "выходных" дневных свечей.
+    """
+    step = TIMEFRAME_SECONDS[timeframe]
+    shifted = times.astype(np.int64) - day_offset
+    starts = shifted // step * step
+    if timeframe == "D1" and merge_weekend:
+        weekday = (starts // DAY_SECONDS + _EPOCH_WEEKDAY) % 7
+        starts = starts + np.where(weekday >= 5, (7 - weekday) * DAY_SECONDS, 0)
+    return starts + day_offset
+
+
+def resample(rates, timeframe: str, base_timeframe: Optional[str] = None, day_offset: int = 0,
+             merge_weekend: bool = True) -> np.ndarray:
+    """
+    Агрегирует отсортированные бары в старший таймфрейм (массив RATES_DTYPE).
+
+    open - первого бара, close - последнего, high/low - экстремумы, объёмы
+    суммируются, spread - минимальный. Бар старшего таймфрейма не пересекает
+    границу сессии: пропуски (выходные, праздники) просто не дают баров.
+    """
+    rates = to_rates_array(rates)
+    if base_timeframe and TIMEFRAME_SECONDS[timeframe] % TIMEFRAME_SECONDS[base_timeframe]:
+        raise ValueError(f"{timeframe} нельзя собрать из {base_timeframe}")
+    if len(rates) == 0:
+        return np.zeros(0, dtype=RATES_DTYPE)
+    starts = bucket_starts(rates['time'], timeframe, day_offset, merge_weekend)
+    # Индексы первых баров каждой группы (starts не убывает для отсортированных баров)
+    first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+    last = np.r_[first[1:] - 1, len(rates) - 1]
+    out = np.zeros(len(first), dtype=RATES_DTYPE)
+    out['time'] = starts[first]
+    out['open'] = rates['open'][first]
+    out['close'] = rates['close'][last]
+    out['high'] = np.maximum.reduceat(rates['high'], first)
+    out['low'] = np.minimum.reduceat(rates['low'], first)
+    out['tick_volume'] = np.add.reduceat(rates['tick_volume'], first)
+    out['real_volume'] = np.add.reduceat(rates['real_volume'], first)
+    out['spread'] = np.minimum.reduceat(rates['spread'], first)
+    return out
+
+
+class TimeframeAggregator:
+    """
+    Инкрементальная сборка старших таймфреймов из одной базовой серии.
+
+    update() принимает новые базовые бары (последний может быть ещё
+    формирующимся - повторная передача бара с тем же временем заменяет его)
+    и возвращает закрывшиеся бары старших таймфреймов. В памяти держится
+    max_bars закрытых баров на таймфрейм и базовые бары текущих формирующихся
+    баров, так что обновление стоит O(баров в самом длинном формирующемся баре).
+    """
+
+    def __init__(self, base_timeframe: str, timeframes: Iterable[str], max_bars: int = 1000,
+                 day_offset: int = 0, merge_weekend: bool = True):
+        self.base_timeframe = base_timeframe
+        self.timeframes = [tf for tf in timeframes if tf != base_timeframe]
+        for tf in self.timeframes:
+            if TIMEFRAME_SECONDS[tf] % TIMEFRAME_SECONDS[base_timeframe]:
+                raise ValueError(f"{tf} нельзя собрать из {base_timeframe}")
+        self.max_bars = max_bars
+        self.day_offset = day_offset
+        self.merge_weekend = merge_weekend
+
+        self._base = np.zeros(0, dtype=RATES_DTYPE)
+        self._history = np.zeros(0, dtype=RATES_DTYPE)
+        self._closed: Dict[str, np.ndarray] = {tf: np.zeros(0, dtype=RATES_DTYPE) for tf in self.timeframes}
+        self._forming: Dict[str, Optional[np.ndarray]] = {tf: None for tf in self.timeframes}
+
+    @property
+    def last_time(self) -> Optional[int]:
+        """Время последнего базового бара"""
+        return int(self._base['time'][-1]) if len(self._base) else None
+
+    def update(self, rates) -> Dict[str, np.ndarray]:
+        """Добавляет базовые бары; возвращает {таймфрейм: новые закрытые бары}"""
+        rates = to_rates_array(rates)
+        last = self.last_time
+        if last is not None:
+            rates = rates[rates['time'] >= last]
+            # Бар с временем last пришёл заново (формировался) - заменяем
+            if len(rates) and rates['time'][0] == last:
+                self._base = self._base[:-1]
+                self._history = self._history[:-1]
+        if len(rates) == 0:
+            return {tf: np.zeros(0, dtype=RATES_DTYPE) for tf in self.timeframes}
+        self._base = np.concatenate([self._base, rates])
+        self._history = np.concatenate([self._history, rates])[-self.max_bars:]
+
+        closed_now = {}
+        keep = np.zeros(len(self._base), dtype=bool)
+        for tf in self.timeframes:
+            starts = bucket_starts(self._base['time'], tf, self.day_offset, self.merge_weekend)
+            bars = resample(self._base, tf, day_offset=self.day_offset, merge_weekend=self.merge_weekend)
+            last_closed = self._closed[tf]['time'][-1] if len(self._closed[tf]) else None
+            closed = bars[:-1] if last_closed is None else bars[:-1][bars['time'][:-1] > last_closed]
+            if len(closed):
+                self._closed[tf] = np.concatenate([self._closed[tf], closed])[-self.max_bars:]
+            self._forming[tf] = bars[-1:]
+            closed_now[tf] = closed
+            keep |= starts == bars['time'][-1]
+        # Базовые бары закрытых старших баров больше не нужны (по корзине, а не по времени:
+        # воскресные бары D1 относятся к понедельнику, хотя раньше его начала)
+        self._base = self._base[keep] if self.timeframes else self._base[-1:]
+        return closed_now
+
+    def get(self, timeframe: str, count: Optional[int] = None, include_forming: bool = True) -> np.ndarray:
+        """Последние count баров таймфрейма (формирующийся - последним)"""
+        if timeframe == self.base_timeframe:
+            bars = self._history
+        else:
+            bars = self._closed[timeframe]
+            forming = self._forming.get(timeframe)
+            if include_forming and forming is not None:
+                bars = np.concatenate([bars, forming])
+        return bars[-count:] if count else bars
+
+    def get_dataframe(self, timeframe: str, count: Optional[int] = None, include_forming: bool = True):
+        import pandas as pd
+        df = pd.DataFrame(self.get(timeframe, count, include_forming))
+        df['time'] = pd.to_datetime(df['time'], unit='s')
+        return df
+
+
+def base_bars_needed(timeframes: Iterable[str], base_timeframe: str, count: int) -> int:
+    """Сколько базовых баров нужно, чтобы у каждого таймфрейма было count баров"""
+    ratio = max((TIMEFRAME_SECONDS[tf] // TIMEFRAME_SECONDS[base_timeframe] for tf in timeframes), default=1)
+    return (count + 1) * max(1, ratio)
+
+
+def _fits(timeframe: str, base_timeframe: str, span_seconds: float, max_base_bars: int) -> bool:
+    step = TIMEFRAME_SECONDS[base_timeframe]
+    return TIMEFRAME_SECONDS[timeframe] % step == 0 and span_seconds // step <= max_base_bars
+
+
+def choose_base_timeframe(timeframe: str, base_timeframe: str, span_seconds: float, max_base_bars: int) -> str:
+    """
+    Из чего грузить span_seconds истории таймфрейма: base_timeframe, если он
+    делит таймфрейм и его баров за этот период не больше max_base_bars,
+    иначе сам таймфрейм (D1 за год не тянет сотни тысяч M1).
+    """
+    return base_timeframe if _fits(timeframe, base_timeframe, span_seconds, max_base_bars) else timeframe
+
+
+def plan_base_timeframes(timeframes: Iterable[str], base_timeframe: str, count: int,
+                         max_base_bars: int) -> Dict[str, List[str]]:
+    """
+    Группы {базовый таймфрейм: таймфреймы из него} для count баров каждого.
+
+    Таймфрейм собирается из уже выбранной базы (первая - base_timeframe), если
+    для count его баров хватает max_base_bars базовых; иначе он грузится сам
+    и становится базой для следующих (H4 и D1 при M1 -> M1: [..., H4], D1: [D1]).
+    """
+    groups: Dict[str, List[str]] = {}
+    bases = [base_timeframe]
+    for tf in sorted(set(timeframes), key=TIMEFRAME_SECONDS.__getitem__):
+        span = (count + 1) * TIMEFRAME_SECONDS[tf]
+        base = next((b for b in bases if _fits(tf, b, span, max_base_bars)), tf)
+        if base not in bases:
+            bases.append(base)
+        groups.setdefault(base, []).append(tf)
+    return groups
+
+
+def _epoch(value: Union[int, float, datetime]) -> int:
+    if isinstance(value, datetime):
+        # Naive datetime - UTC, как у copy_rates_range
+        return int((value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp())
+    return int(value)
+
+
+def range_fetch_end(end: datetime, timeframe: str, base_timeframe: str) -> datetime:
+    """Конец загрузки базовых баров, чтобы последний бар таймфрейма до end был полным"""
+    return end + timedelta(seconds=TIMEFRAME_SECONDS[timeframe] - TIMEFRAME_SECONDS[base_timeframe])
+
+
+def resample_range(rates, timeframe: str, base_timeframe: str, start: Union[int, datetime],
+                   end: Union[int, datetime], day_offset: int = 0, merge_weekend: bool = True) -> np.ndarray:
+    """
+    Бары таймфрейма, открывшиеся в [start, end], из базовых баров
+    (загруженных до range_fetch_end) - как copy_rates_range старшего таймфрейма.
+    """
+    if timeframe == base_timeframe:
+        rates = to_rates_array(rates)
+    else:
+        rates = resample(rates, timeframe, base_timeframe, day_offset, merge_weekend)
+    times = rates['time']
+    return rates[(times >= _epoch(start)) & (times <= _epoch(end))]
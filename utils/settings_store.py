@@ -0,0 +1,184 @@
+import copy
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Настройки: {категория: {ключ: значение}}
+Settings = Dict[str, Dict[str, Any]]
+SettingsCallback = Callable[[Settings], None]
+
+
+class JsonSettingsBackend:
+    """Хранение настроек в JSON-файле; запись атомарная (временный файл + os.replace)"""
+
+    def __init__(self, path: str, defaults: Optional[Settings] = None):
+        self.path = path
+        self.defaults = defaults or {}
+
+    def load(self) -> Settings:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not os.path.exists(self.path):
+            self.save(copy.deepcopy(self.defaults), self.defaults)
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, settings: Settings, changes: Settings):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(settings, f, indent=4, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class SQLiteSettingsBackend:
+    """Хранение настроек в таблице settings (category, key, value JSON); запись - одна транзакция"""
+
+    def __init__(self, db):
+        # db - utils.db_connection.SQLiteConnectionManager
+        self.db = db
+
+    def load(self) -> Settings:
+        settings: Settings = {}
+        for category, key, value in self.db.fetchall("SELECT category, key, value FROM settings"):
+            try:
+                settings.setdefault(category, {})[key] = json.loads(value)
+            except (TypeError, ValueError):
+                settings.setdefault(category, {})[key] = value
+        return settings
+
+    def save(self, settings: Settings, changes: Settings):
+        now = datetime.now()
+        self.db.executemany_write('''
+            INSERT INTO settings (category, key, value, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(category, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+        ''', [(category, key, json.dumps(value), now) for category, values in changes.items() for key, value in values.items()])
+
+
+class SettingsStore:
+    """
+    Кэш настроек в памяти со сквозной записью и уведомлениями.
+
+    Настройки читаются из хранилища один раз, дальше get()/get_all() отдают их
+    из памяти. update() сначала атомарно пишет изменения в хранилище и только
+    потом меняет состояние в памяти, после чего вызывает подписчиков с
+    изменившимися значениями {категория: {ключ: значение}} - сервисам не нужно
+    перечитывать файл или пересоздаваться.
+
+    Если файл настроек не читается (битый JSON), стор стартует со значениями
+    по умолчанию, а ошибка остаётся в load_error - вызывающий показывает её сам.
+    """
+
+    _shared: Dict[str, "SettingsStore"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.RLock()
+        self.load_error: Optional[Exception] = None
+        try:
+            self._settings: Settings = backend.load()
+        except (OSError, ValueError) as e:
+            # Как прежние _load_config: приложение запускается, файл перезапишется при сохранении настроек
+            self.load_error = e
+            self._settings = copy.deepcopy(getattr(backend, 'defaults', {}))
+        self._subscribers: List[Tuple[Optional[str], SettingsCallback]] = []
+
+    @classmethod
+    def shared_json(cls, path: str, defaults: Optional[Settings] = None) -> "SettingsStore":
+        """Общий на процесс экземпляр для JSON-файла (все окна и сервисы видят одни настройки)"""
+        key = os.path.abspath(path)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(JsonSettingsBackend(path, defaults))
+            return cls._shared[key]
+
+    # ----- Чтение -----
+    def get(self, category: str, key: Optional[str] = None, default: Any = None) -> Any:
+        """Значение настройки (или вся категория, если key не указан)"""
+        with self._lock:
+            values = self._settings.get(category)
+            if key is None:
+                return copy.deepcopy(values) if values is not None else default
+            if not isinstance(values, dict) or key not in values:
+                return default
+            return copy.deepcopy(values[key])
+
+    def get_all(self, category: Optional[str] = None) -> Settings:
+        """Копия всех настроек или одной категории в виде {категория: {...}}"""
+        with self._lock:
+            if category is not None:
+                return {category: copy.deepcopy(self._settings[category])} if category in self._settings else {}
+            return copy.deepcopy(self._settings)
+
+    # ----- Запись -----
+    def set(self, category: str, key: str, value: Any) -> bool:
+        """Сохраняет одну настройку, возвращает True если значение изменилось"""
+        return bool(self.update({category: {key: value}}))
+
+    def update(self, changes: Settings) -> Settings:
+        """Сохраняет пачку настроек одной записью, возвращает реально изменившиеся значения"""
+        with self._lock:
+            changed: Settings = {}
+            for category, values in changes.items():
+                current = self._settings.get(category)
+                current = current if isinstance(current, dict) else {}
+                for key, value in values.items():
+                    if key not in current or current[key] != value:
+                        changed.setdefault(category, {})[key] = copy.deepcopy(value)
+            if not changed:
+                return {}
+            new_settings = dict(self._settings)
+            for category, values in changed.items():
+                current = new_settings.get(category)
+                new_settings[category] = {**(current if isinstance(current, dict) else {}), **values}
+            # Сначала хранилище: при ошибке состояние в памяти не меняется
+            self.backend.save(new_settings, changed)
+            self._settings = new_settings
+        self._publish(changed)
+        return changed
+
+    def reload(self) -> Settings:
+        """Перечитывает хранилище (например, после ручной правки файла) и уведомляет об отличиях"""
+        with self._lock:
+            fresh = self.backend.load()
+            changed: Settings = {}
+            for category, values in fresh.items():
+                current = self._settings.get(category)
+                if not isinstance(values, dict):
+                    continue
+                for key, value in values.items():
+                    if not isinstance(current, dict) or current.get(key) != value:
+                        changed.setdefault(category, {})[key] = value
+            self._settings = fresh
+        if changed:
+            self._publish(changed)
+        return changed
+
+    # ----- Подписки -----
+    def subscribe(self, callback: SettingsCallback, category: Optional[str] = None) -> Callable[[], None]:
+        """Подписка на изменения (всех или одной категории); возвращает функцию отписки"""
+        entry = (category, callback)
+        with self._lock:
+            self._subscribers.append(entry)
+
+        def unsubscribe():
+            with self._lock:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+        return unsubscribe
+
+    def _publish(self, changed: Settings):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for category, callback in subscribers:
+            if category is not None and category not in changed:
+                continue
+            try:
+                callback({category: changed[category]} if category is not None else changed)
+            except Exception as e:
+                print(f"--- [SETTINGS] Subscriber error: {e} ---")
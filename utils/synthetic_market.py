@@ -0,0 +1,158 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+
+from utils.bar_store import TIMEFRAME_SECONDS
+from utils.rates_codec import RATES_DTYPE
+
+YEAR_SECONDS = 365 * 86400
+WEEK_SECONDS = 7 * 86400
+# Первый понедельник эпохи (1970-01-05) - начало торговой недели
+MONDAY_EPOCH = 4 * 86400
+
+# Цена, точность, годовая волатильность и типичный спред (пункты) по символам
+SYMBOL_PROFILES: Dict[str, Dict[str, Any]] = {
+    "XAUUSD": {"price": 2650.0, "digits": 2, "volatility": 0.16, "spread": 25},
+    "EURUSD": {"price": 1.1000, "digits": 5, "volatility": 0.07, "spread": 10},
+    "GBPUSD": {"price": 1.2700, "digits": 5, "volatility": 0.08, "spread": 14},
+    "USDJPY": {"price": 150.00, "digits": 3, "volatility": 0.09, "spread": 12},
+    "AUDUSD": {"price": 0.6600, "digits": 5, "volatility": 0.09, "spread": 12},
+    "USDCAD": {"price": 1.3600, "digits": 5, "volatility": 0.06, "spread": 16},
+}
+DEFAULT_PROFILE = {"price": 1.0000, "digits": 5, "volatility": 0.08, "spread": 15}
+
+# Множители волатильности и спреда по часам UTC: Азия, Лондон, пересечение с Нью-Йорком, Нью-Йорк, роловер
+SESSION_VOLATILITY = np.array([0.6] * 7 + [1.2] * 5 + [1.5] * 4 + [1.0] * 5 + [0.5] * 3)
+SESSION_SPREAD = np.array([1.3] * 7 + [1.0] * 5 + [0.9] * 4 + [1.0] * 5 + [2.5] * 3)
+
+# Режимы для model="regime": множители волатильности, их доли и вероятность смены режима на баре
+REGIMES = np.array([0.7, 1.0, 2.2])
+REGIME_WEIGHTS = [0.3, 0.55, 0.15]
+REGIME_SWITCH_PROB = 0.01
+
+
+def symbol_profile(symbol: str) -> Dict[str, Any]:
+    profile = SYMBOL_PROFILES.get(symbol)
+    if profile is None:
+        digits = 2 if "XAU" in symbol else 3 if "JPY" in symbol else 5
+        profile = dict(DEFAULT_PROFILE, digits=digits)
+    return profile
+
+
+def trading_times(start: int, count: Optional[int], end: Optional[int], step: int, skip_weekends: bool = True) -> np.ndarray:
+    """
+    Время открытия баров с шагом step: count баров от start или все до end.
+    Пропускается форекс-выходной - с пятницы 22:00 до воскресенья 22:00 UTC.
+    """
+    start = -(-start // step) * step
+    if not skip_weekends:
+        stop = start + count * step if end is None else int(end) + 1
+        return np.arange(start, stop, step, dtype=np.int64)[:count]
+    # Торговые смещения одной недели (от понедельника 00:00), размноженные на нужное число недель
+    offsets = np.arange(0, WEEK_SECONDS, step, dtype=np.int64)
+    weekday, hour = offsets // 86400, offsets % 86400 // 3600
+    offsets = offsets[~((weekday == 5) | ((weekday == 4) & (hour >= 22)) | ((weekday == 6) & (hour < 22)))]
+    first_week = (start - MONDAY_EPOCH) // WEEK_SECONDS * WEEK_SECONDS + MONDAY_EPOCH
+    if end is None:
+        weeks = count // len(offsets) + 2
+    else:
+        weeks = (int(end) - first_week) // WEEK_SECONDS + 1
+    times = (first_week + np.arange(weeks, dtype=np.int64) * WEEK_SECONDS)[:, None] + offsets
+    times = times.ravel()
+    times = times[np.searchsorted(times, start):]
+    if end is not None:
+        times = times[:np.searchsorted(times, int(end), side="right")]
+    return times[:count] if count is not None else times
+
+
+def _epoch(value: Union[None, int, float, datetime]) -> Optional[int]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return int((value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp())
+    return int(value)
+
+
+def generate_bars(symbol: str, timeframe: str = "M1", count: Optional[int] = None,
+                  start: Union[None, int, datetime] = None, end: Union[None, int, datetime] = None,
+                  seed: Union[None, int, np.random.Generator] = None, model: str = "regime",
+                  price: Optional[float] = None, skip_weekends: bool = True) -> np.ndarray:
+    """
+    Синтетические бары (массив RATES_DTYPE) без циклов по барам.
+
+    Лог-доходности - GBM с волатильностью символа, умноженной на сессионный
+    профиль часа и (model="regime") на марковский режим спокойный/обычный/
+    волатильный. open бара = close предыдущего; high/low выбираются из
+    распределения максимума/минимума броуновского моста между open и close,
+    поэтому low <= min(open, close) <= max(open, close) <= high всегда.
+    Спред зависит от сессии и режима, тиковый объём - от размера движения.
+
+    Диапазон задаётся count от start (или до end, если start не задан) либо
+    парой start/end. seed - число или np.random.Generator для продолжения
+    одной последовательности между вызовами.
+    """
+    step = TIMEFRAME_SECONDS[timeframe]
+    profile = symbol_profile(symbol)
+    rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+    start, end = _epoch(start), _epoch(end)
+    if end is None and (start is None or count is None):
+        end = int(datetime.now(timezone.utc).timestamp())
+    if start is None:
+        if count is None:
+            raise ValueError("Нужен count или start")
+        # Берём с запасом и оставляем последние count баров до end
+        span = int(count * step * 1.5) + 3 * 86400
+        times = trading_times(end - span, None, end, step, skip_weekends)[-count:]
+    else:
+        times = trading_times(start, count, end, step, skip_weekends)
+    n = len(times)
+    rates = np.zeros(n, dtype=RATES_DTYPE)
+    if n == 0:
+        return rates
+
+    hours = times % 86400 // 3600
+    sigma = profile["volatility"] * np.sqrt(step / YEAR_SECONDS) * SESSION_VOLATILITY[hours]
+    spread_factor = SESSION_SPREAD[hours]
+    if model == "regime":
+        # Смена режима - редкое событие: номера режимов по отрезкам между переключениями
+        segment = np.cumsum(rng.random(n) < REGIME_SWITCH_PROB)
+        segment_regime = rng.choice(len(REGIMES), size=segment[-1] + 1, p=REGIME_WEIGHTS)
+        regime_sigma = REGIMES[segment_regime[segment]]
+        sigma = sigma * regime_sigma
+        spread_factor = spread_factor * np.sqrt(regime_sigma)
+    elif model != "gbm":
+        raise ValueError(f"Неизвестная модель: {model}")
+
+    log_returns = rng.standard_normal(n) * sigma - 0.5 * sigma ** 2
+    log_close = np.log(price or profile["price"]) + np.cumsum(log_returns)
+    log_open = np.r_[log_close[0] - log_returns[0], log_close[:-1]]
+    # Максимум/минимум броуновского моста: (a + b + sqrt((b - a)^2 - 2 sigma^2 ln U)) / 2, -ln U ~ Exp(1)
+    mid = log_open + log_close
+    variance2 = 2 * sigma ** 2
+    diff_sq = log_returns ** 2
+    high_reach = np.sqrt(diff_sq + variance2 * rng.standard_exponential(n))
+    low_reach = np.sqrt(diff_sq + variance2 * rng.standard_exponential(n))
+
+    # Поля структурированного массива не непрерывны - считаем в отдельных массивах и пишем по разу
+    digits = profile["digits"]
+    close = np.round(np.exp(log_close), digits)
+    opens = np.r_[np.round(np.exp(log_open[0]), digits), close[:-1]]
+    rates['time'] = times
+    rates['open'] = opens
+    rates['close'] = close
+    rates['high'] = np.maximum(np.round(np.exp((mid + high_reach) / 2), digits), np.maximum(opens, close))
+    rates['low'] = np.minimum(np.round(np.exp((mid - low_reach) / 2), digits), np.minimum(opens, close))
+    rates['spread'] = np.maximum(1, np.round(profile["spread"] * spread_factor * rng.uniform(0.8, 1.2, n)))
+    # Тиковый объём растёт с активностью сессии и размахом бара (в сигмах)
+    activity = step / 60 * 20 * SESSION_VOLATILITY[hours] * (0.5 + (high_reach + low_reach) / (8 * sigma))
+    rates['tick_volume'] = np.maximum(1, np.rint(activity * rng.uniform(0.7, 1.3, n)))
+    return rates
+
+
+def generate_dataframe(symbol: str, timeframe: str = "M1", count: Optional[int] = None, **kwargs):
+    """generate_bars в виде DataFrame с колонкой time в datetime (как MT5Service.get_rates)"""
+    import pandas as pd
+    df = pd.DataFrame(generate_bars(symbol, timeframe, count, **kwargs))
+    df['time'] = pd.to_datetime(df['time'], unit='s')
+    return df
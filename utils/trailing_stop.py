@@ -0,0 +1,241 @@
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Изменение стопа: (тикет, новый sl, текущий tp)
+Change = Tuple[int, float, float]
+ModifyCallback = Callable[[List[Change]], Dict[int, Tuple[bool, str]]]
+
+# Правило по умолчанию (как в configs/goldhunter_config.json); доли - от расстояния entry -> TP
+DEFAULT_RULE = {
+    "trailing": True,
+    "break_even": True,
+    "trailing_activation": 0.5,
+    "break_even_threshold": 0.3,
+}
+
+
+def load_rule(path: str) -> Dict[str, Any]:
+    """Правило трейлинга из конфига канала (trading_logic.support_* и risk_management.*)"""
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    logic, risk = config.get("trading_logic", {}), config.get("risk_management", {})
+    return {
+        "trailing": bool(logic.get("support_trailing_stop", DEFAULT_RULE["trailing"])),
+        "break_even": bool(logic.get("support_break_even", DEFAULT_RULE["break_even"])),
+        "trailing_activation": float(risk.get("trailing_activation", DEFAULT_RULE["trailing_activation"])),
+        "break_even_threshold": float(risk.get("break_even_threshold", DEFAULT_RULE["break_even_threshold"])),
+    }
+
+
+def position_side(position: Dict[str, Any]) -> int:
+    """+1 для покупки, -1 для продажи (type - число MT5 или строка Flask API)"""
+    kind = position.get("type")
+    return 1 if kind in (0, "BUY", "buy") else -1
+
+
+class TrailingStopEngine:
+    """
+    Трейлинг-стоп и безубыток по тикам для всех открытых позиций.
+
+    Позиции хранятся колонками NumPy (вход, sl, tp, сторона, единица
+    расстояния, минимальный шаг), отсортированными по символу, так что
+    тик символа - это один векторный проход по его срезу. Единица - расстояние
+    от входа до TP (без TP - до исходного SL), запоминается при первом
+    появлении позиции. При прибыли >= break_even_threshold единиц стоп
+    переносится на вход, при >= trailing_activation - следует за ценой на
+    расстоянии trailing_activation единиц. Изменение отправляется, только если
+    стоп улучшается минимум на min_step_points пунктов.
+
+    Позиции обновляются из снимка счёта (sync), тики приходят через on_tick
+    (поток событий сервера) или собственный опрос (start). Пункт символа
+    берётся из symbol_point; пока он неизвестен, позиции символа не ведутся.
+    """
+
+    def __init__(self, rule: Optional[Dict[str, Any]] = None, modify: Optional[ModifyCallback] = None,
+                 min_step_points: float = 20, symbol_point: Optional[Callable[[str], Optional[float]]] = None,
+                 retry_delay: float = 5.0):
+        self.rule = dict(DEFAULT_RULE, **(rule or {}))
+        self.modify = modify
+        self.min_step_points = min_step_points
+        self.retry_delay = retry_delay
+        self.symbol_point = symbol_point
+
+        self._lock = threading.RLock()
+        self._units: Dict[int, float] = {}
+        self._holds: Dict[int, float] = {}
+        self._points: Dict[str, float] = {}
+        self._unknown_points = set()
+        self._slices: Dict[str, Tuple[int, int]] = {}
+        self._set_columns([])
+        self._stats = {'ticks': 0, 'evaluated': 0, 'changes': 0, 'rejected': 0, 'last_eval_us': 0.0}
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ----- Позиции -----
+    def _point(self, symbol: str) -> Optional[float]:
+        point = self._points.get(symbol)
+        if point is None:
+            point = self.symbol_point(symbol) if self.symbol_point else None
+            if not point:
+                # Без размера пункта стоп не выровнять - позиции символа не ведём, пока он не появится
+                if symbol not in self._unknown_points:
+                    self._unknown_points.add(symbol)
+                    print(f"--- [TRAILING] No point size for {symbol}, its positions are skipped ---")
+                return None
+            self._points[symbol] = point
+            self._unknown_points.discard(symbol)
+        return point
+
+    def _set_columns(self, rows: List[tuple]):
+        columns = list(zip(*rows)) if rows else [()] * 7
+        tickets, entry, sl, tp, side, unit, point = columns
+        self._tickets = np.array(tickets, dtype=np.int64)
+        self._entry = np.array(entry, dtype=np.float64)
+        self._sl = np.array(sl, dtype=np.float64)
+        self._tp = np.array(tp, dtype=np.float64)
+        self._side = np.array(side, dtype=np.float64)
+        self._unit = np.array(unit, dtype=np.float64)
+        self._point_arr = np.array(point, dtype=np.float64)
+        # Момент (monotonic), до которого тикет не трогаем после отказа брокера
+        self._hold = np.array([self._holds.get(t, 0.0) for t in tickets], dtype=np.float64)
+
+    def sync(self, positions: Iterable[Dict[str, Any]]):
+        """Пересборка колонок из снимка позиций (на открытие/закрытие/изменение, не на тик)"""
+        by_symbol: Dict[str, List[tuple]] = {}
+        seen = set()
+        for p in positions:
+            point = self._point(p["symbol"])
+            if point is None:
+                continue
+            ticket, entry = int(p["ticket"]), float(p["price_open"])
+            sl, tp = float(p.get("sl") or 0.0), float(p.get("tp") or 0.0)
+            unit = self._units.get(ticket)
+            if unit is None:
+                unit = abs(tp - entry) if tp else abs(entry - sl) if sl else 0.0
+                self._units[ticket] = unit
+            seen.add(ticket)
+            by_symbol.setdefault(p["symbol"], []).append(
+                (ticket, entry, sl, tp, position_side(p), unit, point))
+        with self._lock:
+            rows, slices = [], {}
+            for symbol, symbol_rows in by_symbol.items():
+                slices[symbol] = (len(rows), len(rows) + len(symbol_rows))
+                rows.extend(symbol_rows)
+            self._set_columns(rows)
+            self._slices = slices
+            self._units = {t: u for t, u in self._units.items() if t in seen}
+            self._holds = {t: h for t, h in self._holds.items() if t in seen}
+
+    @property
+    def symbols(self) -> List[str]:
+        """Символы с открытыми позициями - на их тики нужно подписаться"""
+        with self._lock:
+            return sorted(self._slices)
+
+    # ----- Тики -----
+    def _evaluate(self, lo: int, hi: int, bid: float, ask: float, now: float) -> Tuple[List[Change], Dict[int, float]]:
+        side, entry, unit, point = self._side[lo:hi], self._entry[lo:hi], self._unit[lo:hi], self._point_arr[lo:hi]
+        sl = self._sl[lo:hi]
+        # Всё считается в "пунктах в сторону прибыли" от входа: у покупки вверх, у продажи вниз
+        profit = (np.where(side > 0, bid, ask) - entry) * side
+        level = np.full(hi - lo, -np.inf)
+        active = unit > 0
+        if self.rule["break_even"]:
+            level[active & (profit >= self.rule["break_even_threshold"] * unit)] = 0.0
+        if self.rule["trailing"]:
+            distance = self.rule["trailing_activation"] * unit
+            trail = np.where(active & (profit >= distance), profit - distance, -np.inf)
+            np.maximum(level, trail, out=level)
+        # Стоп выравнивается по пункту в сторону от цены (допуск - погрешность деления float)
+        level = np.floor(level / point + 1e-6) * point
+        current = np.where(sl > 0, (sl - entry) * side, -np.inf)
+        with np.errstate(invalid="ignore"):
+            # -inf - (-inf) = nan: ни правило не сработало, ни стопа нет - не отправляем
+            improves = level - current >= self.min_step_points * point
+        emit = np.flatnonzero(improves & (self._hold[lo:hi] <= now))
+        if not len(emit):
+            return [], {}
+        new_sl = np.round((entry[emit] + side[emit] * level[emit]) / point[emit]) * point[emit]
+        tickets, tp, old_sl = self._tickets[lo:hi][emit], self._tp[lo:hi][emit], sl[emit]
+        # Пока запрос в пути, считаем стоп уже перенесённым - повторный тик не шлёт его снова
+        sl[emit] = new_sl
+        changes = [(int(t), float(s), float(p)) for t, s, p in zip(tickets, new_sl, tp)]
+        return changes, dict(zip(tickets.tolist(), old_sl.tolist()))
+
+    def on_tick(self, symbol: str, bid: float, ask: float) -> List[Change]:
+        """Тик символа: изменения стопов (и их отправка через modify, если он задан)"""
+        with self._lock:
+            bounds = self._slices.get(symbol)
+            if bounds is None:
+                return []
+            started = time.perf_counter()
+            changes, previous = self._evaluate(bounds[0], bounds[1], float(bid), float(ask), time.monotonic())
+            self._stats['ticks'] += 1
+            self._stats['evaluated'] += bounds[1] - bounds[0]
+            self._stats['changes'] += len(changes)
+            self._stats['last_eval_us'] = (time.perf_counter() - started) * 1e6
+        if changes and self.modify:
+            self._dispatch(changes, previous)
+        return changes
+
+    def _dispatch(self, changes: List[Change], previous: Dict[int, float]):
+        try:
+            results = self.modify(changes)
+        except Exception as e:
+            results = {ticket: (False, str(e)) for ticket, _, _ in changes}
+        failed = [ticket for ticket, _, _ in changes if not results.get(ticket, (False, ""))[0]]
+        if failed:
+            print(f"--- [TRAILING] Modify failed for {failed}: "
+                  f"{'; '.join(str(results.get(t, (False, '?'))[1]) for t in failed)} ---")
+            # Стоп остался прежним - возвращаем его и повторяем не раньше retry_delay
+            hold_until = time.monotonic() + self.retry_delay
+            with self._lock:
+                self._stats['rejected'] += len(failed)
+                for i in np.flatnonzero(np.isin(self._tickets, failed)):
+                    ticket = int(self._tickets[i])
+                    self._sl[i] = previous[ticket]
+                    self._hold[i] = self._holds[ticket] = hold_until
+
+    # ----- Опрос тиков (без потока событий сервера) -----
+    def _run(self, fetch_tick: Callable[[str], Optional[Dict[str, Any]]], interval: float):
+        while not self._stop.is_set():
+            for symbol in self.symbols:
+                try:
+                    tick = fetch_tick(symbol)
+                    if tick and tick.get("bid") and tick.get("ask"):
+                        self.on_tick(symbol, tick["bid"], tick["ask"])
+                except Exception as e:
+                    print(f"--- [TRAILING] Tick error for {symbol}: {e} ---")
+            self._stop.wait(interval)
+
+    def start(self, fetch_tick: Callable[[str], Optional[Dict[str, Any]]], interval: float = 0.25):
+        """Собственный опрос тиков символов с позициями (повторный вызов ничего не делает)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(fetch_tick, interval),
+                                        name="trailing-stop", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счётчики тиков, проверенных позиций и отправленных изменений"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['positions'] = len(self._tickets)
+            stats['symbols'] = len(self._slices)
+        return stats
@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Потокобезопасный кэш со временем жизни записей и счётчиками попаданий.
+
+    Используется для данных MT5, которые дорого запрашивать (особенно через
+    Flask API): статичные параметры символа живут долго, тики - доли секунды.
+    None не кэшируется, чтобы неудачный запрос повторился при следующем вызове.
+    При превышении max_size вытесняется самая давняя запись.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 1024, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Значение из кэша или default, если записи нет или она устарела"""
+        now = self._clock()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return value
+                del self._data[key]
+                self._stats['expired'] += 1
+            self._stats['misses'] += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Кладёт значение в кэш (ttl переопределяет время жизни по умолчанию)"""
+        if value is None:
+            return
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Значение из кэша, а при промахе - результат loader(), который сохраняется в кэш"""
+        missing = _MISSING
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+        value = loader()
+        self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Удаляет одну запись или, без аргумента, весь кэш (например, после переподключения)"""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+            self._stats['invalidations'] += 1
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счётчики попаданий/промахов и доля попаданий"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._data)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['ttl'] = self.ttl
+        return stats
+
+
+_MISSING = object()